@@ -1,5 +1,12 @@
-from data_manager import load_json
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from repository import get_repository
 from storage import STAFF_FILE
+from utils import verify_password, hash_password, needs_rehash
 
 ADMIN_USER = {
     "email": "admin@hospital.com",
@@ -8,30 +15,80 @@ ADMIN_USER = {
     "name": "System Admin"
 }
 
+# How long a verified (email, password) pair is trusted without re-hashing
+SESSION_CACHE_SECONDS = int(os.getenv("HOSPITAL_AUTH_CACHE_SECONDS", 900))
+SESSION_CACHE_SIZE = 256
+
+_lock = threading.Lock()
+# email -> staff record, rebuilt whenever the staff collection changes
+_credential_index = {"revision": None, "by_email": {}}
+# email -> (stored hash, password fingerprint, expiry)
+_verified_sessions = {}
+# Per-process key, so fingerprints are useless outside this process
+_session_key = secrets.token_bytes(32)
+
+def _credentials(staff_repo):
+    revision = staff_repo.revision()
+    with _lock:
+        if _credential_index["revision"] != revision:
+            _credential_index["by_email"] = {u["email"]: u for u in staff_repo.all() if u.get("email")}
+            _credential_index["revision"] = revision
+            _verified_sessions.clear()
+        return _credential_index["by_email"]
+
+def _fingerprint(password):
+    return hmac.new(_session_key, password.encode(), hashlib.sha256).digest()
+
+def _check_password(user, password):
+    """
+    Verifies against the stored hash, skipping the slow hash for a pair
+    verified recently (e.g. the same login repeated across reruns).
+    """
+    email, stored = user["email"], user.get("password")
+    fingerprint = _fingerprint(password)
+    with _lock:
+        cached = _verified_sessions.get(email)
+    if cached and cached[0] == stored and hmac.compare_digest(cached[1], fingerprint) and cached[2] > time.time():
+        return True
+
+    if not verify_password(password, stored):
+        return False
+
+    with _lock:
+        if len(_verified_sessions) >= SESSION_CACHE_SIZE:
+            _verified_sessions.pop(next(iter(_verified_sessions)))
+        _verified_sessions[email] = (stored, fingerprint, time.time() + SESSION_CACHE_SECONDS)
+    return True
+
+def _public(user):
+    # Never hand the password hash to the session
+    return {k: v for k, v in user.items() if k != "password"}
+
 def login(email, password):
     """
     Authenticates a user against ADMIN_USER or staff.json.
     Returns the user dictionary if successful, else None.
     """
     # Load Staff Data
-    staff_data = load_json(STAFF_FILE)
-    if not staff_data:
+    staff_repo = get_repository(STAFF_FILE)
+    credentials = _credentials(staff_repo)
+    if not credentials:
         # Fallback if file is empty/missing but let's check hardcoded just in case?
         # User requested to load from JSON.
         if email == ADMIN_USER["email"] and password == ADMIN_USER["password"]:
              return ADMIN_USER
         return None
         
-    for user in staff_data:
-        # Safely get email/password in case legacy data exists without it
-        u_email = user.get("email")
-        u_pass = user.get("password")
-        
-        if u_email == email and u_pass == password:
-            return user
+    # O(1) lookup in the email-keyed index
+    user = credentials.get(email)
+    if user and _check_password(user, password):
+        # Upgrade plaintext or outdated-cost hashes now that we know the password
+        if needs_rehash(user.get("password")):
+            staff_repo.update(user["pid"], {"password": hash_password(password)})
+        return _public(user)
     
     # Final fallback for hardcoded admin if NOT in JSON (e.g. before migration)
-    if email == ADMIN_USER["email"] and password == ADMIN_USER["password"]:
+    if user is None and email == ADMIN_USER["email"] and password == ADMIN_USER["password"]:
         return ADMIN_USER
             
     return None
@@ -1,21 +1,399 @@
 import json
 import os
-from storage import ensure_data_dir
+import threading
+from contextlib import contextmanager
+from storage import ensure_data_dir, JOURNAL_COMPACT_BYTES, SEQUENCE_FILE
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking is available
+    fcntl = None
+
+# Per-record version number used for optimistic concurrency control
+VERSION_FIELD = "_version"
+
+class StaleRecordError(Exception):
+    """Raised when a record was changed by another writer since it was read."""
+
+_journal_locks = {}
+_lock_depth = {}
+_compacting = set()
+_registry_lock = threading.Lock()
+
+# Parsed records shared across reruns and sessions:
+# filepath -> (signature, generation, records, {key field: {key: index into records}}).
+# Records handed out by load_json are shared and must be treated as read-only;
+# changes go through save_json / append_mutation, which never modify them in place.
+_cache = {}
+_generations = {}
+_cache_stats = {"hits": 0, "misses": 0}
+
+def _journal_lock(filepath):
+    with _registry_lock:
+        return _journal_locks.setdefault(filepath, threading.RLock())
+
+def journal_path(filepath):
+    return filepath + ".wal"
+
+@contextmanager
+def file_lock(filepath):
+    """
+    Exclusive lock on a data file: a thread lock within this process plus an
+    advisory lock on "<file>.lock" shared by every process using the data
+    directory. Re-entrant for the thread that holds it.
+    """
+    with _journal_lock(filepath):
+        if _lock_depth.get(filepath, 0) or fcntl is None:
+            _lock_depth[filepath] = _lock_depth.get(filepath, 0) + 1
+            try:
+                yield
+            finally:
+                _lock_depth[filepath] -= 1
+            return
+
+        with open(filepath + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _lock_depth[filepath] = 1
+            try:
+                yield
+            finally:
+                _lock_depth[filepath] = 0
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _file_signature(filepath):
+    # (mtime, size) of the snapshot and its journal; changes whenever any process writes either
+    signature = []
+    for path in (filepath, journal_path(filepath)):
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def _cached_records(filepath):
+    # Returns the cached records if they are still current, else None
+    entry = _cache.get(filepath)
+    if entry is None:
+        return None
+    signature, generation, records, _ = entry
+    if generation != _generations.get(filepath, 0) or signature != _file_signature(filepath):
+        return None
+    return records
+
+def _store_in_cache(filepath, records, written=True, positions=None):
+    # Writes bump the file's generation; filling the cache from disk does not
+    if written:
+        _generations[filepath] = _generations.get(filepath, 0) + 1
+    _cache[filepath] = (_file_signature(filepath), _generations.get(filepath, 0), records,
+                        {} if positions is None else positions)
+
+def _index_records(records, key_field):
+    positions = {}
+    for i, record in enumerate(records):
+        if isinstance(record, dict):
+            positions.setdefault(record.get(key_field), i)
+    return positions
+
+def _cached_positions(filepath, records, key_field):
+    # key -> index into the cached `records`, built once per cache entry and
+    # kept current by append_mutation
+    entry = _cache.get(filepath)
+    if entry is None or entry[2] is not records:
+        return _index_records(records, key_field)
+    positions = entry[3]
+    if key_field not in positions:
+        positions[key_field] = _index_records(records, key_field)
+    return positions[key_field]
+
+def file_revision(filepath):
+    """
+    Returns a token that changes whenever the file's records change, in this
+    process or any other. Lets derived indexes know when to rebuild.
+    """
+    return _file_signature(filepath), _generations.get(filepath, 0)
+
+def cache_stats():
+    """
+    Returns hit/miss counters of the shared record cache.
+    """
+    with _registry_lock:
+        return dict(_cache_stats, entries=len(_cache))
+
+def clear_cache():
+    with _registry_lock:
+        _cache.clear()
 
 def load_json(filepath):
-    ensure_data_dir()
-    try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    return list(_load_shared(filepath))
+
+def _load_shared(filepath):
+    # The cached records themselves, not a copy: callers must not modify them
+    with _journal_lock(filepath):
+        records = _cached_records(filepath)
+        with _registry_lock:
+            _cache_stats["hits" if records is not None else "misses"] += 1
+        if records is not None:
+            return records
+
+    # Read under the file lock so a concurrent compaction can't split snapshot and journal
+    with file_lock(filepath):
+        ensure_data_dir()
+        try:
+            with open(filepath, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = []
+
+        # Replay mutations journaled since the last snapshot
+        replay_mutations(data, read_log(journal_path(filepath)))
+
+        _store_in_cache(filepath, data, written=False)
+        return data
 
 def save_json(filepath, data):
     ensure_data_dir()
     try:
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=4)
+        with file_lock(filepath):
+            _write_atomic(filepath, data)
+            # The snapshot now contains everything, so the journal is obsolete
+            if os.path.exists(journal_path(filepath)):
+                os.remove(journal_path(filepath))
+            _store_in_cache(filepath, list(data))
         return True
     except Exception as e:
         print(f"Error saving to {filepath}: {e}")
         return False
+
+def _write_atomic(filepath, data):
+    # Write to a temporary file and rename, so readers never see a half-written file
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+def append_log(path, *entries):
+    """
+    Appends JSON entries as lines to a log file and syncs it to disk once.
+    """
+    with open(path, 'a+b') as f:
+        # Terminate a line left partial by a crash so the new entry stays parseable
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.write(b"".join(json.dumps(entry).encode() + b"\n" for entry in entries))
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_log(path, offset=0):
+    """
+    Returns the entries of a log file from byte `offset` on, skipping lines
+    torn by an interrupted write.
+    """
+    entries = []
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+_DELETED = object()
+
+def replay_mutations(records, mutations, positions=None):
+    """
+    Applies journaled mutations to a list of records in place, in one pass:
+    records are found through a {key: index} map per key field, built once
+    (or passed in as `positions` and kept current), and deleted records are
+    dropped at the end. Mutations are idempotent so a log can safely be
+    replayed over a newer snapshot.
+    """
+    positions = {} if positions is None else positions
+    deleted = False
+    for mutation in mutations:
+        key_field, key = mutation["key_field"], mutation["key"]
+        if key_field not in positions:
+            positions[key_field] = _index_records(records, key_field)
+        index = positions[key_field].get(key)
+        op = mutation["op"]
+
+        if op == "insert":
+            if index is None:
+                positions[key_field][key] = len(records)
+                records.append(mutation["record"])
+            else:
+                records[index] = mutation["record"]
+        elif op == "update":
+            if index is not None:
+                records[index] = {**records[index], **mutation["changes"]}
+        elif op == "delete":
+            if index is not None:
+                records[index] = _DELETED
+                del positions[key_field][key]
+                deleted = True
+
+    if deleted:
+        records[:] = [r for r in records if r is not _DELETED]
+        positions.clear()  # later records shifted down
+    return records
+
+def apply_mutation(records, mutation):
+    """Applies a single journaled mutation to a list of records in place."""
+    return replay_mutations(records, [mutation])
+
+def append_mutation(filepath, *mutations):
+    """
+    Journaled write: records inserts/updates/deletes in "<file>.wal"
+    instead of rewriting the whole file. The log is compacted in the
+    background once it grows past JOURNAL_COMPACT_BYTES.
+    """
+    ensure_data_dir()
+    path = journal_path(filepath)
+    try:
+        with file_lock(filepath):
+            records = _cached_records(filepath)
+            append_log(path, *mutations)
+            size = os.path.getsize(path)
+            # Keep a current cache entry (and its key maps) current instead of re-reading the file
+            if records is not None:
+                positions = _cache[filepath][3]
+                replay_mutations(records, mutations, positions)
+                _store_in_cache(filepath, records, positions=positions)
+            else:
+                _cache.pop(filepath, None)
+    except Exception as e:
+        print(f"Error journaling to {path}: {e}")
+        return False
+
+    if size > JOURNAL_COMPACT_BYTES:
+        with _registry_lock:
+            if filepath in _compacting:
+                return True
+            _compacting.add(filepath)
+        threading.Thread(target=_compact_in_background, args=(filepath,), daemon=True).start()
+    return True
+
+def compact_journal(filepath):
+    """
+    Folds the journal into a fresh snapshot of the data file and removes it.
+    """
+    with file_lock(filepath):
+        return save_json(filepath, load_json(filepath))
+
+def _compact_in_background(filepath):
+    try:
+        compact_journal(filepath)
+    finally:
+        with _registry_lock:
+            _compacting.discard(filepath)
+
+class Transaction:
+    """
+    A batch of record changes to one data file, made while holding its file lock.
+    Every insert/update bumps the record's version; passing `expected_version`
+    makes a change fail with StaleRecordError if someone else got there first.
+
+    Reads go to the shared cached records through the cache's key map, and
+    changes are staged by key, so in journaled mode a write costs the size of
+    the change (once the file is cached). Without the journal, commit copies
+    the records to rewrite the file.
+    """
+    def __init__(self, filepath, key_field, journaled=False):
+        self.filepath = filepath
+        self.key_field = key_field
+        self.journaled = journaled
+        self._records = _load_shared(filepath)  # shared; never modified here
+        self._positions = None  # key -> index into _records, looked up on first use
+        self._staged = {}  # key -> record as changed here, None once deleted
+        self._mutations = []
+
+    def _check_version(self, record, expected_version):
+        if expected_version is not None and record.get(VERSION_FIELD, 0) != expected_version:
+            raise StaleRecordError(f"{self.key_field} {record[self.key_field]} was modified by another user")
+
+    def get(self, key):
+        if key in self._staged:
+            return self._staged[key]
+        if self._positions is None:
+            self._positions = _cached_positions(self.filepath, self._records, self.key_field)
+        index = self._positions.get(key)
+        return None if index is None else self._records[index]
+
+    def _stage(self, key, record, mutation):
+        self._staged[key] = record
+        self._mutations.append(dict(mutation, key_field=self.key_field, key=key))
+
+    def insert(self, record):
+        key = record[self.key_field]
+        if self.get(key) is not None:
+            raise ValueError(f"Duplicate {self.key_field}: {key}")
+        record = {**record, VERSION_FIELD: 1}
+        self._stage(key, record, {"op": "insert", "record": record})
+        return record
+
+    def update(self, key, changes, expected_version=None):
+        current = self.get(key)
+        if current is None:
+            return None
+        self._check_version(current, expected_version)
+        changes = {**changes, VERSION_FIELD: current.get(VERSION_FIELD, 0) + 1}
+        record = {**current, **changes}
+        self._stage(key, record, {"op": "update", "changes": changes})
+        return record
+
+    def delete(self, key, expected_version=None):
+        current = self.get(key)
+        if current is None:
+            return False
+        self._check_version(current, expected_version)
+        self._stage(key, None, {"op": "delete"})
+        return True
+
+    def commit(self):
+        if not self._mutations:
+            return True
+        if self.journaled:
+            return append_mutation(self.filepath, *self._mutations)
+        return save_json(self.filepath, replay_mutations(list(self._records), self._mutations))
+
+@contextmanager
+def transaction(filepath, key_field, journaled=False):
+    """
+    Locks a data file, yields a Transaction over its current records and
+    commits the changes (atomically) when the block exits without error.
+
+        with transaction(PATIENT_FILE, "pid") as tx:
+            tx.update(101, {"current_status": "ADMITTED"}, expected_version=3)
+    """
+    with file_lock(filepath):
+        tx = Transaction(filepath, key_field, journaled)
+        yield tx
+        if not tx.commit():
+            raise IOError(f"Could not write {filepath}")
+
+def allocate_ids(name, count=1, start=1, sequence_file=SEQUENCE_FILE):
+    """
+    Reserves `count` consecutive ids from the persisted sequence `name` and
+    returns them as a range. Ids are never handed out twice, even across
+    processes or after records are deleted. `start` (a value or a callable)
+    gives the first id when the sequence does not exist yet.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+    with transaction(sequence_file, "name") as tx:
+        sequence = tx.get(name)
+        if sequence is None:
+            first = start() if callable(start) else start
+            tx.insert({"name": name, "next_id": first + count})
+        else:
+            first = sequence["next_id"]
+            tx.update(name, {"next_id": first + count})
+    return range(first, first + count)
@@ -1,5 +1,6 @@
-from data_manager import load_json, save_json
+from repository import get_repository
 from storage import STAFF_FILE, ensure_data_dir
+from utils import hash_password
 
 def initialize_admin():
     """
@@ -8,11 +9,11 @@ def initialize_admin():
     # Ensure directory exists first
     ensure_data_dir()
     
-    staff_data = load_json(STAFF_FILE)
+    staff_repo = get_repository(STAFF_FILE)
     
     # Check if admin exists
     admin_email = "admin@hospital.com"
-    if any(u.get('email') == admin_email for u in staff_data):
+    if staff_repo.find(email=admin_email):
         print("Admin user already exists.")
         return
 
@@ -24,12 +25,11 @@ def initialize_admin():
         "contact": "N/A",
         "role": "Admin",
         "email": admin_email,
-        "password": "admin123", # Default
+        "password": hash_password("admin123"), # Default
         "shift_timing": "N/A"
     }
     
-    staff_data.append(admin_user)
-    save_json(STAFF_FILE, staff_data)
+    staff_repo.insert(admin_user)
     print("Admin user migrated successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from data_manager import load_json, save_json
+from storage import AI_CACHE_FILE
+
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", 500))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+# Changes made within this many seconds are written to disk together (0 writes on every put)
+AI_CACHE_SAVE_SECONDS = float(os.getenv("AI_CACHE_SAVE_SECONDS", 2))
+
+def normalize_symptoms(symptoms):
+    """
+    Canonical form of a free-text symptom list: lower case, punctuation and
+    extra whitespace removed, items de-duplicated and sorted, so that
+    "Fever, cough." and "cough,fever" are the same consultation.
+    """
+    items = re.split(r"[,;\n]+", (symptoms or "").lower())
+    items = {" ".join(re.sub(r"[^\w\s]", " ", item).split()) for item in items}
+    return ", ".join(sorted(i for i in items if i))
+
+def make_key(symptoms, patient_history):
+    payload = json.dumps([normalize_symptoms(symptoms), patient_history or []],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of AI responses with a time-to-live, persisted
+    to a JSON file so it survives restarts. Puts only mark the cache dirty;
+    the file is rewritten once per `save_seconds` (or on flush()), so a
+    burst of answers costs one write instead of one per answer.
+    """
+    def __init__(self, filepath=AI_CACHE_FILE, max_entries=AI_CACHE_MAX_ENTRIES, ttl_seconds=AI_CACHE_TTL_SECONDS,
+                 save_seconds=AI_CACHE_SAVE_SECONDS):
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.save_seconds = save_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+
+        # key -> {"created": ts, "response": {...}}, least recently used first
+        self._entries = OrderedDict()
+        now = time.time()
+        for entry in load_json(filepath):
+            if isinstance(entry, dict) and now - entry.get("created", 0) < ttl_seconds:
+                self._entries[entry["key"]] = entry
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created"] >= self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry["response"])
+
+    def put(self, key, response):
+        self.put_many({key: response})
+
+    def put_many(self, responses):
+        """Stores {key: response} for several answers with a single save."""
+        if not responses:
+            return
+        with self._lock:
+            now = time.time()
+            for key, response in responses.items():
+                self._entries[key] = {"key": key, "created": now, "response": response}
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            if self.save_seconds <= 0:
+                self._save()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.save_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Writes unsaved changes to disk now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        # Called with self._lock held, so saves never interleave or go out of order
+        save_json(self.filepath, list(self._entries.values()))
+        self._dirty = False
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def get_response_cache():
+    """Returns the process-wide response cache."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+            atexit.register(_shared_cache.flush)
+        return _shared_cache
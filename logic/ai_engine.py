@@ -1,64 +1,480 @@
-import google.generativeai as genai
 import os
+import hashlib
 import json
-from dotenv import load_dotenv
+import random
+import re
+import threading
+import time
+from data_manager import load_json, save_json
+from logic.ai_cache import get_response_cache, make_key
+from logic.ai_jobs import get_job_queue
+from logic.history import AI_HISTORY_TOKEN_BUDGET, compact_history
+from logic.json_stream import JSONObjectStream
+from storage import AI_REPLAY_FILE
 
-# Load environment variables
-load_dotenv()
+DISCLAIMER = "⚠️ AI SUGGESTION ONLY. Doctor must verify before approval."
+
+AI_MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-flash-latest")
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", 30))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", 2))
+AI_BACKOFF_SECONDS = float(os.getenv("AI_BACKOFF_SECONDS", 1.0))
+# How long an offline client waits before trying to connect again
+AI_RECONNECT_SECONDS = float(os.getenv("AI_RECONNECT_SECONDS", 60))
+
+# Model backend used by MedicalAI:
+#   "gemini" - the hosted Gemini API (default)
+#   "replay" - local stand-in answering from AI_REPLAY_FILE, no network needed
+#   "record" - Gemini, saving every answer to AI_REPLAY_FILE for later replay
+AI_BACKEND = os.getenv("MEDICAL_AI_BACKEND", "gemini").lower()
+# Latency and failure profile of the replay backend
+AI_REPLAY_LATENCY_SECONDS = float(os.getenv("AI_REPLAY_LATENCY_SECONDS", 0.0))
+AI_REPLAY_CHUNK_SECONDS = float(os.getenv("AI_REPLAY_CHUNK_SECONDS", 0.0))
+AI_REPLAY_FAILURE_RATE = float(os.getenv("AI_REPLAY_FAILURE_RATE", 0.0))
+AI_REPLAY_SEED = int(os.getenv("AI_REPLAY_SEED", 0))
+
+class ModelBackend:
+    """
+    What MedicalAI needs from a model: connect once, then generate a full
+    answer or stream it as text chunks. Errors are raised, never swallowed,
+    so MedicalAI's retry and health tracking behave the same for every backend.
+    """
+    name = "base"
+
+    def connect(self):
+        pass
+
+    def ping(self, timeout):
+        pass
+
+    def generate(self, prompt, timeout):
+        raise NotImplementedError
+
+    def stream(self, prompt, timeout):
+        yield self.generate(prompt, timeout)
+
+class GeminiBackend(ModelBackend):
+    name = "gemini"
+
+    def __init__(self, model_name=AI_MODEL_NAME):
+        self.model_name = model_name
+        self.model = None
+
+    def connect(self):
+        # Imported here so app startup (and non-doctor sessions) never pay for the SDK
+        import google.generativeai as genai
+        from dotenv import load_dotenv
+
+        # Load environment variables
+        load_dotenv()
+
+        # Configure the API
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+
+        genai.configure(api_key=api_key)
+
+        # Initialize the model
+        self.model = genai.GenerativeModel(self.model_name)
+
+    def ping(self, timeout):
+        self.model.count_tokens("ping", request_options={"timeout": timeout})
+
+    def generate(self, prompt, timeout):
+        return self.model.generate_content(prompt, request_options={"timeout": timeout}).text
+
+    def stream(self, prompt, timeout):
+        for chunk in self.model.generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+            yield chunk.text
+
+def prompt_key(prompt):
+    # Indentation of the prompt templates is not significant
+    return hashlib.sha256(" ".join(prompt.split()).encode()).hexdigest()
+
+class ReplayBackend(ModelBackend):
+    """
+    Local stand-in for the hosted model. Prompts recorded in `filepath` are
+    answered with the recorded text; any other prompt gets a deterministic
+    synthetic answer in the requested JSON shape. Latency (before the first
+    chunk and between chunks) and a failure rate can be injected; failures
+    are drawn from a seeded generator, so a run is reproducible.
+    """
+    name = "replay"
+
+    def __init__(self, filepath=AI_REPLAY_FILE, latency=AI_REPLAY_LATENCY_SECONDS,
+                 chunk_delay=AI_REPLAY_CHUNK_SECONDS, failure_rate=AI_REPLAY_FAILURE_RATE,
+                 seed=AI_REPLAY_SEED, chunk_size=32):
+        self.filepath = filepath
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.failure_rate = failure_rate
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.replayed = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recordings = {}
+
+    def connect(self):
+        self._recordings = {r["key"]: r["response"] for r in load_json(self.filepath) if isinstance(r, dict)}
+
+    def _answer(self, prompt, timeout):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        if self.latency > timeout:
+            raise TimeoutError(f"Replay backend exceeded the {timeout}s timeout")
+        if fail:
+            raise ConnectionError("Injected replay backend failure")
+
+        recorded = self._recordings.get(prompt_key(prompt))
+        if recorded is not None:
+            with self._lock:
+                self.replayed += 1
+            return recorded
+        return synthetic_answer(prompt)
+
+    def generate(self, prompt, timeout):
+        return self._answer(prompt, timeout)
+
+    def stream(self, prompt, timeout):
+        text = self._answer(prompt, timeout)
+        for i in range(0, len(text), self.chunk_size):
+            if i and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield text[i:i + self.chunk_size]
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "replayed": self.replayed, "failures": self.failures,
+                    "recordings": len(self._recordings)}
+
+class RecordingBackend(ModelBackend):
+    """
+    Wraps another backend and saves each complete answer to `filepath`
+    keyed by prompt, building the recordings ReplayBackend serves.
+    """
+    def __init__(self, inner, filepath=AI_REPLAY_FILE):
+        self.inner = inner
+        self.name = f"record:{inner.name}"
+        self.filepath = filepath
+        self._lock = threading.Lock()
+
+    def connect(self):
+        self.inner.connect()
+
+    def ping(self, timeout):
+        self.inner.ping(timeout)
+
+    def _record(self, prompt, text):
+        key = prompt_key(prompt)
+        with self._lock:
+            records = [r for r in load_json(self.filepath) if r.get("key") != key]
+            records.append({"key": key, "recorded_at": time.time(), "response": text})
+            save_json(self.filepath, records)
+
+    def generate(self, prompt, timeout):
+        text = self.inner.generate(prompt, timeout)
+        self._record(prompt, text)
+        return text
+
+    def stream(self, prompt, timeout):
+        chunks = []
+        for chunk in self.inner.stream(prompt, timeout):
+            chunks.append(chunk)
+            yield chunk
+        self._record(prompt, "".join(chunks))
+
+def synthetic_answer(prompt):
+    """
+    A well-formed answer derived only from the prompt text, so the same
+    prompt always gets the same answer. Batch prompts get one entry per id.
+    """
+    digest = prompt_key(prompt)
+
+    def assessment(seed):
+        return {
+            "risk_level": ("Low", "Medium", "High")[int(seed[:2], 16) % 3],
+            "diagnosis": f"Stand-in assessment {seed[:8]}",
+            "treatment_plan": "Synthetic plan from the replay backend. Not medical advice.",
+            "suggested_rx": [],
+            "resources": [],
+        }
+
+    ids = re.findall(r"- id (\S+?):", prompt)
+    if ids:
+        return json.dumps([{"id": case_id, **assessment(hashlib.sha256((digest + case_id).encode()).hexdigest())}
+                           for case_id in ids])
+    return json.dumps(assessment(digest))
+
+def make_backend(name=AI_BACKEND):
+    if name == "replay":
+        return ReplayBackend()
+    if name == "record":
+        return RecordingBackend(GeminiBackend())
+    if name == "gemini":
+        return GeminiBackend()
+    raise ValueError(f"Unknown AI backend: {name}")
 
 class MedicalAI:
-    def __init__(self):
+    def __init__(self, timeout=AI_TIMEOUT_SECONDS, max_retries=AI_MAX_RETRIES, backoff=AI_BACKOFF_SECONDS,
+                 backend=None):
+        self.backend = backend or make_backend()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = get_response_cache()
+        self.available = False
+        self.health = {
+            "status": "starting",
+            "last_error": None,
+            "last_success": None,
+            "consecutive_failures": 0,
+            "connected_at": None,
+            "backend": self.backend.name,
+        }
+        self._health_lock = threading.Lock()
+        self.connect()
+
+    def connect(self):
         try:
-            # Configure the API
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY not found in environment variables")
-                
-            genai.configure(api_key=api_key)
-            
-            # Initialize the model
-            self.model = genai.GenerativeModel('gemini-flash-latest')
+            self.backend.connect()
             self.available = True
+            self._set_health("ready", connected_at=time.time())
         except Exception as e:
             print(f"AI Module failed to initialize: {e}")
             self.available = False
+            self._set_health("offline", last_error=str(e), connected_at=time.time())
 
-    def predict_treatment(self, symptoms, patient_history):
+    def warm_up(self):
+        """
+        Makes one cheap round trip to the API so the first consultation
+        does not also pay for connection setup.
+        """
+        if not self.available:
+            return False
+        try:
+            self.backend.ping(self.timeout)
+            self._record_success()
+            return True
+        except Exception as e:
+            self._record_failure(e)
+            return False
+
+    def _set_health(self, status, **fields):
+        with self._health_lock:
+            self.health.update(fields, status=status)
+
+    def _record_success(self):
+        self._set_health("ready", last_success=time.time(), consecutive_failures=0)
+
+    def _record_failure(self, error):
+        with self._health_lock:
+            failures = self.health["consecutive_failures"] + 1
+        self._set_health("degraded", last_error=str(error), consecutive_failures=failures)
+
+    def _generate(self, prompt):
+        # Retries transient failures with exponential backoff: 1s, 2s, 4s, ...
+        for attempt in range(self.max_retries + 1):
+            try:
+                text = self.backend.generate(prompt, self.timeout)
+                self._record_success()
+                return text
+            except Exception as e:
+                self._record_failure(e)
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def predict_treatment(self, symptoms, patient_history, use_cache=True, patient_id=None):
+        """
+        Returns the model's assessment as a dict. Identical (after normalization)
+        symptoms and history are answered from the response cache unless
+        use_cache is False, in which case the model is always asked.
+        Passing patient_id lets the history summary be reused across calls.
+        """
         if not self.available:
             return {"error": "AI System Offline", "risk_level": "Unknown"}
 
+        cache_key = make_key(symptoms, patient_history)
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached["from_cache"] = True
+                return cached
+
+        prompt = self._build_prompt(symptoms, patient_history, patient_id)
+
+        try:
+            ai_data = self._parse_json(self._generate(prompt))
+            ai_data["disclaimer"] = DISCLAIMER
+            # Fallback responses are never cached, only real answers
+            self.cache.put(cache_key, ai_data)
+            return ai_data
+
+        except Exception as e:
+            print(f"Prediction Error: {e}")
+            return self._fallback_response()
+
+    def predict_treatment_batch(self, cases):
+        """
+        Assesses several patients in one model request. `cases` is a list of
+        (case_id, symptoms, patient_history); returns {case_id: result} for every
+        case the model answered with a usable entry. Cases missing from the
+        answer (or all of them, if the request fails) are left to the caller.
+        """
+        if not self.available or not cases:
+            return {}
+
+        # Each case gets a share of the single-patient history budget
+        per_case_budget = max(AI_HISTORY_TOKEN_BUDGET // 4, 100)
+        case_text = "\n".join(
+            f"- id {case_id}: symptoms: {symptoms}; history: {compact_history(history, case_id, per_case_budget)}"
+            for case_id, symptoms, history in cases
+        )
         prompt = f"""
+        Act as a Senior Medical Assistant triaging several patients.
+        {case_text}
+
+        Output MUST be strictly valid JSON with no markdown formatting: a list
+        with one object per patient, each with the fields:
+        - id (the patient id given above)
+        - risk_level (string: "Low", "Medium", "High")
+        - diagnosis (string)
+        - treatment_plan (string)
+        - suggested_rx (list of strings)
+        - resources (list of strings, e.g., "Oxygen", "Bed")
+        """
+
+        try:
+            answers = self._parse_json(self._generate(prompt))
+        except Exception as e:
+            print(f"Batch Prediction Error: {e}")
+            return {}
+
+        wanted = {str(case_id): case_id for case_id, _, _ in cases}
+        results = {}
+        for answer in answers if isinstance(answers, list) else []:
+            if not isinstance(answer, dict) or str(answer.get("id")) not in wanted:
+                continue
+            if "risk_level" not in answer or "diagnosis" not in answer:
+                continue
+            case_id = wanted[str(answer.pop("id"))]
+            results[case_id] = dict(answer, disclaimer=DISCLAIMER)
+        return results
+
+    def _parse_json(self, text_response):
+        # Clean possible markdown backticks
+        if "```json" in text_response:
+            text_response = text_response.replace("```json", "").replace("```", "")
+        elif "```" in text_response:
+             text_response = text_response.replace("```", "")
+
+        return json.loads(text_response.strip())
+
+    def predict_treatment_stream(self, symptoms, patient_history, use_cache=True, patient_id=None):
+        """
+        Streaming variant of predict_treatment: yields (field, value) pairs as
+        soon as each top-level field of the model's JSON answer is complete.
+        Risk level and diagnosis are requested first so they arrive early.
+        If the request fails before any field was yielded, the fallback
+        response's fields are yielded instead; if it fails part-way, the fields
+        already shown are kept and an "error" field is yielded after them.
+        """
+        if not self.available:
+            yield from {"error": "AI System Offline", "risk_level": "Unknown"}.items()
+            return
+
+        cache_key = make_key(symptoms, patient_history)
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield from cached.items()
+                yield "from_cache", True
+                return
+
+        prompt = self._build_prompt(symptoms, patient_history, patient_id)
+        parser = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                # A fresh parser per attempt: a dropped stream leaves half a member buffered
+                parser = JSONObjectStream()
+                try:
+                    for chunk in self.backend.stream(prompt, self.timeout):
+                        yield from parser.feed(chunk).items()
+                    self._record_success()
+                    break
+                except Exception as e:
+                    self._record_failure(e)
+                    # Only retry while nothing has been shown to the caller yet
+                    if parser.fields or attempt == self.max_retries:
+                        raise
+                    time.sleep(self.backoff * 2 ** attempt)
+
+            if not parser.done:
+                raise ValueError("Incomplete JSON in model response")
+        except Exception as e:
+            print(f"Prediction Error: {e}")
+            if parser is not None and parser.fields:
+                # Don't overwrite fields the caller already has with the fallback's
+                yield "error", f"Response interrupted: {e}"
+            else:
+                yield from self._fallback_response().items()
+            return
+
+        ai_data = dict(parser.fields, disclaimer=DISCLAIMER)
+        self.cache.put(cache_key, ai_data)
+        yield "disclaimer", DISCLAIMER
+
+    def _build_prompt(self, symptoms, patient_history, patient_id=None):
+        # Older visits are summarized so the prompt stays within AI_HISTORY_TOKEN_BUDGET
+        history = compact_history(patient_history, patient_id)
+        return f"""
         Act as a Senior Medical Assistant.
         Analyze these symptoms: {symptoms}
-        Patient History: {patient_history}
+        Patient History:
+        {history}
 
         Provide a diagnosis and treatment plan.
         Output MUST be strictly valid JSON with no markdown formatting.
-        Required fields:
+        Required fields, in this order:
+        - risk_level (string: "Low", "Medium", "High")
         - diagnosis (string)
         - treatment_plan (string)
         - suggested_rx (list of strings)
         - resources (list of strings, e.g., "Oxygen", "Bed")
-        - risk_level (string: "Low", "Medium", "High")
         """
 
-        try:
-            response = self.model.generate_content(prompt)
-            text_response = response.text
-            
-            # Clean possible markdown backticks
-            if "```json" in text_response:
-                text_response = text_response.replace("```json", "").replace("```", "")
-            elif "```" in text_response:
-                 text_response = text_response.replace("```", "")
-            
-            ai_data = json.loads(text_response.strip())
-            ai_data["disclaimer"] = "⚠️ AI SUGGESTION ONLY. Doctor must verify before approval."
-            return ai_data
-            
-        except Exception as e:
-            print(f"Prediction Error: {e}")
-            return self._fallback_response()
+    def submit_consultation(self, symptoms, patient_history, use_cache=True, patient_id=None):
+        """
+        Queues predict_treatment on the shared worker pool and returns a job id
+        right away. Poll job_status / job_result or iterate stream_job for output.
+        """
+        return get_job_queue().submit(self._run_consultation, symptoms, patient_history,
+                                      use_cache=use_cache, patient_id=patient_id)
+
+    def _run_consultation(self, symptoms, patient_history, use_cache=True, patient_id=None, on_partial=None):
+        # Streams so the job's partial result fills in field by field
+        result = {}
+        for field, value in self.predict_treatment_stream(symptoms, patient_history, use_cache, patient_id):
+            result[field] = value
+            if on_partial:
+                on_partial({field: value})
+        return result
+
+    def job_status(self, job_id):
+        return get_job_queue().status(job_id)
+
+    def job_result(self, job_id, timeout=None):
+        return get_job_queue().result(job_id, timeout)
+
+    def stream_job(self, job_id):
+        return get_job_queue().stream(job_id)
 
     def _fallback_response(self):
         return {
@@ -67,5 +483,63 @@ class MedicalAI:
             "suggested_rx": [],
             "resources": [],
             "risk_level": "Unknown",
-            "disclaimer": "⚠️ AI SUGGESTION ONLY. Doctor must verify before approval."
+            "disclaimer": DISCLAIMER
         }
+
+_client = None
+_client_lock = threading.Lock()  # guards _client; held only to read or publish it
+_connect_lock = threading.Lock()  # one thread builds or reconnects the client at a time
+_warm_up_started = False
+
+def get_medical_ai():
+    """
+    Returns the process-wide MedicalAI client, creating it on first use.
+    An offline client retries its connection every AI_RECONNECT_SECONDS.
+    Connecting happens outside _client_lock, so ai_health() never waits on it.
+    """
+    global _client
+    with _client_lock:
+        client = _client
+    if client is not None:
+        if client.available or time.time() - client.health["connected_at"] <= AI_RECONNECT_SECONDS:
+            return client
+        # Someone else is already reconnecting: use the offline client meanwhile
+        if not _connect_lock.acquire(blocking=False):
+            return client
+        try:
+            if not client.available and time.time() - client.health["connected_at"] > AI_RECONNECT_SECONDS:
+                client.connect()
+        finally:
+            _connect_lock.release()
+        return client
+
+    with _connect_lock:
+        with _client_lock:
+            client = _client
+        if client is None:
+            client = MedicalAI()
+            with _client_lock:
+                _client = client
+        return client
+
+def start_warm_up():
+    """
+    Creates and warms up the shared client on a background thread, so a
+    doctor's first consultation finds it ready. Only the first call starts
+    the thread.
+    """
+    global _warm_up_started
+    with _client_lock:
+        if _client is not None or _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=lambda: get_medical_ai().warm_up(), daemon=True).start()
+
+def ai_health():
+    """
+    Health of the shared client without creating it (and importing the SDK).
+    """
+    with _client_lock:
+        if _client is None:
+            return {"status": "not started"}
+        return dict(_client.health)
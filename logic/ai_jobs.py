@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bound on model calls running at once, across all sessions of this process
+AI_MAX_CONCURRENT_CALLS = int(os.getenv("AI_MAX_CONCURRENT_CALLS", 4))
+# Finished jobs are forgotten after this long
+AI_JOB_RETENTION_SECONDS = int(os.getenv("AI_JOB_RETENTION_SECONDS", 3600))
+
+class AIJobQueue:
+    """
+    Runs AI calls on a bounded worker pool. Each submitted call becomes a job
+    whose status, partial output and final result can be polled or streamed.
+    """
+    def __init__(self, max_workers=AI_MAX_CONCURRENT_CALLS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues `fn(*args, on_partial=callback, **kwargs)` and returns the job id.
+        `fn` may call on_partial(fields) to publish output before it finishes.
+        """
+        self._prune()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "partial": {},
+                "result": None,
+                "error": None,
+                "submitted_at": time.time(),
+                "finished_at": None,
+            }
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _update(self, job_id, **fields):
+        with self._changed:
+            self._jobs[job_id].update(fields)
+            self._changed.notify_all()
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status="running")
+
+        def on_partial(fields):
+            with self._changed:
+                self._jobs[job_id]["partial"] = {**self._jobs[job_id]["partial"], **fields}
+                self._changed.notify_all()
+
+        try:
+            result = fn(*args, on_partial=on_partial, **kwargs)
+            partial = dict(result) if isinstance(result, dict) else {}
+            self._update(job_id, status="done", result=result, partial=partial, finished_at=time.time())
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    def status(self, job_id):
+        """Returns a snapshot of the job, or None if it is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else {**job, "partial": dict(job["partial"])}
+
+    def result(self, job_id, timeout=None):
+        """Blocks until the job finishes and returns its snapshot."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while job_id in self._jobs and self._jobs[job_id]["finished_at"] is None:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return self.status(job_id)
+
+    def stream(self, job_id, poll_seconds=0.5):
+        """Yields a snapshot each time the job changes, ending with the finished job."""
+        last = None
+        while True:
+            job = self.status(job_id)
+            if job is None:
+                return
+            if job != last:
+                yield job
+                last = job
+            if job["finished_at"] is not None:
+                return
+            with self._changed:
+                self._changed.wait(poll_seconds)
+
+    def _prune(self):
+        cutoff = time.time() - AI_JOB_RETENTION_SECONDS
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items()
+                           if job["finished_at"] is not None and job["finished_at"] < cutoff]:
+                del self._jobs[job_id]
+
+_shared_queue = None
+_shared_lock = threading.Lock()
+
+def get_job_queue():
+    """Returns the process-wide AI job queue."""
+    global _shared_queue
+    with _shared_lock:
+        if _shared_queue is None:
+            _shared_queue = AIJobQueue()
+        return _shared_queue
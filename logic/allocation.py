@@ -0,0 +1,85 @@
+import numpy as np
+from logic.bag_ledger import BLOOD_GROUPS
+
+# Red cell antigens (A, B, Rh D) carried by each group, in BLOOD_GROUPS order
+ANTIGENS = np.array([["A" in g, "B" in g, g.endswith("+")]
+                     for g in BLOOD_GROUPS])
+
+# COMPATIBLE[recipient, donor]: the donor's red cells carry no antigen the recipient lacks
+COMPATIBLE = ~(ANTIGENS[None, :, :] & ~ANTIGENS[:, None, :]).any(axis=2)
+
+# How many groups each donor group can serve; O- (universal donor) serves all eight
+DONOR_REACH = COMPATIBLE.sum(axis=0)
+
+def _preference_order():
+    # Per recipient: its own group first, then compatible donors from the most
+    # to the least restricted, so widely usable groups (O- last) are kept back
+    orders = []
+    for recipient in range(len(BLOOD_GROUPS)):
+        donors = [d for d in np.flatnonzero(COMPATIBLE[recipient]) if d != recipient]
+        donors.sort(key=lambda d: (DONOR_REACH[d], d))
+        orders.append(np.array([recipient] + donors))
+    return orders
+
+PREFERENCE = _preference_order()
+
+def compatible_donors(recipient_group):
+    """Donor groups a recipient can receive, in the order they are used."""
+    return [BLOOD_GROUPS[d] for d in PREFERENCE[BLOOD_GROUPS.index(recipient_group)]]
+
+def allocate(stock, requests, allow_partial=False):
+    """
+    Plans how to serve transfusion requests from the given stock (units per
+    group, in BLOOD_GROUPS order). `requests` is a list of
+    (request_id, recipient_group, units).
+
+    Requests with the fewest compatible units available are served first, so
+    an O- patient isn't left without stock because an AB+ patient took it.
+    A request that can't be served in full gets nothing unless allow_partial.
+
+    Returns a dict with "allocations" ({request_id: {donor_group: units}}),
+    "shortfall" ({request_id: units missing}) and "issue" ({donor_group: total
+    units to take from stock}).
+    """
+    remaining = np.asarray(stock, dtype=np.int64).copy()
+    recipients = np.array([BLOOD_GROUPS.index(group) for _, group, _ in requests], dtype=np.int64)
+    # Compatible units available to each request, all requests at once
+    supply = COMPATIBLE[recipients].astype(np.int64) @ remaining if len(requests) else np.array([])
+
+    allocations, shortfall = {}, {}
+    for i in np.argsort(supply, kind="stable"):
+        request_id, _, units = requests[i]
+        order = PREFERENCE[recipients[i]]
+        available = remaining[order]
+        # Take from each donor in preference order until the request is covered
+        before = np.cumsum(available) - available
+        take = np.clip(units - before, 0, available)
+        served = int(take.sum())
+
+        if served < units:
+            shortfall[request_id] = units - served
+            if not allow_partial:
+                continue
+        remaining[order] -= take
+        allocations[request_id] = {BLOOD_GROUPS[d]: int(n) for d, n in zip(order, take) if n}
+
+    used = np.asarray(stock, dtype=np.int64) - remaining
+    return {
+        "allocations": allocations,
+        "shortfall": shortfall,
+        "issue": {group: int(n) for group, n in zip(BLOOD_GROUPS, used) if n},
+    }
+
+def fulfil_requests(inventory, requests, user=None, allow_partial=False):
+    """
+    Plans the requests against the current stock of a BloodInventory and
+    issues every allocated unit in one atomic update. Returns (success,
+    message, plan); on failure nothing is issued.
+    """
+    with inventory.batch():
+        plan = allocate(inventory.quantities, requests, allow_partial)
+        if not plan["issue"]:
+            return False, "No request can be served from current stock.", plan
+        success, message = inventory.update_stocks({group: -units for group, units in plan["issue"].items()},
+                                                   user=user)
+    return success, message, plan
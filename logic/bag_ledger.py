@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+import numpy as np
+from storage import BAG_LEDGER_FILE, ensure_data_dir
+
+BLOOD_GROUPS = ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"]
+COMPONENTS = ["Whole Blood", "Red Cells", "Plasma", "Platelets"]
+DEFAULT_COMPONENT = "Whole Blood"
+# Storage life of each component, in days
+SHELF_LIFE_DAYS = {"Whole Blood": 35, "Red Cells": 42, "Plasma": 365, "Platelets": 5}
+
+# Bag status codes
+AVAILABLE, ISSUED, EXPIRED, DISCARDED = 0, 1, 2, 3
+
+COLUMNS = {
+    "group": np.int8,        # index into BLOOD_GROUPS
+    "component": np.int8,    # index into COMPONENTS
+    "collected": np.int64,   # epoch seconds
+    "expires": np.int64,     # epoch seconds
+    "status": np.int8,
+}
+
+class BagLedger:
+    """
+    Every blood bag as one row of parallel NumPy columns; a bag's id is its
+    row number. Available bags are also indexed per blood group, sorted by
+    expiry, so counts, expiry windows and FEFO issue are binary searches
+    instead of scans. Per-group results are arrays aligned with BLOOD_GROUPS.
+    """
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._columns = {name: np.zeros(capacity, dtype) for name, dtype in COLUMNS.items()}
+        self._index = None  # group code -> (expiry times, bag ids) of available bags, sorted by expiry
+        self._lock = threading.RLock()
+        self.log_offset = 0  # position in the delta log this state includes, see InventoryStore
+
+    def __len__(self):
+        return self._size
+
+    def column(self, name):
+        """Read-only view of one column, e.g. ledger.column("expires")."""
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def _grow(self, needed):
+        capacity = len(self._columns["status"])
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _build_index(self):
+        groups = self._columns["group"][:self._size]
+        expires = self._columns["expires"][:self._size]
+        available = self._columns["status"][:self._size] == AVAILABLE
+        self._index = {}
+        for code in range(len(BLOOD_GROUPS)):
+            ids = np.flatnonzero(available & (groups == code))
+            order = np.argsort(expires[ids], kind="stable")
+            self._index[code] = (expires[ids][order], ids[order])
+
+    def _available(self, code):
+        if self._index is None:
+            self._build_index()
+        return self._index[code]
+
+    def add_bags(self, blood_group, count, component=DEFAULT_COMPONENT, collected_at=None, expires_at=None):
+        """Records `count` new available bags and returns their ids."""
+        code = BLOOD_GROUPS.index(blood_group)
+        collected_at = int(time.time() if collected_at is None else collected_at)
+        if expires_at is None:
+            expires_at = collected_at + SHELF_LIFE_DAYS[component] * 86400
+        with self._lock:
+            start = self._size
+            self._grow(start + count)
+            rows = slice(start, start + count)
+            self._columns["group"][rows] = code
+            self._columns["component"][rows] = COMPONENTS.index(component)
+            self._columns["collected"][rows] = collected_at
+            self._columns["expires"][rows] = int(expires_at)
+            self._columns["status"][rows] = AVAILABLE
+            self._size += count
+
+            if self._index is not None:
+                times, ids = self._index[code]
+                at = np.searchsorted(times, int(expires_at), side="right")
+                self._index[code] = (np.insert(times, at, np.full(count, int(expires_at))),
+                                     np.insert(ids, at, np.arange(start, start + count)))
+        return range(start, start + count)
+
+    def counts(self, now=None):
+        """Unexpired available bags per group: the stock levels."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return np.array([len(times) - np.searchsorted(times, now, side="right")
+                             for times, _ in (self._available(c) for c in range(len(BLOOD_GROUPS)))])
+
+    def expiring_within(self, hours, now=None):
+        """Available bags per group that expire in the next `hours` hours."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return np.array([np.searchsorted(times, now + hours * 3600, side="right")
+                             - np.searchsorted(times, now, side="right")
+                             for times, _ in (self._available(c) for c in range(len(BLOOD_GROUPS)))])
+
+    def issue(self, blood_group, units, component=None, now=None):
+        """
+        Issues `units` bags first-expiry-first-out, skipping expired ones, and
+        returns their ids. Raises ValueError if not enough bags are available.
+        """
+        code = BLOOD_GROUPS.index(blood_group)
+        now = time.time() if now is None else now
+        with self._lock:
+            times, ids = self._available(code)
+            start = np.searchsorted(times, now, side="right")
+            if component is None:
+                positions = np.arange(start, min(start + units, len(ids)))
+            else:
+                wanted = self._columns["component"][ids[start:]] == COMPONENTS.index(component)
+                positions = start + np.flatnonzero(wanted)[:units]
+            if len(positions) < units:
+                raise ValueError(f"Only {len(positions)} {blood_group} units available")
+
+            issued = ids[positions]
+            self._columns["status"][issued] = ISSUED
+            self._index[code] = (np.delete(times, positions), np.delete(ids, positions))
+            return issued
+
+    def set_status(self, bag_ids, status):
+        """Sets the status of specific bags, e.g. when replaying an issue."""
+        with self._lock:
+            self._columns["status"][np.asarray(bag_ids, dtype=np.int64)] = status
+            self._index = None
+
+    def sweep_expired(self, now=None):
+        """Marks every available bag past its expiry as expired; returns counts per group."""
+        now = time.time() if now is None else now
+        swept = np.zeros(len(BLOOD_GROUPS), dtype=np.int64)
+        with self._lock:
+            for code in range(len(BLOOD_GROUPS)):
+                times, ids = self._available(code)
+                end = np.searchsorted(times, now, side="right")
+                if end:
+                    self._columns["status"][ids[:end]] = EXPIRED
+                    self._index[code] = (times[end:], ids[end:])
+                    swept[code] = end
+        return swept
+
+    def save(self, filepath=BAG_LEDGER_FILE, log_offset=0):
+        ensure_data_dir()
+        with self._lock:
+            tmp = filepath + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, log_offset=np.int64(log_offset),
+                         **{name: column[:self._size] for name, column in self._columns.items()})
+            os.replace(tmp, filepath)
+            self.log_offset = log_offset
+
+    @classmethod
+    def load(cls, filepath=BAG_LEDGER_FILE):
+        """Loads a saved ledger; a missing file gives an empty one."""
+        if not os.path.exists(filepath):
+            return cls()
+        with np.load(filepath) as data:
+            size = len(data["status"])
+            ledger = cls(capacity=max(size, 1024))
+            for name, dtype in COLUMNS.items():
+                ledger._columns[name][:size] = data[name].astype(dtype)
+            ledger.log_offset = int(data["log_offset"]) if "log_offset" in data else 0
+        ledger._size = size
+        return ledger
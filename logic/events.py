@@ -0,0 +1,57 @@
+import queue
+import threading
+from collections import defaultdict
+
+class EventBus:
+    """
+    In-process publish/subscribe hub. publish() only queues the event;
+    subscribers are called in order on one background thread, so a slow
+    handler (sending email, say) never holds up the request that raised it.
+    """
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, topic, handler):
+        with self._lock:
+            if handler not in self._subscribers[topic]:
+                self._subscribers[topic].append(handler)
+        return handler
+
+    def unsubscribe(self, topic, handler):
+        with self._lock:
+            if handler in self._subscribers[topic]:
+                self._subscribers[topic].remove(handler)
+
+    def publish(self, topic, **event):
+        with self._lock:
+            if not self._subscribers[topic]:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="events", daemon=True)
+                self._thread.start()
+        self._queue.put((topic, dict(event, topic=topic)))
+
+    def _run(self):
+        while True:
+            topic, event = self._queue.get()
+            with self._lock:
+                handlers = list(self._subscribers[topic])
+            for handler in handlers:
+                try:
+                    handler(event)
+                except Exception as e:
+                    print(f"Event handler error ({topic}): {e}")
+            self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every event published so far has been handled."""
+        self._queue.join()
+
+_shared_bus = EventBus()
+
+def get_event_bus():
+    """Returns the process-wide event bus."""
+    return _shared_bus
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Prompt budget for a patient's history, in (estimated) tokens
+AI_HISTORY_TOKEN_BUDGET = int(os.getenv("AI_HISTORY_TOKEN_BUDGET", 800))
+# Most recent entries passed to the model verbatim; older ones are summarized
+AI_HISTORY_RECENT_ENTRIES = int(os.getenv("AI_HISTORY_RECENT_ENTRIES", 3))
+SUMMARY_CACHE_SIZE = 10_000
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; good enough for budgeting
+    return len(text) // 4 + 1
+
+def _fingerprint(entry):
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode()).hexdigest()
+
+def _summary_line(entry):
+    # One short line per visit: date and the first sentence of the diagnosis
+    diagnosis = str(entry.get("diagnosis", entry.get("disease", "Unknown")))
+    diagnosis = diagnosis.split(". ")[0].strip()
+    if len(diagnosis) > 80:
+        diagnosis = diagnosis[:77] + "..."
+    return f"- {entry.get('date', 'N/A')}: {diagnosis}"
+
+def _truncate(text, max_chars):
+    text = str(text)
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+class HistoryCompactor:
+    """
+    Shrinks a medical history to a bounded prompt: the most recent entries are
+    kept verbatim (trimmed only if they alone exceed the budget) and older ones
+    are collapsed into a one-line-per-visit summary. Summaries are cached per
+    patient and only extended when new entries push older ones out of the
+    verbatim window, since history is append-only.
+    """
+    def __init__(self, token_budget=AI_HISTORY_TOKEN_BUDGET, recent_entries=AI_HISTORY_RECENT_ENTRIES):
+        self.token_budget = token_budget
+        self.recent_entries = recent_entries
+        self._summaries = OrderedDict()  # patient key -> (summarized count, last fingerprint, lines)
+        self._lock = threading.Lock()
+        self.summaries_reused = 0
+        self.entries_summarized = 0
+
+    def _summary_lines(self, patient_key, older):
+        with self._lock:
+            cached = self._summaries.get(patient_key)
+        count, lines = 0, []
+        if cached:
+            cached_count, last_fingerprint, cached_lines = cached
+            # Reuse the summary if its entries are still the prefix of the history
+            if 0 < cached_count <= len(older) and _fingerprint(older[cached_count - 1]) == last_fingerprint:
+                count, lines = cached_count, list(cached_lines)
+                self.summaries_reused += 1
+
+        for entry in older[count:]:
+            lines.append(_summary_line(entry))
+        self.entries_summarized += len(older) - count
+
+        if older:
+            with self._lock:
+                self._summaries[patient_key] = (len(older), _fingerprint(older[-1]), lines)
+                self._summaries.move_to_end(patient_key)
+                while len(self._summaries) > SUMMARY_CACHE_SIZE:
+                    self._summaries.popitem(last=False)
+        return lines
+
+    def compact(self, history, patient_id=None, token_budget=None):
+        """
+        Returns the history as prompt text of at most about `token_budget` tokens.
+        """
+        budget = token_budget or self.token_budget
+        history = list(history or [])
+        if not history:
+            return "No previous history."
+
+        patient_key = patient_id if patient_id is not None else _fingerprint(history[0])
+        recent = history[-self.recent_entries:] if self.recent_entries else []
+        older = history[:len(history) - len(recent)]
+
+        # Recent visits get up to two thirds of the budget, trimmed field by field if needed
+        recent_budget_chars = budget * 4 * 2 // 3
+        recent_text = json.dumps(recent, default=str)
+        if len(recent_text) > recent_budget_chars:
+            per_entry = recent_budget_chars // max(len(recent), 1)
+            per_field = max(per_entry // 4, 40)
+            recent = [{k: _truncate(v, per_field) for k, v in entry.items()} for entry in recent]
+            recent_text = json.dumps(recent, default=str)
+
+        parts = []
+        lines = self._summary_lines(patient_key, older)
+        if lines:
+            # Newest summary lines first in priority; drop the oldest once over budget
+            remaining = budget - estimate_tokens(recent_text)
+            kept = []
+            for line in reversed(lines):
+                if estimate_tokens("\n".join(kept + [line])) > remaining:
+                    break
+                kept.append(line)
+            kept.reverse()
+            omitted = len(lines) - len(kept)
+            header = "Earlier visits (summary):"
+            if omitted:
+                header += f" {omitted} older visit(s) omitted."
+            parts.append("\n".join([header] + kept))
+        parts.append(f"Recent visits: {recent_text}")
+        return "\n".join(parts)
+
+_shared_compactor = HistoryCompactor()
+
+def compact_history(history, patient_id=None, token_budget=None):
+    """Compacts a history with the shared, per-patient summary cache."""
+    return _shared_compactor.compact(history, patient_id, token_budget)
@@ -0,0 +1,148 @@
+import os
+import threading
+from bisect import insort
+from collections import OrderedDict
+from data_manager import file_lock, VERSION_FIELD
+from repository import get_repository
+from storage import HISTORY_FILE, PATIENT_FILE
+
+# History entries shown per page in the Doctor's Cabin
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 5))
+# Patients whose histories are kept in memory (least recently read are dropped)
+HISTORY_CACHE_PATIENTS = int(os.getenv("HISTORY_CACHE_PATIENTS", 256))
+
+# Fields the store adds to each entry; not part of the clinical record
+BOOKKEEPING_FIELDS = ("entry_id", "pid", "migrated", VERSION_FIELD)
+
+def clinical(entry):
+    """An entry as it was recorded, without the store's bookkeeping fields."""
+    return {k: v for k, v in entry.items() if k not in BOOKKEEPING_FIELDS}
+
+class HistoryStore:
+    """
+    Medical history kept apart from the patient records: one record per
+    entry (keyed by "entry_id", indexed by "pid"), so listing patients and
+    changing their status never loads clinical notes. Entry ids grow with
+    time, which gives the newest-first order.
+
+    Reads go through a bounded LRU cache of recently read patients'
+    histories, loaded with find(pid=...) on demand. Appends made through the
+    store update a cached history in place; a write by another process
+    (a change of the collection's revision) empties the cache.
+
+    `listeners` are called as listener(entry, previous_revision, revision)
+    after each append, so derived indexes can add the entry without a rescan.
+    """
+    def __init__(self, history_repo, patient_repo, cache_size=HISTORY_CACHE_PATIENTS):
+        self.history_repo = history_repo
+        self.patient_repo = patient_repo
+        self.cache_size = cache_size
+        self._by_pid = OrderedDict()  # pid -> stored entries, oldest first (shared; don't modify)
+        self._revision = None
+        self._lock = threading.RLock()
+        self.listeners = []
+
+    def _lock_path(self):
+        return getattr(self.history_repo, "filepath", HISTORY_FILE)
+
+    def _refresh(self):
+        revision = self.history_repo.revision()
+        if revision != self._revision:
+            self._by_pid.clear()
+            self._revision = revision
+
+    def _histories(self, pids):
+        # Called under self._lock after _refresh(); loads the pids not cached yet
+        missing = [pid for pid in pids if pid not in self._by_pid]
+        if len(missing) == 1:
+            loaded = {missing[0]: self.history_repo.find(pid=missing[0])}
+        else:
+            # Many patients at once (e.g. triage): one pass instead of a find each
+            loaded = {pid: [] for pid in missing}
+            for entry in self.history_repo.all() if missing else ():
+                if entry.get("pid") in loaded:
+                    loaded[entry["pid"]].append(entry)
+        for pid, history in loaded.items():
+            self._by_pid[pid] = sorted(history, key=lambda e: e["entry_id"])
+        found = {}
+        for pid in pids:
+            found[pid] = self._by_pid[pid]
+            self._by_pid.move_to_end(pid)
+        while len(self._by_pid) > self.cache_size:
+            self._by_pid.popitem(last=False)
+        return found
+
+    def _history(self, pid):
+        with self._lock:
+            self._refresh()
+            return self._histories([pid])[pid]
+
+    def append(self, pid, entry):
+        """Adds an entry to a patient's history and returns the stored record."""
+        record = {**entry, "entry_id": self.history_repo.next_id(), "pid": pid}
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            previous = self._revision
+            self.history_repo.insert(record)
+            stored = {**record, VERSION_FIELD: 1}
+            if pid in self._by_pid:
+                insort(self._by_pid[pid], stored, key=lambda e: e["entry_id"])
+            self._revision = self.history_repo.revision()
+        for listener in self.listeners:
+            listener(stored, previous, self._revision)
+        return record
+
+    def entries(self, pid):
+        """A patient's full clinical history, oldest first (what the AI prompt expects)."""
+        return [clinical(e) for e in self._history(pid)]
+
+    def page(self, pid, page=0, page_size=HISTORY_PAGE_SIZE):
+        """
+        One page of a patient's history, newest first. Returns (entries,
+        has_more).
+        """
+        history = self._history(pid)
+        end = len(history) - page * page_size
+        start = max(end - page_size, 0)
+        return history[start:max(end, 0)][::-1], start > 0
+
+    def entries_for(self, pids):
+        """{pid: clinical history oldest first} for many patients."""
+        with self._lock:
+            self._refresh()
+            histories = self._histories(list(set(pids)))
+            return {pid: [clinical(e) for e in history] for pid, history in histories.items()}
+
+    def migrate(self):
+        """
+        Moves "medical_history" lists still embedded in patient records into
+        the history collection and strips them from the records. Safe to run
+        again after an interruption: patients whose entries were already
+        moved only have the list removed. Returns the number of entries moved.
+        """
+        if not any("medical_history" in p for p in self.patient_repo.all()):
+            return 0
+        with file_lock(getattr(self.patient_repo, "filepath", PATIENT_FILE)):
+            patients = self.patient_repo.all()
+            moved = {e["pid"] for e in self.history_repo.all() if e.get("migrated")}
+            pending = [(p["pid"], entry) for p in patients if p["pid"] not in moved
+                       for entry in p.get("medical_history") or [] if isinstance(entry, dict)]
+            if pending:
+                ids = self.history_repo.allocate_ids(len(pending))
+                self.history_repo.insert_many([{**entry, "entry_id": entry_id, "pid": pid, "migrated": True}
+                                               for entry_id, (pid, entry) in zip(ids, pending)])
+            self.patient_repo.replace_all([{k: v for k, v in p.items() if k != "medical_history"}
+                                           for p in patients])
+        return len(pending)
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+def get_history_store():
+    """Returns the process-wide history store, migrating embedded history on first use."""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = HistoryStore(get_repository(HISTORY_FILE), get_repository(PATIENT_FILE))
+            _shared_store.migrate()
+        return _shared_store
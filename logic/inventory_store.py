@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from data_manager import append_log, read_log, file_lock
+from logic.bag_ledger import BagLedger, BLOOD_GROUPS, DEFAULT_COMPONENT, ISSUED
+from repository import get_repository
+from storage import BAG_LEDGER_FILE, INVENTORY_LOG_FILE, INVENTORY_FILE, ensure_data_dir
+
+# Deltas logged between two ledger snapshots
+INVENTORY_SNAPSHOT_EVERY = int(os.getenv("INVENTORY_SNAPSHOT_EVERY", 500))
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return None
+
+def apply_delta(ledger, delta):
+    """Replays one logged stock movement onto a ledger."""
+    op = delta["op"]
+    if op == "receive":
+        ledger.add_bags(delta["blood_group"], delta["qty"], delta.get("component", DEFAULT_COMPONENT),
+                        collected_at=delta["collected_at"], expires_at=delta["expires_at"])
+    elif op == "issue":
+        ledger.set_status(delta["bags"], ISSUED)
+    elif op == "sweep":
+        ledger.sweep_expired(now=delta["timestamp"])
+
+class InventoryStore:
+    """
+    Blood stock kept as an in-memory bag ledger plus an append-only log of
+    stock movements (blood group, quantity, timestamp, user). Each change
+    appends one line to the log instead of rewriting the stock; the ledger
+    is snapshotted every `snapshot_every` deltas, and loading replays only
+    the deltas after the snapshot. The log is never truncated, so it is also
+    the audit trail.
+    """
+    def __init__(self, ledger_file=BAG_LEDGER_FILE, log_file=INVENTORY_LOG_FILE,
+                 snapshot_every=INVENTORY_SNAPSHOT_EVERY, counts_repo=None):
+        self.ledger_file = ledger_file
+        self.log_file = log_file
+        self.snapshot_every = snapshot_every
+        # Optional repository that gets a per-group count snapshot (inventory.json)
+        self.counts_repo = counts_repo
+        self._ledger = None
+        self._signature = None
+        self._unsnapshotted = 0
+        self._batch = None
+        self._lock = threading.RLock()
+
+    @property
+    def ledger(self):
+        """The current ledger, reloaded if another process changed the stock."""
+        with self._lock:
+            self._refresh()
+            return self._ledger
+
+    def _current_signature(self):
+        return _signature(self.ledger_file), _signature(self.log_file)
+
+    def _refresh(self):
+        signature = self._current_signature()
+        if self._ledger is not None and signature == self._signature:
+            return
+        with file_lock(self.log_file):
+            ledger = BagLedger.load(self.ledger_file)
+            deltas = read_log(self.log_file, offset=ledger.log_offset)
+            for delta in deltas:
+                apply_delta(ledger, delta)
+            self._ledger = ledger
+            self._unsnapshotted = len(deltas)
+            self._signature = self._current_signature()
+
+    def is_empty(self):
+        return len(self.ledger) == 0
+
+    def counts(self, now=None):
+        return self.ledger.counts(now)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups several changes into one log write. Other writers wait until
+        the batch ends; if it fails, none of its changes are kept. A batch
+        nested in another acts as a savepoint: if it fails, only its own
+        changes are undone and the outer batch can carry on.
+        """
+        with self._lock, file_lock(self.log_file):
+            if self._batch is not None:
+                savepoint = len(self._batch)
+                try:
+                    yield self
+                except Exception:
+                    del self._batch[savepoint:]
+                    self._rebuild(self._batch)
+                    raise
+                return
+            self._refresh()
+            self._batch = []
+            try:
+                yield self
+                if self._batch:
+                    self._commit(self._batch)
+            except Exception:
+                self._ledger = None  # drop the uncommitted in-memory changes
+                raise
+            finally:
+                self._batch = None
+
+    def _rebuild(self, pending):
+        # The committed stock plus the batch's changes so far, without the undone ones
+        self._ledger = None
+        self._refresh()
+        for delta in pending:
+            apply_delta(self._ledger, delta)
+
+    def _record(self, delta):
+        if self._batch is not None:
+            self._batch.append(delta)
+        else:
+            self._commit([delta])
+
+    def _commit(self, deltas):
+        ensure_data_dir()
+        append_log(self.log_file, *deltas)
+        self._signature = self._current_signature()
+        self._unsnapshotted += len(deltas)
+        if self._unsnapshotted >= self.snapshot_every:
+            self.snapshot()
+
+    def receive(self, blood_group, units, user=None, component=DEFAULT_COMPONENT,
+                collected_at=None, expires_at=None):
+        """Adds `units` new bags; returns their ids."""
+        with self.batch():
+            now = time.time()
+            collected_at = int(now if collected_at is None else collected_at)
+            bags = self._ledger.add_bags(blood_group, units, component, collected_at, expires_at)
+            self._record({"op": "receive", "blood_group": blood_group, "qty": units, "timestamp": now,
+                          "user": user, "component": component, "collected_at": collected_at,
+                          "expires_at": int(self._ledger.column("expires")[bags[0]]) if units else None})
+            return bags
+
+    def issue(self, blood_group, units, user=None, component=None):
+        """Issues `units` bags first-expiry-first-out; raises ValueError if short."""
+        with self.batch():
+            now = time.time()
+            bags = self._ledger.issue(blood_group, units, component, now=now)
+            self._record({"op": "issue", "blood_group": blood_group, "qty": -units, "timestamp": now,
+                          "user": user, "bags": bags.tolist()})
+            return bags
+
+    def sweep(self, user=None):
+        """Marks expired bags; returns the count per group (nothing is logged if none expired)."""
+        with self.batch():
+            now = time.time()
+            swept = self._ledger.sweep_expired(now=now)
+            if swept.any():
+                self._record({"op": "sweep", "blood_group": None, "qty": -int(swept.sum()),
+                              "timestamp": now, "user": user, "expired": swept.tolist()})
+            return swept
+
+    def snapshot(self):
+        """Saves the ledger with the log position it includes."""
+        with self._lock, file_lock(self.log_file):
+            self._refresh()
+            offset = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+            self._ledger.save(self.ledger_file, log_offset=offset)
+            self._signature = self._current_signature()
+            self._unsnapshotted = 0
+            if self.counts_repo is not None:
+                self.counts_repo.replace_all([{"blood_group": g, "units": int(q)}
+                                              for g, q in zip(BLOOD_GROUPS, self._ledger.counts())])
+
+    def history(self, limit=50):
+        """The most recent stock movements, newest first."""
+        size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        # Lines are short, so the tail of the file holds the latest `limit` entries
+        deltas = read_log(self.log_file, offset=max(0, size - limit * 1024))
+        return deltas[::-1][:limit]
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+def get_inventory_store():
+    """Returns the process-wide inventory store."""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = InventoryStore(counts_repo=get_repository(INVENTORY_FILE))
+        return _shared_store
@@ -0,0 +1,110 @@
+import json
+
+class JSONObjectStream:
+    """
+    Incremental parser for a JSON object that arrives in chunks (e.g. streamed
+    model output). feed() returns the top-level fields completed by each chunk,
+    so callers can use "diagnosis" long before "suggested_rx" is generated.
+    Text before the opening brace, such as a ```json fence, is ignored.
+    """
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._buffer = ""
+        self._pos = None  # index just past the last consumed member, None until "{" is seen
+
+    def feed(self, chunk):
+        if self.done:
+            return {}
+        self._buffer += chunk
+
+        if self._pos is None:
+            start = self._buffer.find("{")
+            if start < 0:
+                return {}
+            self._pos = start + 1
+
+        completed = {}
+        while True:
+            pos = self._skip(self._pos, " \t\r\n,")
+            if pos >= len(self._buffer):
+                break
+            if self._buffer[pos] == "}":
+                self.done = True
+                break
+
+            end = self._scan_member(pos)
+            if end is None:
+                break  # member still incomplete, wait for more text
+            member = json.loads("{" + self._buffer[pos:end] + "}")
+            completed.update(member)
+            self._pos = end
+
+        self.fields.update(completed)
+        # Drop consumed text so long responses don't rescan from the start
+        if self._pos > 4096:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        return completed
+
+    def _skip(self, pos, chars):
+        while pos < len(self._buffer) and self._buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    def _scan_string(self, pos):
+        # pos is at the opening quote; returns the index past the closing quote
+        pos += 1
+        while pos < len(self._buffer):
+            c = self._buffer[pos]
+            if c == "\\":
+                pos += 2
+                continue
+            if c == '"':
+                return pos + 1
+            pos += 1
+        return None
+
+    def _scan_member(self, pos):
+        # "key": value  ->  index just past the value, or None if not complete yet
+        if self._buffer[pos] != '"':
+            raise ValueError(f"Expected a field name at position {pos}")
+        pos = self._scan_string(pos)
+        if pos is None:
+            return None
+        pos = self._skip(pos, " \t\r\n")
+        if pos >= len(self._buffer):
+            return None
+        if self._buffer[pos] != ":":
+            raise ValueError(f"Expected ':' at position {pos}")
+        pos = self._skip(pos + 1, " \t\r\n")
+        if pos >= len(self._buffer):
+            return None
+
+        c = self._buffer[pos]
+        if c == '"':
+            return self._scan_string(pos)
+        if c in "{[":
+            depth = 0
+            while pos < len(self._buffer):
+                c = self._buffer[pos]
+                if c == '"':
+                    pos = self._scan_string(pos)
+                    if pos is None:
+                        return None
+                    continue
+                if c in "{[":
+                    depth += 1
+                elif c in "}]":
+                    depth -= 1
+                    if depth == 0:
+                        return pos + 1
+                pos += 1
+            return None
+
+        # Number, true, false or null: complete once a delimiter follows it
+        while pos < len(self._buffer):
+            if self._buffer[pos] in ",} \t\r\n":
+                return pos
+            pos += 1
+        return None
@@ -0,0 +1,296 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from heapq import heapify, heappop, heappush
+from data_manager import file_lock, VERSION_FIELD
+from repository import get_repository
+from storage import OUTBOX_FILE
+from utils.email_service import build_alert, build_donation_request, get_mailer
+
+# Delivery attempts per message before it is marked failed
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+# Wait before the first retry; doubles after every further failure
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", 30))
+# How often an idle sender looks for due messages
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 2))
+# Messages claimed and handed to the mailer per round
+OUTBOX_CLAIM_SIZE = int(os.getenv("OUTBOX_CLAIM_SIZE", 400))
+# How long a claim is held before other senders may take the message over
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+# Sent and failed messages are deleted this long after they finished
+OUTBOX_RETENTION_SECONDS = float(os.getenv("OUTBOX_RETENTION_SECONDS", 7 * 24 * 3600))
+
+OUTBOX_STATUSES = ("pending", "sending", "sent", "failed")
+FINISHED_STATUSES = ("sent", "failed")
+
+# Message kind -> builder taking the stored params
+MESSAGE_BUILDERS = {
+    "alert": build_alert,
+    "donation_request": build_donation_request,
+}
+
+def outbox_message(key, kind, broadcast_id=None, **params):
+    """
+    A new outbox record. `key` is the dedup key: a message whose key is
+    already in the outbox is not queued again.
+    """
+    if kind not in MESSAGE_BUILDERS:
+        raise ValueError(f"Unknown message kind: {kind}")
+    return {
+        "key": key,
+        "kind": kind,
+        "params": params,
+        "broadcast_id": broadcast_id,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": 0,
+        "last_error": None,
+        "claimed_by": None,
+        "lease_expires_at": None,
+        "created_at": time.time(),
+        "sent_at": None,
+        "finished_at": None,
+    }
+
+class Outbox:
+    """
+    Persistent queue of outgoing email. Messages are stored in the outbox
+    collection and a background sender drains them through the pooled
+    mailer, so a broadcast outlives the request (and process) that queued it.
+    Failed deliveries are retried with exponential backoff.
+
+    Several senders (threads or processes) may share one outbox: a claim is
+    made under the outbox's file lock and records the sender's id and a lease
+    expiry, so a message is handed to one sender at a time. Delivery is
+    at-least-once: messages whose lease ran out (their sender died or stalled)
+    are claimed and sent again. Sent and failed messages are deleted once
+    they are older than `retention_seconds`, so their keys no longer dedup.
+
+    Claims and status counts come from an in-memory index (due-time heaps
+    and per-broadcast counters) that follows the collection's revision; the
+    sender's own writes update it in place and, with the journaled outbox
+    file, append only the changed messages.
+    """
+    def __init__(self, repo=None, mailer=None, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 backoff=OUTBOX_BACKOFF_SECONDS, poll_seconds=OUTBOX_POLL_SECONDS,
+                 claim_size=OUTBOX_CLAIM_SIZE, lease_seconds=OUTBOX_LEASE_SECONDS,
+                 retention_seconds=OUTBOX_RETENTION_SECONDS):
+        self.repo = repo or get_repository(OUTBOX_FILE)
+        self.mailer = mailer or get_mailer()
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_seconds = poll_seconds
+        self.claim_size = claim_size
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.claimer_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.RLock()
+        self._revision = None
+        self._records = {}  # key -> record
+        self._due = []  # (next_attempt_at, key) of pending messages
+        self._leases = []  # (lease_expires_at, key) of claimed messages
+        self._finished = []  # (finished_at, key) of sent and failed messages
+        self._totals = {}  # status -> count
+        self._counts = {}  # broadcast id -> {status: count}
+
+    # Heap entries are not removed when a message moves on; stale ones are
+    # skipped when popped (the message's status or time no longer matches)
+
+    def _refresh(self):
+        revision = self.repo.revision()
+        if revision == self._revision:
+            return
+        self._records, self._due, self._leases, self._finished = {}, [], [], []
+        self._totals, self._counts = {}, {}
+        for record in self.repo.all():
+            self._index(record, push=False)
+        for heap in (self._due, self._leases, self._finished):
+            heapify(heap)
+        self._revision = revision
+
+    def _count(self, record, n):
+        for counts in (self._totals, self._counts.setdefault(record.get("broadcast_id"), {})):
+            counts[record["status"]] = counts.get(record["status"], 0) + n
+
+    def _index(self, record, push=True):
+        key = record["key"]
+        if key in self._records:
+            self._count(self._records[key], -1)
+        self._records[key] = record
+        self._count(record, 1)
+        entry = None
+        if record["status"] == "pending":
+            entry, heap = (_next_attempt_at(record), key), self._due
+        elif record["status"] == "sending":
+            entry, heap = (_lease_expires_at(record), key), self._leases
+        elif record["status"] in FINISHED_STATUSES:
+            entry, heap = (_finished_at(record), key), self._finished
+        if entry is not None:
+            heappush(heap, entry) if push else heap.append(entry)
+
+    def _apply(self, changes):
+        # Mirrors an update_many we just made, then adopts the new revision
+        for key, change in changes.items():
+            old = self._records[key]
+            self._index({**old, **change, VERSION_FIELD: old.get(VERSION_FIELD, 0) + 1})
+        self._revision = self.repo.revision()
+
+    def _pop(self, heap, statuses, due_at, now, limit, out):
+        # Moves messages in `statuses` whose due_at(record) has come from the heap into `out`
+        while heap and heap[0][0] <= now and len(out) < limit:
+            at, key = heappop(heap)
+            record = self._records.get(key)
+            if record is not None and record["status"] in statuses and key not in out and due_at(record) == at:
+                out[key] = record
+        return out
+
+    def enqueue(self, messages):
+        """Queues outbox_message records in one write; returns how many were new."""
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            new = {}
+            for message in messages:
+                if message["key"] not in self._records:
+                    new.setdefault(message["key"], message)
+            added = self.repo.insert_many(new.values(), skip_existing=True) if new else 0
+            for message in new.values():
+                self._index({**message, VERSION_FIELD: 1})
+            self._revision = self.repo.revision()
+        self._wake.set()
+        return added
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # Messages whose sender died are due again once their lease has run out
+            with file_lock(self._lock_path()):
+                self._refresh()
+                expired = self._pop(self._leases, ("sending",), _lease_expires_at, time.time(), float("inf"), {})
+                changes = {key: {"status": "pending", "claimed_by": None, "lease_expires_at": None}
+                           for key in expired}
+                if changes:
+                    self.repo.update_many(changes)
+                    self._apply(changes)
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception as e:
+                print(f"Outbox error: {e}")
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def _lock_path(self):
+        return getattr(self.repo, "filepath", OUTBOX_FILE)
+
+    def _claim(self):
+        # Read and mark under the file lock so no two senders claim the same message
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            now = time.time()
+            due = self._pop(self._due, ("pending",), _next_attempt_at, now, self.claim_size, {})
+            self._pop(self._leases, ("sending",), _lease_expires_at, now, self.claim_size, due)
+            due = list(due.values())
+            if due:
+                changes = {r["key"]: {"status": "sending", "claimed_by": self.claimer_id,
+                                      "lease_expires_at": now + self.lease_seconds} for r in due}
+                self.repo.update_many(changes)
+                self._apply(changes)
+        return due
+
+    def drain_once(self):
+        """
+        Claims up to claim_size due messages, sends them and records each
+        outcome. Returns the number of messages processed.
+        """
+        due = self._claim()
+        if not due:
+            return 0
+
+        report = self.mailer.send_many(MESSAGE_BUILDERS[r["kind"]](**r["params"]) for r in due)
+        errors = dict(zip(report["failed_indices"], report["errors"]))
+
+        finished = time.time()
+        changes = {}
+        for i, record in enumerate(due):
+            attempts = record.get("attempts", 0) + 1
+            if i not in errors:
+                change = {"status": "sent", "attempts": attempts, "sent_at": finished, "finished_at": finished,
+                          "last_error": None}
+            elif attempts >= self.max_attempts:
+                change = {"status": "failed", "attempts": attempts, "finished_at": finished, "last_error": errors[i]}
+            else:
+                change = {"status": "pending", "attempts": attempts, "last_error": errors[i],
+                          "next_attempt_at": finished + self.backoff * 2 ** (attempts - 1)}
+            changes[record["key"]] = dict(change, claimed_by=None, lease_expires_at=None)
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            # Messages another sender took over after our lease expired are theirs to record
+            changes = {key: change for key, change in changes.items()
+                       if self._records.get(key, {}).get("status") == "sending"
+                       and self._records[key].get("claimed_by") == self.claimer_id}
+            if changes:
+                self.repo.update_many(changes)
+                self._apply(changes)
+            self._prune(finished)
+        return len(due)
+
+    def _prune(self, now):
+        # Called under the file lock: deletes finished messages past the retention window
+        expired = self._pop(self._finished, FINISHED_STATUSES, _finished_at,
+                            now - self.retention_seconds, float("inf"), {})
+        if expired:
+            self.repo.delete_many(list(expired))
+            for key in expired:
+                self._count(self._records.pop(key), -1)
+            self._revision = self.repo.revision()
+
+    def status(self, broadcast_id=None):
+        """Message counts by status, for one broadcast or the whole outbox."""
+        with self._lock:
+            self._refresh()
+            found = self._totals if broadcast_id is None else self._counts.get(broadcast_id, {})
+            counts = {status: found.get(status, 0) for status in OUTBOX_STATUSES}
+        counts["total"] = sum(counts.values())
+        counts["done"] = counts["total"] == counts["sent"] + counts["failed"]
+        return counts
+
+def _next_attempt_at(record):
+    return record.get("next_attempt_at") or 0
+
+def _lease_expires_at(record):
+    return record.get("lease_expires_at") or 0
+
+def _finished_at(record):
+    # Messages finished before "finished_at" existed fall back to their other times
+    return record.get("finished_at") or record.get("sent_at") or record.get("created_at") or 0
+
+_shared_outbox = None
+_shared_lock = threading.Lock()
+
+def get_outbox():
+    """Returns the process-wide outbox, with its sender running."""
+    global _shared_outbox
+    with _shared_lock:
+        if _shared_outbox is None:
+            _shared_outbox = Outbox()
+        _shared_outbox.start()
+        return _shared_outbox
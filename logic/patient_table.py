@@ -0,0 +1,216 @@
+import threading
+import numpy as np
+import pandas as pd
+from data_manager import file_lock, VERSION_FIELD
+from logic.bag_ledger import BLOOD_GROUPS
+from repository import get_repository
+from storage import PATIENT_FILE
+
+PATIENT_STATUSES = ("PENDING", "ADMITTED", "DISCHARGED")
+TABLE_COLUMNS = ("pid", "name", "age", "contact", "blood_group", "current_status")
+
+class _Categories:
+    """Category list for one column; values not seen before are appended."""
+    def __init__(self, known):
+        self.values = list(known)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value):
+        value = "Unknown" if value is None else str(value)
+        if value not in self.codes:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+        return self.codes[value]
+
+class PatientTable:
+    """
+    Columnar copy of the patient headers for listing, filtering and counting.
+    Columns are NumPy arrays (integer pids, small integer codes for blood
+    group and status) that grow in place. Writes made through the table update
+    one row; only writes by others trigger a full rebuild from the repository.
+    `frame()` wraps the arrays in a DataFrame with categorical dtypes and is
+    cached until the next change.
+
+    `listeners` are called as listener(record, previous_revision, revision)
+    after each insert or update made through the table.
+    """
+    def __init__(self, patient_repo):
+        self.patient_repo = patient_repo
+        self._lock = threading.RLock()
+        self._revision = None
+        self._frame = None
+        self.listeners = []
+        self._reset(0)
+
+    def _reset(self, capacity):
+        capacity = max(capacity, 64)
+        self.size = 0
+        self.pids = np.zeros(capacity, dtype=np.int64)
+        self.ages = np.zeros(capacity, dtype=np.int64)
+        self.versions = np.zeros(capacity, dtype=np.int64)
+        self.group_codes = np.zeros(capacity, dtype=np.int8)
+        self.status_codes = np.zeros(capacity, dtype=np.int8)
+        self.names = np.empty(capacity, dtype=object)
+        self.contacts = np.empty(capacity, dtype=object)
+        self.groups = _Categories(list(BLOOD_GROUPS) + ["Unknown"])
+        self.statuses = _Categories(PATIENT_STATUSES)
+        self.rows = {}
+
+    def _grow(self):
+        for name in ("pids", "ages", "versions", "group_codes", "status_codes", "names", "contacts"):
+            column = getattr(self, name)
+            grown = np.zeros(len(column) * 2, dtype=column.dtype) if column.dtype != object \
+                else np.empty(len(column) * 2, dtype=object)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _set_row(self, row, record):
+        self.pids[row] = record["pid"]
+        self.names[row] = record.get("name")
+        age = record.get("age")
+        self.ages[row] = age if isinstance(age, int) else -1
+        self.contacts[row] = record.get("contact")
+        self.group_codes[row] = self.groups.code(record.get("blood_group"))
+        self.status_codes[row] = self.statuses.code(record.get("current_status", "PENDING"))
+        self.versions[row] = record.get(VERSION_FIELD, 0)
+
+    def _append(self, record):
+        if self.size == len(self.pids):
+            self._grow()
+        self.rows[record["pid"]] = self.size
+        self._set_row(self.size, record)
+        self.size += 1
+
+    def _refresh(self):
+        revision = self.patient_repo.revision()
+        if revision == self._revision:
+            return
+        records = [r for r in self.patient_repo.all() if isinstance(r, dict) and isinstance(r.get("pid"), int)]
+        self._reset(len(records))
+        for record in records:
+            self._append(record)
+        self._frame = None
+        self._revision = revision
+
+    def _changed(self):
+        self._frame = None
+        self._revision = self.patient_repo.revision()
+
+    def _notify(self, record, previous):
+        for listener in self.listeners:
+            listener(record, previous, self._revision)
+
+    def _lock_path(self):
+        return getattr(self.patient_repo, "filepath", PATIENT_FILE)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self.size
+
+    def frame(self):
+        """All patients as a DataFrame (shared; don't modify it)."""
+        with self._lock:
+            self._refresh()
+            if self._frame is None:
+                n = self.size
+                self._frame = pd.DataFrame({
+                    "pid": self.pids[:n],
+                    "name": self.names[:n],
+                    "age": self.ages[:n],
+                    "contact": self.contacts[:n],
+                    "blood_group": pd.Categorical.from_codes(self.group_codes[:n], self.groups.values),
+                    "current_status": pd.Categorical.from_codes(self.status_codes[:n], self.statuses.values),
+                    VERSION_FIELD: self.versions[:n],
+                })
+            return self._frame
+
+    def get(self, pid):
+        """One patient's header row as a dict, or None."""
+        with self._lock:
+            self._refresh()
+            row = self.rows.get(pid)
+            if row is None:
+                return None
+            return {
+                "pid": int(self.pids[row]),
+                "name": self.names[row],
+                "age": int(self.ages[row]),
+                "contact": self.contacts[row],
+                "blood_group": self.groups.values[self.group_codes[row]],
+                "current_status": self.statuses.values[self.status_codes[row]],
+                VERSION_FIELD: int(self.versions[row]),
+            }
+
+    def filter(self, status=None, blood_group=None, columns=TABLE_COLUMNS):
+        """Patients matching the given status and/or blood group."""
+        with self._lock:
+            self._refresh()
+            mask = np.ones(self.size, dtype=bool)
+            if status is not None:
+                mask &= self.status_codes[:self.size] == self.statuses.codes.get(status, -1)
+            if blood_group is not None:
+                mask &= self.group_codes[:self.size] == self.groups.codes.get(blood_group, -1)
+            return self.frame().loc[mask, list(columns)]
+
+    def _counts(self, codes, categories):
+        counts = np.bincount(codes, minlength=len(categories.values))
+        return pd.Series(counts, index=pd.Index(categories.values), dtype=np.int64)
+
+    def status_counts(self):
+        with self._lock:
+            self._refresh()
+            return self._counts(self.status_codes[:self.size], self.statuses)
+
+    def blood_group_counts(self, status=None):
+        """Patients per blood group, optionally only those in one status."""
+        with self._lock:
+            self._refresh()
+            codes = self.group_codes[:self.size]
+            if status is not None:
+                codes = codes[self.status_codes[:self.size] == self.statuses.codes.get(status, -1)]
+            return self._counts(codes, self.groups)
+
+    # Writes hold the patient file's lock from refresh to _changed(), so no
+    # other writer's change can slip in before the new revision is adopted.
+    # Listeners are called after the lock is released.
+
+    def insert(self, record):
+        """Inserts a patient through the repository and adds its row."""
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            previous = self._revision
+            self.patient_repo.insert(record)
+            stored = {**record, VERSION_FIELD: 1}
+            self._append(stored)
+            self._changed()
+        self._notify(stored, previous)
+        return True
+
+    def update(self, pid, changes, expected_version=None):
+        """Updates a patient through the repository and rewrites its row."""
+        with self._lock, file_lock(self._lock_path()):
+            current = self.get(pid)
+            if current is None:
+                # Not a row of the table; a record the table skips is still
+                # updated, and the next read rebuilds from the new revision
+                return self.patient_repo.update(pid, changes, expected_version)
+            previous = self._revision
+            if not self.patient_repo.update(pid, changes, expected_version):
+                return False
+            stored = {**current, **changes, VERSION_FIELD: current[VERSION_FIELD] + 1}
+            self._set_row(self.rows[pid], stored)
+            self._changed()
+        self._notify(stored, previous)
+        return True
+
+_shared_table = None
+_shared_lock = threading.Lock()
+
+def get_patient_table():
+    """Returns the process-wide patient table."""
+    global _shared_table
+    with _shared_lock:
+        if _shared_table is None:
+            _shared_table = PatientTable(get_repository(PATIENT_FILE))
+        return _shared_table
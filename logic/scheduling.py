@@ -0,0 +1,336 @@
+import os
+import threading
+from bisect import bisect_left
+from itertools import islice
+from datetime import datetime, timedelta
+from data_manager import file_lock
+from models import Appointment
+from repository import get_repository
+from storage import APPOINTMENT_FILE, STAFF_FILE
+
+# Every appointment occupies one slot of this length
+APPOINTMENT_SLOT_MINUTES = int(os.getenv("APPOINTMENT_SLOT_MINUTES", 30))
+# How many days ahead free slot searches look
+SCHEDULING_HORIZON_DAYS = int(os.getenv("SCHEDULING_HORIZON_DAYS", 30))
+# Appointments in these states no longer hold their slot
+RELEASED_STATUSES = ("Cancelled",)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class SlotUnavailableError(Exception):
+    """Raised when a slot is already booked or outside the doctor's schedule."""
+
+def parse_time(value):
+    """Start time of an appointment ("time_slot", or "date_time" on older records)."""
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+
+def _clock(value):
+    try:
+        hours, minutes = str(value).strip().split(":")
+        return timedelta(hours=int(hours), minutes=int(minutes))
+    except ValueError:
+        return None
+
+def daily_slots(doctor, slot_minutes=APPOINTMENT_SLOT_MINUTES):
+    """
+    Slot start times (offsets from midnight) a doctor takes appointments at:
+    their `available_slots` if set, otherwise every slot in `shift_timing`.
+    Slots that would run past the end of the shift are dropped.
+    """
+    length = timedelta(minutes=slot_minutes)
+    shift = str(doctor.get("shift_timing") or "").split("-")
+    start, end = (_clock(shift[0]), _clock(shift[1])) if len(shift) == 2 else (None, None)
+    if start is None or end is None or end <= start:
+        start, end = timedelta(0), timedelta(days=1)
+
+    listed = [_clock(s) for s in doctor.get("available_slots") or []]
+    if any(s is not None for s in listed):
+        slots = {s for s in listed if s is not None and start <= s and s + length <= end}
+    else:
+        slots = set()
+        t = start
+        while t + length <= end:
+            slots.add(t)
+            t += length
+    return sorted(slots)
+
+class DoctorCalendar:
+    """
+    One doctor's appointments ordered by start time. All appointments are
+    the same length, so a slot overlaps an appointment exactly when the
+    nearest appointment starting before the slot ends runs into it, and
+    conflict checks are a single binary search.
+    """
+    def __init__(self, slot_minutes=APPOINTMENT_SLOT_MINUTES):
+        self.length = timedelta(minutes=slot_minutes)
+        self.starts = []
+        self.ids = []
+        self.records = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, record):
+        i = bisect_left(self.starts, start)
+        # Same start time: keep insertion order stable by id
+        while i < len(self.starts) and self.starts[i] == start and self.ids[i] < record["appointment_id"]:
+            i += 1
+        self.starts.insert(i, start)
+        self.ids.insert(i, record["appointment_id"])
+        self.records[record["appointment_id"]] = record
+
+    def remove(self, appointment_id):
+        record = self.records.pop(appointment_id, None)
+        if record is not None:
+            # Binary search to the record's start, then step over others at the same time
+            i = bisect_left(self.starts, parse_time(record.get("time_slot", record.get("date_time"))))
+            while self.ids[i] != appointment_id:
+                i += 1
+            del self.starts[i], self.ids[i]
+        return record
+
+    def conflicts(self, start):
+        """True if a slot starting at `start` overlaps a booked appointment."""
+        i = bisect_left(self.starts, start + self.length)
+        return i > 0 and self.starts[i - 1] + self.length > start
+
+    def between(self, start=None, end=None):
+        """Appointments starting in [start, end), in time order."""
+        lo = 0 if start is None else bisect_left(self.starts, start)
+        hi = len(self.starts) if end is None else bisect_left(self.starts, end)
+        return [self.records[a] for a in self.ids[lo:hi]]
+
+def _appointment(appointment_id, patient, doctor, start):
+    return Appointment(
+        appointment_id=appointment_id,
+        patient_id=patient["pid"],
+        doctor_id=doctor["pid"],
+        patient_name=patient.get("name"),
+        doctor_name=doctor.get("name"),
+        time_slot=start.strftime(TIME_FORMAT),
+    ).to_dict()
+
+class Scheduler:
+    """
+    Appointment booking over a per-doctor interval index. The index is built
+    from the appointment collection once and rebuilt only when another writer
+    changes it; bookings made here update it in place.
+    """
+    def __init__(self, appointment_repo, staff_repo, slot_minutes=APPOINTMENT_SLOT_MINUTES,
+                 horizon_days=SCHEDULING_HORIZON_DAYS):
+        self.appointment_repo = appointment_repo
+        self.staff_repo = staff_repo
+        self.slot_minutes = slot_minutes
+        self.horizon_days = horizon_days
+        self._calendars = {}
+        self._revision = None
+        self._lock = threading.RLock()
+
+    def _lock_path(self):
+        return getattr(self.appointment_repo, "filepath", APPOINTMENT_FILE)
+
+    def _refresh(self):
+        revision = self.appointment_repo.revision()
+        if revision == self._revision:
+            return
+        calendars = {}
+        for record in self.appointment_repo.all():
+            start = parse_time(record.get("time_slot", record.get("date_time")))
+            if start is None or record.get("status") in RELEASED_STATUSES:
+                continue
+            calendars.setdefault(record.get("doctor_id"), DoctorCalendar(self.slot_minutes)).add(start, record)
+        self._calendars = calendars
+        self._revision = revision
+
+    def calendar(self, doctor_id):
+        with self._lock:
+            self._refresh()
+            return self._calendars.get(doctor_id) or DoctorCalendar(self.slot_minutes)
+
+    def appointments(self, doctor_id, status=None, start=None, end=None):
+        """A doctor's appointments in time order, optionally filtered by status and time range."""
+        records = self.calendar(doctor_id).between(start, end)
+        return [r for r in records if status is None or r.get("status") == status]
+
+    def is_free(self, doctor_id, start):
+        return not self.calendar(doctor_id).conflicts(start)
+
+    def _doctor(self, doctor_id):
+        doctor = self.staff_repo.get(doctor_id)
+        if doctor is None or doctor.get("role") != "Doctor":
+            raise ValueError(f"No doctor with id {doctor_id}")
+        return doctor
+
+    def _slot_stream(self, doctor, after, calendar):
+        # Free start times from `after` to the end of the horizon, soonest first
+        slots = daily_slots(doctor, self.slot_minutes)
+        day = datetime.combine(after.date(), datetime.min.time())
+        for _ in range(self.horizon_days):
+            for offset in slots:
+                start = day + offset
+                if start >= after and not calendar.conflicts(start):
+                    yield start
+            day += timedelta(days=1)
+
+    def _free_slots(self, doctor, n, after):
+        return list(islice(self._slot_stream(doctor, after, self.calendar(doctor["pid"])), n))
+
+    def next_free_slots(self, doctor_id, n=5, after=None):
+        """The next `n` bookable start times for a doctor, soonest first."""
+        return self._free_slots(self._doctor(doctor_id), n, after or datetime.now())
+
+    def next_free_slots_by_specialization(self, specialization, n=5, after=None):
+        """The next `n` (start, doctor) pairs across every doctor with this specialization."""
+        after = after or datetime.now()
+        options = [(start, doctor)
+                   for doctor in self.staff_repo.find(role="Doctor", specialization=specialization)
+                   for start in self._free_slots(doctor, n, after)]
+        options.sort(key=lambda option: (option[0], option[1]["pid"]))
+        return options[:n]
+
+    def book(self, patient, doctor_id, start):
+        """
+        Books `start` with the doctor for the patient (a patient record) and
+        returns the new appointment. The slot is re-checked under the
+        appointment file lock, so two bookings can never take the same slot.
+        Raises SlotUnavailableError if it is taken or outside the schedule.
+        """
+        doctor = self._doctor(doctor_id)
+        start = start.replace(second=0, microsecond=0)
+        if start - datetime.combine(start.date(), datetime.min.time()) not in daily_slots(doctor, self.slot_minutes):
+            raise SlotUnavailableError(f"{doctor['name']} has no slot at {start:%H:%M}")
+
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            calendar = self._calendars.setdefault(doctor_id, DoctorCalendar(self.slot_minutes))
+            if calendar.conflicts(start):
+                raise SlotUnavailableError(f"{doctor['name']} is already booked at {start:%Y-%m-%d %H:%M}")
+            record = _appointment(self.appointment_repo.next_id(), patient, doctor, start)
+            self.appointment_repo.insert(record)
+            calendar.add(start, record)
+            self._revision = self.appointment_repo.revision()
+        return record
+
+    def set_status(self, appointment_id, doctor_id, status):
+        """
+        Updates an appointment's status and keeps the index in step. Taking a
+        released (cancelled) appointment back raises SlotUnavailableError if
+        its slot has been booked since.
+        """
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            calendar = self._calendars.get(doctor_id)
+            record = calendar.records.get(appointment_id) if calendar else None
+            if record is None and status not in RELEASED_STATUSES:
+                # Released appointments aren't indexed, so one taken back is read from the repo
+                record = self.appointment_repo.get(appointment_id)
+                start = parse_time(record.get("time_slot", record.get("date_time"))) if record else None
+                calendar = self._calendars.setdefault(record.get("doctor_id"), DoctorCalendar(self.slot_minutes)) \
+                    if start else None
+                if calendar is not None and calendar.conflicts(start):
+                    raise SlotUnavailableError(f"{record.get('doctor_name', 'The doctor')} is already booked "
+                                               f"at {start:%Y-%m-%d %H:%M}")
+
+            if not self.appointment_repo.update(appointment_id, {"status": status}):
+                return False
+            if record is not None and calendar is not None:
+                calendar.remove(appointment_id)
+                if status not in RELEASED_STATUSES:
+                    record = dict(record, status=status)
+                    calendar.add(parse_time(record.get("time_slot", record.get("date_time"))), record)
+            self._revision = self.appointment_repo.revision()
+        return True
+
+    def _last_doctors(self, pids):
+        # pid -> doctor of the patient's latest (non-cancelled) appointment
+        latest = {}
+        for doctor_id, calendar in self._calendars.items():
+            for start, appointment_id in zip(calendar.starts, calendar.ids):
+                pid = calendar.records[appointment_id].get("patient_id")
+                if pid in pids and (pid not in latest or start >= latest[pid][0]):
+                    latest[pid] = (start, doctor_id)
+        return {pid: doctor_id for pid, (_, doctor_id) in latest.items()}
+
+    def auto_schedule(self, patients, after=None, specializations=None):
+        """
+        Books an appointment for each patient record in one pass, in the given
+        order. Each patient goes to the least loaded doctor (by upcoming
+        scheduled appointments) of the wanted specialization, taking that
+        doctor's next free slot. Patients who already have an upcoming
+        appointment are skipped.
+
+        Patient records carry no specialization of their own, so the wanted
+        one is, in order: `specializations[pid]` if given (e.g. picked at
+        reception), a "specialization" field on the record, or the
+        specialization of the doctor the patient last had an appointment
+        with. Patients with none of these can go to any doctor.
+
+        All appointments are written in a single bulk insert under the
+        appointment file lock. Returns (appointments, unscheduled) where
+        unscheduled lists the pids no slot was found for within the horizon.
+        """
+        after = after or datetime.now()
+        doctors = self.staff_repo.find(role="Doctor")
+        with self._lock, file_lock(self._lock_path()):
+            self._refresh()
+            calendars = {d["pid"]: self._calendars.setdefault(d["pid"], DoctorCalendar(self.slot_minutes))
+                         for d in doctors}
+            booked, load = set(), {}
+            for doctor_id, calendar in self._calendars.items():
+                for record in calendar.between(after):
+                    if record.get("status") == "Scheduled":
+                        booked.add(record.get("patient_id"))
+                        load[doctor_id] = load.get(doctor_id, 0) + 1
+
+            # Per doctor: [load, next free start, pid, doctor, remaining free starts]
+            queues = {}
+            for doctor in doctors:
+                stream = self._slot_stream(doctor, after, calendars[doctor["pid"]])
+                queues[doctor["pid"]] = [load.get(doctor["pid"], 0), next(stream, None), doctor["pid"], doctor, stream]
+            by_specialization = {}
+            for entry in queues.values():
+                by_specialization.setdefault(entry[3].get("specialization"), []).append(entry)
+            doctor_specialization = {d["pid"]: d.get("specialization") for d in doctors}
+            last_doctors = self._last_doctors({p["pid"] for p in patients})
+            specializations = specializations or {}
+
+            plan, unscheduled = [], []
+            for patient in patients:
+                if patient["pid"] in booked:
+                    continue
+                wanted = (specializations.get(patient["pid"]) or patient.get("specialization")
+                          or doctor_specialization.get(last_doctors.get(patient["pid"])))
+                candidates = [e for e in (by_specialization.get(wanted, []) if wanted else queues.values())
+                              if e[1] is not None]
+                if not candidates:
+                    unscheduled.append(patient["pid"])
+                    continue
+                entry = min(candidates, key=lambda e: (e[0], e[1], e[2]))
+                plan.append((patient, entry[3], entry[1]))
+                booked.add(patient["pid"])
+                entry[0] += 1
+                entry[1] = next(entry[4], None)
+
+            if not plan:
+                return [], unscheduled
+            records = [_appointment(aid, patient, doctor, start)
+                       for aid, (patient, doctor, start) in zip(self.appointment_repo.allocate_ids(len(plan)), plan)]
+            self.appointment_repo.insert_many(records)
+            for record, (_, doctor, start) in zip(records, plan):
+                calendars[doctor["pid"]].add(start, record)
+            self._revision = self.appointment_repo.revision()
+        return records, unscheduled
+
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+def get_scheduler():
+    """Returns the process-wide scheduler over the appointment and staff collections."""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = Scheduler(get_repository(APPOINTMENT_FILE), get_repository(STAFF_FILE))
+        return _shared_scheduler
@@ -0,0 +1,243 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+from heapq import heapify, heappop, nlargest
+from data_manager import VERSION_FIELD
+from logic.history_store import get_history_store
+from logic.patient_table import get_patient_table
+from repository import get_repository
+from storage import HISTORY_FILE, PATIENT_FILE
+
+# History fields whose text is searchable
+HISTORY_TEXT_FIELDS = ("diagnosis", "disease", "treatment", "details")
+
+def tokenize(text):
+    """Lower-case word tokens of a piece of text."""
+    return re.findall(r"\w+", str(text or "").lower())
+
+def _contact_tokens(contact):
+    # "555-0199" is found as "555", "0199" and "5550199"
+    parts = tokenize(contact)
+    digits = "".join(re.findall(r"\d", str(contact or "")))
+    return parts + [digits] if digits and digits not in parts else parts
+
+def _patient_fingerprint(patient):
+    return patient.get(VERSION_FIELD, 0), patient.get("name"), patient.get("contact")
+
+def _patient_terms(patient):
+    return tokenize(patient.get("name")) + _contact_tokens(patient.get("contact")) + [str(patient["pid"])]
+
+def _entry_fingerprint(entry):
+    return entry.get(VERSION_FIELD, 0)
+
+def _entry_terms(entry):
+    return [t for field in HISTORY_TEXT_FIELDS for t in tokenize(entry.get(field))]
+
+def _newest_first(ids):
+    # Yields ids in descending order, paying for the sort only as far as it is read
+    heap = [-i for i in ids]
+    heapify(heap)
+    while heap:
+        yield -heappop(heap)
+
+def entry_date(entry):
+    """The calendar date of a history entry ("2025-12-07" or "2025-12-07 17:12"), or None."""
+    try:
+        return datetime.strptime(str(entry.get("date", ""))[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+class _InvertedIndex:
+    """term -> set of document ids, with a sorted vocabulary for prefix lookups."""
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+        self.documents = {}  # doc id -> (fingerprint, terms)
+        self._new_terms = None  # collects new terms during a bulk sync
+
+    def add(self, doc_id, fingerprint, terms):
+        self.remove(doc_id)
+        terms = frozenset(terms)
+        for term in terms:
+            if term not in self.postings:
+                self.postings[term] = set()
+                if self._new_terms is not None:
+                    self._new_terms.append(term)
+                else:
+                    insort(self.vocabulary, term)
+            self.postings[term].add(doc_id)
+        self.documents[doc_id] = (fingerprint, terms)
+
+    def remove(self, doc_id):
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        for term in document[1]:
+            docs = self.postings[term]
+            docs.discard(doc_id)
+            if not docs:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+
+    def sync(self, records, key, fingerprint, terms):
+        """
+        Brings the index in line with `records`: only records that are new
+        or whose fingerprint changed are re-tokenized; missing ones are dropped.
+        Returns (re-indexed records, dropped ids).
+        """
+        seen, changed = set(), []
+        self._new_terms = []
+        for record in records:
+            doc_id = record.get(key)
+            if doc_id is None:
+                continue
+            seen.add(doc_id)
+            current = fingerprint(record)
+            known = self.documents.get(doc_id)
+            if known is None or known[0] != current:
+                self.add(doc_id, current, terms(record))
+                changed.append(record)
+        # New terms are merged into the vocabulary once instead of one insort each
+        new_terms, self._new_terms = self._new_terms, None
+        if len(new_terms) > 32:
+            self.vocabulary = sorted(self.vocabulary + new_terms)
+        else:
+            for term in new_terms:
+                insort(self.vocabulary, term)
+        dropped = [d for d in self.documents if d not in seen]
+        for doc_id in dropped:
+            self.remove(doc_id)
+        return changed, dropped
+
+    def exact(self, term):
+        return self.postings.get(term, set())
+
+    def terms_with_prefix(self, prefix):
+        """Vocabulary terms starting with `prefix`, in alphabetical order (lazily)."""
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + "\uffff")
+        return (self.vocabulary[i] for i in range(start, end))
+
+    def has_prefix(self, doc_id, prefix):
+        return any(term.startswith(prefix) for term in self.documents[doc_id][1])
+
+class SearchIndex:
+    """
+    Inverted indexes over patient names and contacts and over medical history
+    text. Each index follows its collection's revision: when it changes, only
+    the records that were added or modified are re-tokenized.
+
+    Writes made through the history store and patient table are pushed in
+    with history_added() and patient_saved(), which index the one record and
+    adopt the new revision, so the next search needs no resync at all.
+    """
+    def __init__(self, patient_repo, history_repo):
+        self.patient_repo = patient_repo
+        self.history_repo = history_repo
+        self.patients = _InvertedIndex()
+        self.history = _InvertedIndex()
+        self._entries = {}  # entry id -> (pid, date, entry)
+        self._revisions = {}
+        self._lock = threading.RLock()
+
+    def _refresh(self):
+        revision = self.patient_repo.revision()
+        if self._revisions.get("patients") != revision:
+            self.patients.sync(self.patient_repo.all(), "pid", _patient_fingerprint, _patient_terms)
+            self._revisions["patients"] = revision
+
+        revision = self.history_repo.revision()
+        if self._revisions.get("history") != revision:
+            changed, dropped = self.history.sync(self.history_repo.all(), "entry_id",
+                                                 _entry_fingerprint, _entry_terms)
+            for entry in changed:
+                self._entries[entry["entry_id"]] = (entry.get("pid"), entry_date(entry), entry)
+            for entry_id in dropped:
+                del self._entries[entry_id]
+            self._revisions["history"] = revision
+
+    # A pushed write is only taken in when the index was current just before
+    # it; otherwise the next search resyncs and picks it up with the rest
+
+    def history_added(self, entry, previous_revision, revision):
+        """Indexes a history entry just written (a HistoryStore listener)."""
+        with self._lock:
+            if self._revisions.get("history") != previous_revision:
+                return
+            self.history.add(entry["entry_id"], _entry_fingerprint(entry), _entry_terms(entry))
+            self._entries[entry["entry_id"]] = (entry.get("pid"), entry_date(entry), entry)
+            self._revisions["history"] = revision
+
+    def patient_saved(self, patient, previous_revision, revision):
+        """Re-indexes a patient just inserted or updated (a PatientTable listener)."""
+        with self._lock:
+            if self._revisions.get("patients") != previous_revision:
+                return
+            self.patients.add(patient["pid"], _patient_fingerprint(patient), _patient_terms(patient))
+            self._revisions["patients"] = revision
+
+    def search_patients(self, query, limit=20):
+        """
+        Typeahead over names, contacts and ids: every word of the query must
+        start a word of the patient's name or contact. Returns up to `limit`
+        pids, ordered by the word matching the longest query word.
+        """
+        prefixes = sorted(set(tokenize(query)), key=lambda p: (-len(p), p))
+        if not prefixes:
+            return []
+        with self._lock:
+            self._refresh()
+            # Walk the longest (usually most selective) prefix's terms in order and
+            # stop at `limit`, so broad prefixes cost no more than narrow ones
+            found = {}
+            for term in self.patients.terms_with_prefix(prefixes[0]):
+                for pid in sorted(self.patients.exact(term)):
+                    if pid not in found and all(self.patients.has_prefix(pid, p) for p in prefixes[1:]):
+                        found[pid] = None
+                        if len(found) == limit:
+                            return list(found)
+            return list(found)
+
+    def search_history(self, query, since=None, until=None, pid=None, limit=100):
+        """
+        History entries containing every term of the query, optionally only
+        dated between `since` and `until` (inclusive dates) or for one
+        patient. Returns the entries, newest first.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            self._refresh()
+            if terms:
+                postings = sorted((self.history.exact(t) for t in terms), key=len)
+                matches = set(postings[0]).intersection(*postings[1:])
+            else:
+                matches = self._entries.keys()
+            if pid is None and not (since or until):
+                return [self._entries[entry_id][2] for entry_id in nlargest(limit, matches)]
+            results = []
+            for entry_id in _newest_first(matches):
+                entry_pid, date, entry = self._entries[entry_id]
+                if pid is not None and entry_pid != pid:
+                    continue
+                if (since or until) and date is None:
+                    continue
+                if (since and date < since) or (until and date > until):
+                    continue
+                results.append(entry)
+                if len(results) == limit:
+                    break
+            return results
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+def get_search_index():
+    """Returns the process-wide search index over patients and medical history."""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = SearchIndex(get_repository(PATIENT_FILE), get_repository(HISTORY_FILE))
+            get_history_store().listeners.append(_shared_index.history_added)
+            get_patient_table().listeners.append(_shared_index.patient_saved)
+        return _shared_index
@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+from logic.events import get_event_bus
+from logic.outbox import get_outbox, outbox_message
+from models import LOW_STOCK_EVENT
+from repository import get_repository
+from storage import STAFF_FILE
+
+# Minimum time between two alerts for the same blood type
+LOW_STOCK_ALERT_COOLDOWN_SECONDS = int(os.getenv("LOW_STOCK_ALERT_COOLDOWN_SECONDS", 3600))
+# Extra alert recipients besides the admins in staff.json (comma separated)
+LOW_STOCK_ALERT_RECIPIENTS = [e.strip() for e in os.getenv("LOW_STOCK_ALERT_RECIPIENTS", "").split(",") if e.strip()]
+
+def admin_emails():
+    emails = [s["email"] for s in get_repository(STAFF_FILE).find(role="Admin") if s.get("email")]
+    return list(dict.fromkeys(emails + LOW_STOCK_ALERT_RECIPIENTS))
+
+class LowStockAlerter:
+    """
+    Subscriber for low stock events: queues a send_alert email to every
+    recipient in the outbox, at most once per blood type per cooldown.
+    """
+    def __init__(self, outbox=None, recipients=admin_emails, cooldown=LOW_STOCK_ALERT_COOLDOWN_SECONDS):
+        self.outbox = outbox
+        self.recipients = recipients
+        self.cooldown = cooldown
+        self._last_alert = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        now = time.time()
+        blood_group = event["blood_group"]
+        with self._lock:
+            if now - self._last_alert.get(blood_group, 0) < self.cooldown:
+                return
+            self._last_alert[blood_group] = now
+
+        outbox = self.outbox or get_outbox()
+        outbox.enqueue([
+            outbox_message(f"low-stock:{blood_group}:{int(now)}:{email}", "alert",
+                           blood_group=blood_group, quantity=event["units"], recipient_email=email)
+            for email in self.recipients()
+        ])
+
+_alerter = None
+_alerter_lock = threading.Lock()
+
+def enable_low_stock_alerts():
+    """Subscribes the shared alerter to low stock events (once per process)."""
+    global _alerter
+    with _alerter_lock:
+        if _alerter is None:
+            _alerter = get_event_bus().subscribe(LOW_STOCK_EVENT, LowStockAlerter())
+        return _alerter
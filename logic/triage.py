@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from datetime import datetime
+from logic.ai_cache import make_key
+from logic.ai_jobs import get_job_queue
+
+TRIAGE_BATCH_SIZE = int(os.getenv("TRIAGE_BATCH_SIZE", 8))
+TRIAGE_REQUESTS_PER_MINUTE = int(os.getenv("TRIAGE_REQUESTS_PER_MINUTE", 30))
+TRIAGE_STATUSES = ("ADMITTED", "PENDING")
+
+class RateLimiter:
+    """
+    Spaces request starts evenly so a batch run stays under a per-minute quota.
+    """
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def triage_cases(ai, cases, batch_size=TRIAGE_BATCH_SIZE, requests_per_minute=TRIAGE_REQUESTS_PER_MINUTE,
+                 progress=None, queue=None):
+    """
+    Assesses many (case_id, symptoms, history) cases. Cached answers are reused,
+    the rest are packed `batch_size` per model request and run as jobs on the
+    AI job queue (`queue`, the process-wide one by default), so they share
+    its AI_MAX_CONCURRENT_CALLS limit with consultations. Cases the model does
+    not answer get the fallback response.
+
+    Returns (results, report): results maps case_id -> assessment, report has
+    counts, timings and throughput in patients per minute.
+    """
+    started = time.time()
+    results = {}
+    pending = []
+    for case_id, symptoms, history in cases:
+        cached = ai.cache.get(make_key(symptoms, history))
+        if cached is not None:
+            results[case_id] = cached
+        else:
+            pending.append((case_id, symptoms, history))
+    cache_hits = len(results)
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    limiter = RateLimiter(requests_per_minute)
+    lock = threading.Lock()
+    fallback_ids = set()
+
+    def run_batch(batch, on_partial=None):
+        if ai.available:
+            limiter.wait()
+        answers = ai.predict_treatment_batch(batch)
+        out, answered = {}, {}
+        for case_id, symptoms, history in batch:
+            if case_id in answers:
+                answered[make_key(symptoms, history)] = answers[case_id]
+                out[case_id] = answers[case_id]
+            else:
+                out[case_id] = ai._fallback_response()
+                with lock:
+                    fallback_ids.add(case_id)
+        ai.cache.put_many(answered)
+        return out
+
+    queue = queue or get_job_queue()
+    job_ids = [queue.submit(run_batch, batch) for batch in batches]
+    for job_id in job_ids:
+        job = queue.result(job_id)
+        if job["status"] == "failed":
+            raise RuntimeError(f"Triage batch failed: {job['error']}")
+        results.update(job["result"])
+        # Reported from the calling thread, so UI callbacks are safe
+        if progress:
+            progress(len(results), len(cases))
+
+    elapsed = time.time() - started
+    report = {
+        "patients": len(cases),
+        "cache_hits": cache_hits,
+        "requests": len(batches),
+        "fallbacks": len(fallback_ids),
+        "fallback_ids": sorted(fallback_ids),
+        "seconds": round(elapsed, 2),
+        "patients_per_minute": round(len(cases) / elapsed * 60, 1) if elapsed > 0 else float(len(cases)),
+    }
+    return results, report
+
+def _symptoms_for(patient, history):
+    # Patients carry no symptom field yet, so triage on the latest recorded complaint
+    if patient.get("symptoms"):
+        return patient["symptoms"]
+    if history:
+        latest = history[-1]
+        return latest.get("diagnosis", latest.get("disease", "Routine review"))
+    return "Routine review"
+
+def run_morning_triage(patient_repo, ai, statuses=TRIAGE_STATUSES, history_store=None, **options):
+    """
+    Triages every patient in the given statuses and stores each risk level on
+    the patient record ("triage" field) in one bulk write. Fallback answers
+    are not stored, so an outage never overwrites an earlier triage.
+    Histories come from `history_store` (a HistoryStore) when given.
+    """
+    patients = [p for status in statuses for p in patient_repo.find(current_status=status)]
+    histories = history_store.entries_for(p["pid"] for p in patients) if history_store else {}
+    cases = []
+    for p in patients:
+        history = histories.get(p["pid"], p.get("medical_history") or [])
+        cases.append((p["pid"], _symptoms_for(p, history), history))
+    results, report = triage_cases(ai, cases, **options)
+
+    triaged_at = datetime.now().strftime("%Y-%m-%d %H:%M")
+    fallbacks = set(report["fallback_ids"])
+    patient_repo.update_many({
+        pid: {"triage": {"risk_level": r.get("risk_level", "Unknown"),
+                         "diagnosis": r.get("diagnosis", ""),
+                         "date": triaged_at}}
+        for pid, r in results.items() if pid not in fallbacks
+    })
+    return results, report
@@ -1,13 +1,34 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from data_manager import load_json, save_json
-from models import Patient, BloodInventory, Appointment
-from logic.ai_engine import MedicalAI
-from storage import PATIENT_FILE, STAFF_FILE, APPOINTMENT_FILE
+from repository import get_repository
+from data_manager import cache_stats, StaleRecordError, VERSION_FIELD
+from models import Patient, BloodInventory
+from logic.ai_engine import get_medical_ai, start_warm_up, ai_health
+from logic.ai_cache import get_response_cache
+from logic.triage import run_morning_triage
+from logic.outbox import get_outbox, outbox_message
+from logic.allocation import allocate, fulfil_requests
+from logic.stock_alerts import enable_low_stock_alerts
+from logic.scheduling import get_scheduler, SlotUnavailableError
+from logic.history_store import get_history_store
+from logic.patient_table import get_patient_table, PATIENT_STATUSES
+from logic.search_index import get_search_index
+from storage import PATIENT_FILE, STAFF_FILE
 from datetime import datetime
 from utils import validate_contact, validate_email
-from utils.email_service import send_alert, send_donation_request
+
+patient_repo = get_repository(PATIENT_FILE)
+staff_repo = get_repository(STAFF_FILE)
+scheduler = get_scheduler()
+# Medical history lives in its own collection and is only read when displayed
+history_store = get_history_store()
+# Columnar patient headers for the reception and admin views, updated row by row
+patient_table = get_patient_table()
+# Name/contact typeahead and history text search
+search_index = get_search_index()
+# Stock updates that cross the low stock limit email the admins in the background
+enable_low_stock_alerts()
 
 # Page Config
 st.set_page_config(page_title="Smart Hospital System", layout="wide")
@@ -76,6 +97,8 @@ menu = st.sidebar.radio("Go to:", menu_options)
 if menu == "Admin Dashboard":
     st.title("Admin Dashboard 📊")
     st.write("Manage Hospital Staff and Users")
+    stats = cache_stats()
+    st.caption(f"Record cache: {stats['hits']} hits / {stats['misses']} misses")
     
     tab1, tab2 = st.tabs(["Create User", "Manage Users"])
     
@@ -98,20 +121,17 @@ if menu == "Admin Dashboard":
             submit_user = st.form_submit_button("Create User")
             
             if submit_user:
-                # Validation
-                staff_data = load_json(STAFF_FILE)
-                
                 # Validation
                 if not validate_email(new_email):
                     st.error("Invalid Email! Must contain '@' and '.'")
                 elif not validate_contact(new_contact):
                      st.error("Invalid Contact! Must be 10 digits.")
-                elif any(u.get('email') == new_email for u in staff_data):
+                elif staff_repo.find(email=new_email):
                     st.error("Email already exists!")
                 elif not new_email or not new_password:
                      st.error("Email and Password are required.")
                 else:
-                    new_pid = max([u['pid'] for u in staff_data] + [200]) + 1
+                    new_pid = staff_repo.next_id()
                     
                     if new_role == "Doctor":
                          slots = [s.strip() for s in slots_str.split(',')]
@@ -121,18 +141,18 @@ if menu == "Admin Dashboard":
                          new_obj = Staff(new_pid, new_name, new_age, new_contact, 
                                        new_role, shift_timing, new_email, new_password)
                     
-                    staff_data.append(new_obj.to_dict())
-                    save_json(STAFF_FILE, staff_data)
+                    staff_repo.insert(new_obj.to_dict())
                     st.success(f"User {new_name} created successfully!")
 
     with tab2:
         st.subheader("Existing Users")
-        staff_data = load_json(STAFF_FILE)
+        staff_data = staff_repo.all()
         if staff_data:
             df_staff = pd.DataFrame(staff_data)
             # Mask password
             if 'password' in df_staff.columns:
                 df_staff['password'] = "****"
+            df_staff = df_staff.drop(columns=[VERSION_FIELD], errors="ignore")
             
             st.dataframe(df_staff)
             
@@ -144,13 +164,22 @@ if menu == "Admin Dashboard":
                 # Extract email from the selected string: "Name (email)"
                 email_to_remove = u_to_delete.split('(')[-1].strip(')')
                 
-                new_staff_data = [u for u in staff_data if u.get('email') != email_to_remove]
+                removed = [staff_repo.delete(u['pid']) for u in staff_repo.find(email=email_to_remove)]
                 
-                if len(new_staff_data) < len(staff_data):
-                    save_json(STAFF_FILE, new_staff_data)
+                if any(removed):
                     st.success(f"User {u_to_delete} removed.")
                     st.rerun()
 
+    # Patient overview, aggregated from the columnar patient table
+    st.divider()
+    st.subheader("🧑‍⚕️ Patient Overview")
+    status_counts = patient_table.status_counts()
+    for col, status in zip(st.columns(len(PATIENT_STATUSES)), PATIENT_STATUSES):
+        col.metric(status.title(), int(status_counts.get(status, 0)))
+    overview_status = st.selectbox("Blood groups of", ["All patients"] + list(PATIENT_STATUSES))
+    st.bar_chart(patient_table.blood_group_counts(
+        status=None if overview_status == "All patients" else overview_status))
+
     # 3. Blood Stock Alerts
     st.divider()
     st.subheader("📢 Blood Stock Alerts")
@@ -164,22 +193,50 @@ if menu == "Admin Dashboard":
         st.error(f"CRITICAL SHORTAGE DETECTED: {', '.join(low_stock_items)}")
         
         if st.button("🚀 Broadcast Donation Request to All Patients"):
-            patients_list = load_json(PATIENT_FILE)
+            patients_list = patient_repo.all()
             if not patients_list:
                 st.warning("No patients registered to broadcast to.")
             else:
-                progress_bar = st.progress(0)
-                total_ops = len(patients_list) * len(low_stock_items)
-                completed_ops = 0
-                
-                for p in patients_list:
-                    p_email = p.get('email', f"patient_{p['pid']}@hospital.com") # Fallback for POC
-                    for blood_type in low_stock_items:
-                        send_donation_request(p_email, p['name'], blood_type)
-                        completed_ops += 1
-                        progress_bar.progress(min(completed_ops / total_ops, 1.0))
-                
+                # Queued in the persistent outbox and sent in the background, so the
+                # broadcast keeps going across reruns, page refreshes and restarts
+                today = datetime.now().strftime("%Y-%m-%d")
+                broadcast_id = f"donation-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+                messages = [
+                    outbox_message(f"donation:{today}:{p['pid']}:{blood_type}", "donation_request", broadcast_id,
+                                   recipient_email=p.get('email', f"patient_{p['pid']}@hospital.com"), # Fallback for POC
+                                   patient_name=p['name'], missing_blood_type=blood_type)
+                    for p in patients_list
+                    for blood_type in low_stock_items
+                ]
+                queued = get_outbox().enqueue(messages)
+                st.session_state['broadcast_id'] = broadcast_id
+                if queued < len(messages):
+                    st.info(f"{len(messages) - queued} requests were already sent or queued today and were skipped.")
+
+    @st.fragment(run_every=2 if 'broadcast_id' in st.session_state else None)
+    def show_broadcast_progress():
+        outbox = get_outbox()
+        if 'broadcast_id' in st.session_state:
+            status = outbox.status(st.session_state['broadcast_id'])
+            if status['total']:
+                st.progress((status['sent'] + status['failed']) / status['total'])
+            if status['done']:
+                # Stop polling; the outcome is shown once after the rerun
+                del st.session_state['broadcast_id']
+                st.session_state['broadcast_result'] = status
+                st.rerun()
+        if 'broadcast_result' in st.session_state:
+            result = st.session_state.pop('broadcast_result')
+            if result['failed']:
+                st.warning(f"Broadcast finished with {result['failed']} failed deliveries.")
+            else:
                 st.success("Broadcast sent to all registered patients.")
+        status = outbox.status()
+        if status['total']:
+            st.caption(f"Outbox: {status['pending'] + status['sending']} queued, "
+                       f"{status['sent']} sent, {status['failed']} failed")
+
+    show_broadcast_progress()
 
 
 # Skeleton Logic
@@ -201,16 +258,14 @@ if menu == "Reception Desk":
                 if not validate_contact(contact):
                      st.error("Invalid Contact! Must be 10 digits.")
                 elif name and contact:
-                    # Load existing to generate ID
-                    patients_data = load_json(PATIENT_FILE)
-                    new_pid = len(patients_data) + 101 # Simple ID generation
+                    # Reserve the next ID from the persisted sequence
+                    new_pid = patient_repo.next_id()
                     
                     # Create Object
                     new_patient = Patient(new_pid, name, age, contact, blood_group)
                     
                     # Save
-                    patients_data.append(new_patient.to_dict())
-                    save_json(PATIENT_FILE, patients_data)
+                    patient_table.insert(new_patient.to_dict())
                     
                     st.success(f"Patient {name} registered successfully with ID {new_pid}!")
                 else:
@@ -218,16 +273,13 @@ if menu == "Reception Desk":
 
     # 2. Display Patients
     st.subheader("Current Patients")
-    patients_data = load_json(PATIENT_FILE)
+    patient_count = len(patient_table)
     
-    if patients_data:
-        df = pd.DataFrame(patients_data)
-        # Verify columns exist before selecting
-        cols_to_show = ["pid", "name", "blood_group", "current_status"]
-        # Filter only existing columns to avoid key errors if data is corrupted/partial
-        cols_to_show = [c for c in cols_to_show if c in df.columns]
-        
-        st.dataframe(df[cols_to_show], use_container_width=True)
+    if patient_count:
+        status_filter = st.selectbox("Show", ["All"] + list(PATIENT_STATUSES))
+        view = patient_table.filter(status=None if status_filter == "All" else status_filter,
+                                    columns=["pid", "name", "blood_group", "current_status"])
+        st.dataframe(view, use_container_width=True, hide_index=True)
     else:
         st.info("No patients registered yet.")
     
@@ -235,88 +287,106 @@ if menu == "Reception Desk":
     st.divider()
     st.subheader("Manage Patient Status")
     
-    if patients_data:
+    if patient_count:
+        # Typeahead narrows the patient pickers below instead of scrolling every patient
+        patient_query = st.text_input("Find patient (name, contact or ID)")
+        found = [patient_table.get(pid) for pid in search_index.search_patients(patient_query)]
+        patient_options = {f"{p['name']} (ID: {p['pid']})": p['pid'] for p in found if p}
+        if patient_query and not patient_options:
+            st.warning("No patient matches your search; showing everyone.")
+        if not patient_options:
+            patient_frame = patient_table.frame()
+            patient_options = {f"{name} (ID: {pid})": pid
+                               for pid, name in zip(patient_frame['pid'].tolist(), patient_frame['name'].tolist())}
         c1, c2, c3 = st.columns(3)
         with c1:
-            p_opts_status = {f"{p['name']} (ID: {p['pid']})": p['pid'] for p in patients_data}
-            sel_p_key_status = st.selectbox("Select Patient for Status Update", list(p_opts_status.keys()))
-            sel_pid_status = p_opts_status[sel_p_key_status]
+            sel_p_key_status = st.selectbox("Select Patient for Status Update", list(patient_options.keys()))
+            sel_pid_status = patient_options[sel_p_key_status]
         
         with c2:
-            current_s = next((p['current_status'] for p in patients_data if p['pid'] == sel_pid_status), "PENDING")
+            sel_patient_status = patient_table.get(sel_pid_status) or {}
+            current_s = sel_patient_status.get('current_status', "PENDING")
             new_status = st.selectbox("New Status", ["ADMITTED", "DISCHARGED", "PENDING"], index=["ADMITTED", "DISCHARGED", "PENDING"].index(current_s) if current_s in ["ADMITTED", "DISCHARGED", "PENDING"] else 2)
 
         with c3:
             st.write("") # Spacer
             st.write("")
+            # Version of the record as shown on the previous run, i.e. what the user saw
+            seen_pid, seen_version = st.session_state.get('status_seen', (None, None))
             if st.button("Update Status"):
-                # Logic to find and update
-                for p in patients_data:
-                    if p['pid'] == sel_pid_status:
-                        p['current_status'] = new_status
-                        break
-                save_json(PATIENT_FILE, patients_data)
-                st.success(f"Status updated to {new_status}")
-                st.rerun()
+                try:
+                    patient_table.update(sel_pid_status, {'current_status': new_status},
+                                        expected_version=seen_version if seen_pid == sel_pid_status else None)
+                    st.success(f"Status updated to {new_status}")
+                    st.rerun()
+                except StaleRecordError:
+                    st.error("This patient was updated by someone else. Please review and try again.")
+            st.session_state['status_seen'] = (sel_pid_status, sel_patient_status.get(VERSION_FIELD, 0))
     else:
         st.info("No patients to manage.")
 
     # 3. Schedule Appointment
     st.divider()
     with st.expander("📅 Schedule Appointment"):
-        patients_data = load_json(PATIENT_FILE)
-        staff_data = load_json(STAFF_FILE)
-        
         # Filter Doctors
-        doctors = [s for s in staff_data if s['role'] == "Doctor"]
+        doctors = staff_repo.find(role="Doctor")
         
-        if not patients_data:
+        if not patient_count:
             st.warning("No patients available to book.")
         elif not doctors:
             st.warning("No doctors available.")
         else:
-            with st.form("book_appointment"):
-                # Dropdowns
-                p_options = {f"{p['name']} (ID: {p['pid']})": p['pid'] for p in patients_data}
-                selected_p_key = st.selectbox("Select Patient", list(p_options.keys()))
-                selected_pid = p_options[selected_p_key]
-                
-                d_options = {f"{d['name']} ({d['specialization']})": d['pid'] for d in doctors}
-                selected_d_key = st.selectbox("Select Doctor", list(d_options.keys()))
-                selected_did = d_options[selected_d_key]
-                
-                # Date Time
-                appt_date = st.date_input("Date")
-                appt_time = st.time_input("Time")
-                
-                submitted_appt = st.form_submit_button("Book Appointment")
-                
-                if submitted_appt:
-                    # Create Appointment Object
-                    # ID Generation
-                    existing_appts = load_json(APPOINTMENT_FILE)
-                    new_aid = len(existing_appts) + 1001
-                    
-                    dt_str = f"{appt_date} {appt_time}"
-                    
-                    # Look up names
-                    p_name = next((p['name'] for p in patients_data if p['pid'] == selected_pid), "Unknown")
-                    d_name = next((d['name'] for d in doctors if d['pid'] == selected_did), "Unknown")
-
-                    new_appt = Appointment(
-                        appointment_id=new_aid,
-                        patient_id=selected_pid,
-                        doctor_id=selected_did,
-                        patient_name=p_name,
-                        doctor_name=d_name,
-                        time_slot=dt_str
-                    )
-                    
-                    # Save
-                    existing_appts.append(new_appt.to_dict())
-                    save_json(APPOINTMENT_FILE, existing_appts)
-                    
-                    st.success(f"Appointment booked for {p_name} with {d_name} on {dt_str}")
+            selected_p_key = st.selectbox("Select Patient", list(patient_options.keys()))
+            selected_patient = patient_table.get(patient_options[selected_p_key])
+
+            # Offer only free slots, for one doctor or for every doctor of a specialization
+            specializations = sorted({d.get('specialization') for d in doctors if d.get('specialization')})
+            search_by = st.radio("Find slots by", ["Doctor", "Specialization"], horizontal=True)
+            if search_by == "Doctor":
+                d_options = {f"{d['name']} ({d.get('specialization', 'N/A')})": d for d in doctors}
+                selected_doctor = d_options[st.selectbox("Select Doctor", list(d_options.keys()))]
+                free_slots = [(start, selected_doctor)
+                              for start in scheduler.next_free_slots(selected_doctor['pid'], n=10)]
+            else:
+                specialization = st.selectbox("Select Specialization", specializations)
+                free_slots = scheduler.next_free_slots_by_specialization(specialization, n=10)
+
+            if not free_slots:
+                st.warning("No free slots in the next few weeks.")
+            else:
+                slot_options = {f"{start:%a %d %b %Y, %H:%M} - {doctor['name']}": (start, doctor)
+                                for start, doctor in free_slots}
+                selected_slot = st.selectbox("Available Slot", list(slot_options.keys()))
+
+                if st.button("Book Appointment"):
+                    start, doctor = slot_options[selected_slot]
+                    try:
+                        appt = scheduler.book(selected_patient, doctor['pid'], start)
+                        st.success(f"Appointment booked for {appt['patient_name']} with "
+                                   f"{appt['doctor_name']} on {appt['time_slot']}")
+                    except SlotUnavailableError as e:
+                        st.error(f"{e}. Please pick another slot.")
+
+            # Clinic opening: book every waiting patient in one pass
+            st.divider()
+            pending_count = int(patient_table.status_counts().get("PENDING", 0))
+            st.write(f"{pending_count} PENDING patients")
+            # By default each patient sees a doctor of the specialization they last saw
+            auto_specialization = st.selectbox("Book with", ["Previous doctor's specialization"] + specializations)
+            if st.button("Auto-schedule PENDING Patients", disabled=not pending_count):
+                pending = sorted(patient_repo.find(current_status="PENDING"), key=lambda p: p['pid'])
+                chosen = {} if auto_specialization not in specializations \
+                    else {p['pid']: auto_specialization for p in pending}
+                with st.spinner("Scheduling..."):
+                    booked, unscheduled = scheduler.auto_schedule(pending, specializations=chosen)
+                st.success(f"Booked {len(booked)} appointments.")
+                if unscheduled:
+                    st.warning(f"No free slot in the next {scheduler.horizon_days} days for "
+                               f"{len(unscheduled)} patients: {', '.join(map(str, unscheduled))}")
+                if booked:
+                    st.dataframe(pd.DataFrame([{"Time": a['time_slot'], "Patient": a['patient_name'],
+                                                "Doctor": a['doctor_name']} for a in booked]),
+                                 use_container_width=True)
 
 elif menu == "Doctor's Cabin":
     st.title("Doctor's Cabin 🩺")
@@ -327,9 +397,46 @@ elif menu == "Doctor's Cabin":
         current_doc_id = st.session_state['user']['pid']
         st.write(f"Welcome, Dr. {st.session_state['user']['name']}")
         
+        # Connect the shared AI client in the background while the doctor reads
+        start_warm_up()
+        
+        # Morning rounds: risk levels for every admitted and pending patient
+        with st.expander("🌅 Morning Triage (all ADMITTED / PENDING patients)"):
+            if st.button("Run Triage"):
+                progress_bar = st.progress(0)
+                with st.spinner("Triaging patients..."):
+                    results, report = run_morning_triage(
+                        patient_repo, get_medical_ai(), history_store=history_store,
+                        progress=lambda done, total: progress_bar.progress(min(done / total, 1.0)))
+                st.success(f"Triaged {report['patients']} patients in {report['seconds']}s "
+                           f"({report['patients_per_minute']} patients/min, {report['requests']} AI requests, "
+                           f"{report['cache_hits']} cached, {report['fallbacks']} fallbacks)")
+                if results:
+                    st.dataframe(pd.DataFrame([
+                        {"ID": pid, "Risk": r.get("risk_level", "Unknown"), "Diagnosis": r.get("diagnosis", "")}
+                        for pid, r in results.items()
+                    ]), use_container_width=True)
+        
+        # Past diagnoses across all patients, e.g. "ili" in the last 7 days
+        with st.expander("🔎 Search Medical History"):
+            s1, s2, s3 = st.columns([2, 1, 1])
+            history_query = s1.text_input("Diagnosis or treatment terms")
+            since = s2.date_input("From", value=None)
+            until = s3.date_input("To", value=None)
+            if history_query or since or until:
+                matches = search_index.search_history(history_query, since=since, until=until)
+                if matches:
+                    st.dataframe(pd.DataFrame([
+                        {"Date": e.get('date', 'N/A'), "Patient ID": e.get('pid'),
+                         "Diagnosis": e.get('diagnosis', e.get('disease', 'Unknown')),
+                         "Treatment": e.get('treatment', e.get('details', 'N/A'))}
+                        for e in matches
+                    ]), use_container_width=True, hide_index=True)
+                else:
+                    st.info("No matching history entries.")
+        
         # Load Appointments
-        appointments = load_json(APPOINTMENT_FILE)
-        my_appointments = [a for a in appointments if a['doctor_id'] == current_doc_id and a['status'] == "Scheduled"]
+        my_appointments = scheduler.appointments(current_doc_id, status="Scheduled")
         
         if not my_appointments:
             st.info("No scheduled appointments found.")
@@ -351,8 +458,11 @@ elif menu == "Doctor's Cabin":
             st.subheader("Start Consultation")
 
             # Dropdown for Appointments
-            patients_data = load_json(PATIENT_FILE)
-            patient_map = {p['pid']: p for p in patients_data}
+            # Only the patients with an open appointment are loaded
+            patient_map = {}
+            for appt in my_appointments:
+                if appt['patient_id'] not in patient_map:
+                    patient_map[appt['patient_id']] = patient_repo.get(appt['patient_id'])
             
             appt_options = {}
             for appt in my_appointments:
@@ -378,8 +488,11 @@ elif menu == "Doctor's Cabin":
             
             # History Expander
             with st.expander(f"📂 Patient History: {selected_patient_data['name']}", expanded=False):
-                history = selected_patient_data.get("medical_history", [])
-                if history:
+                # Nothing is read until the doctor asks for it, then one page at a time
+                if st.toggle("Show history", key=f"show_history_{selected_patient_data['pid']}"):
+                    page_key = f"history_page_{selected_patient_data['pid']}"
+                    page = st.session_state.get(page_key, 0)
+                    history, has_more = history_store.page(selected_patient_data['pid'], page)
                     for entry in history:
                         # Fallback for keys
                         diagnosis = entry.get('diagnosis', entry.get('disease', 'Unknown'))
@@ -391,8 +504,16 @@ elif menu == "Doctor's Cabin":
                         if doc_id != 'Unknown':
                             st.caption(f"Dr. ID: {doc_id}")
                         st.divider()
-                else:
-                    st.info("No medical history found.")
+                    if not history:
+                        st.info("No medical history found.")
+
+                    newer_col, older_col = st.columns(2)
+                    if page > 0 and newer_col.button("⬅ Newer"):
+                        st.session_state[page_key] = page - 1
+                        st.rerun()
+                    if has_more and older_col.button("Older ➡"):
+                        st.session_state[page_key] = page + 1
+                        st.rerun()
 
             # --- Existing AI Logic (indentation adjust) ---
             
@@ -406,24 +527,56 @@ elif menu == "Doctor's Cabin":
 
 
                 symptoms = st.text_area("Symptoms", height=150)
+                bypass_cache = st.checkbox("Ask the AI again (ignore cached answer)")
+                st.caption(f"AI status: {ai_health()['status']}")
             
             if st.button("Consult AI 🤖"):
-                with st.spinner("Analyzing..."):
-                    ai = MedicalAI()
-                    # Reconstruct patient object to ensure we handle history correctly if needed, 
-                    # or just pass the raw list. Using raw list from dict is easiest.
-                    history = selected_patient_data.get("medical_history", [])
-                    result = ai.predict_treatment(symptoms, history)
-                    st.session_state['ai_result'] = result
+                # Runs on the shared AI worker pool, so the page stays usable while waiting
+                history = history_store.entries(selected_patient_data['pid'])
+                st.session_state['ai_job'] = get_medical_ai().submit_consultation(
+                    symptoms, history, use_cache=not bypass_cache, patient_id=selected_patient_data['pid'])
+                st.session_state.pop('ai_result', None)
+
+            # Polls the running consultation twice a second without rerunning the whole page
+            @st.fragment(run_every=0.5 if 'ai_job' in st.session_state else None)
+            def show_ai_progress():
+                if 'ai_job' not in st.session_state:
+                    return
+                job = get_medical_ai().job_status(st.session_state['ai_job'])
+                if job is None or job['finished_at'] is not None:
+                    del st.session_state['ai_job']
+                    if job is not None:
+                        st.session_state['ai_result'] = job['result'] or {"error": job['error'], "risk_level": "Unknown"}
+                    st.rerun()
+
+                st.info(f"🤖 Analyzing... ({job['status']})")
+                partial = job['partial']
+                if "diagnosis" in partial:
+                    st.subheader("Diagnosis")
+                    st.info(partial["diagnosis"])
+                if "risk_level" in partial:
+                    st.subheader("Risk Level")
+                    st.write(partial["risk_level"])
+                if "treatment_plan" in partial:
+                    st.subheader("Treatment Plan")
+                    st.write(partial["treatment_plan"])
+                if partial.get("suggested_rx"):
+                    st.subheader("Suggested Meds (Rx)")
+                    for rx in partial["suggested_rx"]:
+                        st.write(f"• {rx}")
 
             with col2:
                 st.subheader("Treatment Plan")
+                show_ai_progress()
                 if 'ai_result' in st.session_state:
                     result = st.session_state['ai_result']
                     
                     # Display Results
                     if "disclaimer" in result:
                         st.warning(result["disclaimer"])
+                    if result.get("from_cache"):
+                        stats = get_response_cache().stats()
+                        st.caption(f"Answered from cache ({stats['hits']} hits / {stats['misses']} misses)")
                     
                     # Parsing the result for better UI
                     try:
@@ -459,28 +612,16 @@ elif menu == "Doctor's Cabin":
                     if st.button("Finalize & Save Treatment"):
 
                         # 1. Update Patient History
-                        all_patients = load_json(PATIENT_FILE)
-                        for p in all_patients:
-                            if p['pid'] == selected_patient_data['pid']:
-                                new_record = {
-                                    "date": datetime.now().strftime("%Y-%m-%d"),
-                                    "diagnosis": result.get("diagnosis", "Consultation"),
-                                    "treatment": final_notes,
-                                    "doctor_id": current_doc_id
-                                }
-                                if "medical_history" not in p:
-                                    p["medical_history"] = []
-                                p["medical_history"].append(new_record)
-                                break
-                        save_json(PATIENT_FILE, all_patients)
+                        new_record = {
+                            "date": datetime.now().strftime("%Y-%m-%d"),
+                            "diagnosis": result.get("diagnosis", "Consultation"),
+                            "treatment": final_notes,
+                            "doctor_id": current_doc_id
+                        }
+                        history_store.append(selected_patient_data['pid'], new_record)
                         
                         # 2. Update Appointment Status
-                        all_appts = load_json(APPOINTMENT_FILE)
-                        for a in all_appts:
-                             if a['appointment_id'] == selected_appt_id:
-                                 a['status'] = "Completed"
-                                 break
-                        save_json(APPOINTMENT_FILE, all_appts)
+                        scheduler.set_status(selected_appt_id, current_doc_id, "Completed")
     
                         st.success("Treatment Saved!")
                         if 'ai_result' in st.session_state:
@@ -489,19 +630,25 @@ elif menu == "Doctor's Cabin":
 
 elif menu == "Blood Bank":
     st.title("Blood Bank 🩸")
-    # 1. Initialize Inventory (using Session State for persistence in POC)
-    if 'inventory' not in st.session_state:
-        st.session_state['inventory'] = BloodInventory()
-    
-    inventory = st.session_state['inventory']
+    # 1. Initialize Inventory (a view over the shared in-memory stock, so it is always current)
+    inventory = BloodInventory()
 
     # 2. Critical Alert
+    # Expired bags leave the stock here, which can also raise a low stock alert
+    expired = inventory.sweep_expired(user=st.session_state['user'].get('email'))
+    if expired:
+        st.warning(f"Removed expired units: {', '.join(f'{t} ({n})' for t, n in expired.items())}")
+
     low_stock = inventory.get_low_stock() # Uses NumPy boolean indexing
     if low_stock:
         st.error(f"⚠️ Low Stock Alert: {', '.join(low_stock)}")
     else:
         st.success("Stock levels are adequate.")
 
+    expiring = {t: n for t, n in inventory.expiring_soon(hours=72).items() if n}
+    if expiring:
+        st.info(f"⏳ Expiring in the next 72h: {', '.join(f'{t} ({n})' for t, n in expiring.items())}")
+
     # 3. Visualization
     
     # Matplotlib Visualization
@@ -543,10 +690,59 @@ elif menu == "Blood Bank":
             qty = st.number_input("Units to Add/Remove", min_value=-10, max_value=50, step=1)
         
         if st.button("Update Stock"):
-            success, message = inventory.update_stock(b_type, int(qty))
+            success, message = inventory.update_stock(b_type, int(qty), user=st.session_state['user'].get('email'))
             
             if success:
                 st.success(message)
                 st.rerun() # Refresh to show new graph
             else:
                 st.error(message)
+
+    # 5. Transfusion Requests
+    with st.expander("🩸 Transfusion Requests"):
+        st.caption("One row per patient. Compatible groups are used before O-, which is kept for last.")
+        requests_df = st.data_editor(
+            pd.DataFrame([{"Request": "R1", "Recipient Group": "A+", "Units": 1}]),
+            num_rows="dynamic",
+            column_config={
+                "Recipient Group": st.column_config.SelectboxColumn(options=inventory.types, required=True),
+                "Units": st.column_config.NumberColumn(min_value=1, max_value=50, step=1, required=True),
+            },
+            key="transfusion_requests",
+        )
+        requests = [(str(r["Request"]), r["Recipient Group"], int(r["Units"]))
+                    for r in requests_df.dropna().to_dict("records")]
+        allow_partial = st.checkbox("Serve requests partially when stock is short")
+
+        plan = allocate(inventory.quantities, requests, allow_partial)
+        if requests:
+            st.dataframe(pd.DataFrame([{
+                "Request": request_id,
+                "Recipient Group": group,
+                "Units": units,
+                "Allocation": ", ".join(f"{t}: {n}" for t, n in plan["allocations"].get(request_id, {}).items()) or "-",
+                "Short": plan["shortfall"].get(request_id, 0),
+            } for request_id, group, units in requests]))
+
+        if st.button("Issue Allocated Units"):
+            success, message, _ = fulfil_requests(inventory, requests, user=st.session_state['user'].get('email'),
+                                                  allow_partial=allow_partial)
+            if success:
+                st.success(message)
+                st.rerun()
+            else:
+                st.error(message)
+
+    # 6. Audit Trail
+    with st.expander("Recent Stock Movements"):
+        movements = inventory.history(limit=20)
+        if movements:
+            st.dataframe(pd.DataFrame([{
+                "Time": datetime.fromtimestamp(m["timestamp"]).strftime("%Y-%m-%d %H:%M"),
+                "Type": m["blood_group"] or "All",
+                "Change": m["qty"],
+                "Action": m["op"],
+                "User": m.get("user") or "-",
+            } for m in movements]))
+        else:
+            st.info("No stock movements recorded yet.")
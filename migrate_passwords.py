@@ -0,0 +1,23 @@
+from repository import get_repository
+from storage import STAFF_FILE, ensure_data_dir
+from utils import hash_password, is_hashed
+
+def migrate_passwords():
+    """
+    Replaces plaintext passwords in staff.json with salted hashes.
+    Safe to run repeatedly: already hashed entries are left alone.
+    """
+    ensure_data_dir()
+    
+    staff_repo = get_repository(STAFF_FILE)
+    
+    # Hash first, then write every changed user in one update
+    changes = {user["pid"]: {"password": hash_password(user["password"])}
+               for user in staff_repo.all()
+               if user.get("password") and not is_hashed(user["password"])}
+    migrated = staff_repo.update_many(changes) if changes else 0
+    
+    print(f"Migrated {migrated} plaintext password(s).")
+
+if __name__ == "__main__":
+    migrate_passwords()
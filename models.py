@@ -1,23 +1,78 @@
 import datetime
+import os
+import threading
 import numpy as np
-from data_manager import load_json, save_json
+from logic.bag_ledger import BLOOD_GROUPS
+from logic.inventory_store import get_inventory_store
+from logic.events import get_event_bus
+from repository import get_repository
 from storage import INVENTORY_FILE
-from utils import validate_contact, validate_email
+from utils import validate_contact, validate_email, hash_password, verify_password, is_hashed
+
+class Record:
+    """
+    Base for the slotted record classes. FIELDS lists the stored fields in
+    order; fields a record has that the class doesn't know (e.g. "_version",
+    "triage") are kept in `extra` so a load/save round trip preserves them.
+    """
+    __slots__ = ("extra",)
+    FIELDS = ()
+    DEFAULTS = {}
+    _field_set = frozenset()
+
+    def to_dict(self):
+        """A new dict of the stored fields; changing it doesn't touch the object."""
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data, trusted=True):
+        """
+        Builds an object from a stored record. Trusted data (already in the
+        data files) is taken as is, without re-validating or copying values;
+        pass trusted=False for outside input, which raises ValueError on
+        invalid fields.
+        """
+        obj = cls.__new__(cls)
+        defaults = cls.DEFAULTS
+        for field in cls.FIELDS:
+            setattr(obj, field, data.get(field, defaults.get(field)))
+        obj.extra = {k: v for k, v in data.items() if k not in cls._field_set} or None
+        if not trusted:
+            obj.validate()
+        return obj
+
+    def validate(self):
+        pass
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+class Person(Record):
+    __slots__ = ("pid", "name", "age", "contact")
+    FIELDS = ("pid", "name", "age", "contact")
 
-class Person:
     def __init__(self, pid, name, age, contact):
-        if not validate_contact(contact):
-            raise ValueError("Contact must be a 10-digit number")
-        
         self.pid = pid
         self.name = name
         self.age = age
         self.contact = contact
+        self.extra = None
+        Person.validate(self)
 
-    def to_dict(self):
-        return self.__dict__
+    def validate(self):
+        if not validate_contact(self.contact):
+            raise ValueError("Contact must be a 10-digit number")
 
 class Patient(Person):
+    __slots__ = ("blood_group", "medical_history", "current_status", "assigned_doctor_id")
+    # medical_history is not stored here: entries live in the history collection
+    FIELDS = Person.FIELDS + ("blood_group", "current_status", "assigned_doctor_id")
+    DEFAULTS = {"blood_group": "Unknown", "current_status": "PENDING"}
+
     def __init__(self, pid, name, age, contact, blood_group):
         super().__init__(pid, name, age, contact)
         self.blood_group = blood_group
@@ -41,28 +96,21 @@ class Patient(Person):
         self.current_status = "DISCHARGED"
 
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, trusted=True):
         """
         Reconstructs a Patient object from a dictionary.
         """
-        # 1. Create the instance using the basic constructor arguments
-        patient = cls(
-            pid=data["pid"],
-            name=data["name"],
-            age=data["age"],
-            contact=data["contact"],
-            blood_group=data.get("blood_group", "Unknown")
-        )
-        
-        # 2. Manually restore the complex/mutable attributes
-        # Use .get() with defaults to prevent errors if keys are missing
-        patient.medical_history = data.get("medical_history", [])
-        patient.current_status = data.get("current_status", "PENDING")
-        patient.assigned_doctor_id = data.get("assigned_doctor_id", None)
-        
+        patient = super().from_dict(data, trusted)
+        # Records not migrated yet may still embed their history
+        patient.medical_history = patient.extra.pop("medical_history", []) if patient.extra else []
         return patient
 
-class Appointment:
+class Appointment(Record):
+    __slots__ = ("appointment_id", "patient_id", "doctor_id", "patient_name", "doctor_name",
+                 "time_slot", "status")
+    FIELDS = __slots__
+    DEFAULTS = {"patient_name": "Unknown", "doctor_name": "Unknown", "status": "Scheduled"}
+
     def __init__(self, appointment_id, patient_id, doctor_id, patient_name, doctor_name, time_slot, status="Scheduled"):
         self.appointment_id = appointment_id
         self.patient_id = patient_id
@@ -71,23 +119,20 @@ class Appointment:
         self.doctor_name = doctor_name
         self.time_slot = time_slot
         self.status = status
-
-    def to_dict(self):
-        return self.__dict__
+        self.extra = None
 
     @classmethod
-    def from_dict(cls, data):
-        return cls(
-            appointment_id=data["appointment_id"],
-            patient_id=data["patient_id"],
-            doctor_id=data["doctor_id"],
-            patient_name=data.get("patient_name", "Unknown"),
-            doctor_name=data.get("doctor_name", "Unknown"),
-            time_slot=data.get("time_slot", data.get("date_time", "N/A")), # Fallback for old data
-            status=data.get("status", "Scheduled")
-        )
+    def from_dict(cls, data, trusted=True):
+        appointment = super().from_dict(data, trusted)
+        if appointment.time_slot is None:
+            # Fallback for old data
+            appointment.time_slot = data.get("date_time", "N/A")
+        return appointment
 
 class Staff(Person):
+    __slots__ = ("role", "shift_timing", "email", "password")
+    FIELDS = Person.FIELDS + __slots__
+
     def __init__(self, pid, name, age, contact, role, shift_timing, email, password):
         super().__init__(pid, name, age, contact)
         
@@ -97,12 +142,21 @@ class Staff(Person):
         self.role = role
         self.shift_timing = shift_timing
         self.email = email
-        self.password = password
+        # Only the salted hash is ever stored
+        self.password = password if is_hashed(password) else hash_password(password)
+
+    def validate(self):
+        super().validate()
+        if not validate_email(self.email):
+            raise ValueError("Invalid Email Format")
 
     def verify_password(self, input_password):
-        return self.password == input_password
+        return verify_password(input_password, self.password)
 
 class Doctor(Staff):
+    __slots__ = ("specialization", "available_slots")
+    FIELDS = Staff.FIELDS + __slots__
+
     def __init__(self, pid, name, age, contact, specialization, available_slots, shift_timing, email, password):
         super().__init__(pid, name, age, contact, role="Doctor", shift_timing=shift_timing, email=email, password=password)
         self.specialization = specialization
@@ -112,50 +166,144 @@ class Doctor(Staff):
         # Linking patient ID to doctor (printing confirmation as requested)
         print(f"Patient {patient_id} assigned to Doctor {self.name} ({self.pid}).")
 
+# Published when a blood type drops below the limit, and when it is restocked again
+LOW_STOCK_EVENT = "inventory.low_stock"
+RESTOCKED_EVENT = "inventory.restocked"
+# A low type only counts as restocked at limit + margin, so stock hovering
+# around the limit doesn't raise an alert on every change
+RESTOCK_MARGIN = int(os.getenv("BLOOD_RESTOCK_MARGIN", 2))
+
 class BloodInventory:
-    def __init__(self, limit=5):
-        self.types = ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"]
+    # Types currently flagged as low, shared by every inventory in the process
+    _flagged = None
+    _flag_lock = threading.Lock()
+
+    def __init__(self, limit=5, restock_margin=RESTOCK_MARGIN, store=None):
+        self.types = list(BLOOD_GROUPS)
         self.limit = limit
-        
-        # Load Existing Data
-        data = load_json(INVENTORY_FILE)
-        
-        if not data:
-            # Case 1: Empty - Use Defaults
-            self.quantities = np.array([10, 10, 10, 10, 10, 10, 10, 10]) 
-            self._save() # Initialize File
-        elif isinstance(data[0], int):
-            # Case 2: Old Format (List of Ints)
-            self.quantities = np.array(data)
-            # We will convert to new format on next save
-        else:
-            # Case 3: New Format (List of Dicts)
-            # Extract units in the correct order of self.types
-            q_list = [next((item['units'] for item in data if item['blood_group'] == t), 0) for t in self.types]
-            self.quantities = np.array(q_list)
+        self.restock_margin = restock_margin
+        # Shared, in-memory stock: building an inventory doesn't re-read any file
+        self._store = store or get_inventory_store()
+        self._repo = get_repository(INVENTORY_FILE)
+
+        if self._store.is_empty():
+            # Load Existing Data
+            data = self._repo.all()
+
+            if not data:
+                # Case 1: Empty - Use Defaults
+                counts = [10, 10, 10, 10, 10, 10, 10, 10]
+            elif isinstance(data[0], int):
+                # Case 2: Old Format (List of Ints)
+                counts = data
+            else:
+                # Case 3: New Format (List of Dicts)
+                # Extract units in the correct order of self.types
+                counts = [next((item['units'] for item in data if item['blood_group'] == t), 0) for t in self.types]
+
+            # First run with the bag ledger: every counted unit becomes a bag collected today
+            with self._store.batch():
+                if self._store.is_empty():  # unless another process got there first
+                    for blood_type, count in zip(self.types, counts):
+                        if count:
+                            self._store.receive(blood_type, int(count), user="migration")
+            self._save()
+
+        with BloodInventory._flag_lock:
+            if BloodInventory._flagged is None:
+                # Stock that is already low at startup doesn't raise a new alert
+                BloodInventory._flagged = set(self.get_low_stock())
+
+    @property
+    def quantities(self):
+        # Derived from the bag ledger: unexpired bags available per type
+        return self._store.counts()
 
     def get_low_stock(self):
         # Using boolean indexing as requested
         low_stock_indices = self.quantities < self.limit
         return [self.types[i] for i in range(len(self.types)) if low_stock_indices[i]]
 
-    def update_stock(self, blood_type, qty_change):
+    def expiring_soon(self, hours=72):
+        """Units per type that expire within `hours`."""
+        return dict(zip(self.types, self._store.ledger.expiring_within(hours).tolist()))
+
+    def history(self, limit=50):
+        """Recent stock movements (the audit trail), newest first."""
+        return self._store.history(limit)
+
+    def batch(self):
+        """Groups several stock updates into one atomic commit."""
+        return self._store.batch()
+
+    def update_stock(self, blood_type, qty_change, user=None):
         if blood_type in self.types:
-            index = self.types.index(blood_type)
-            current_qty = self.quantities[index]
-            
-            # Validation: Prevent negative stock
-            if current_qty + qty_change < 0:
-                return False, f"Error: Cannot remove {abs(qty_change)} units. Only {current_qty} available."
-            
-            self.quantities[index] += qty_change
-            self._save()
-            return True, f"Updated {blood_type} by {qty_change} units."
+            success, message = self.update_stocks({blood_type: qty_change}, user=user)
+            if success:
+                return True, f"Updated {blood_type} by {qty_change} units."
+            return False, message
         else:
             return False, f"Error: Unknown blood type {blood_type}"
 
-    def _save(self):
-        # Helper to save in the new structured format
-        save_data = [{"blood_group": t, "units": int(q)} for t, q in zip(self.types, self.quantities)]
-        save_json(INVENTORY_FILE, save_data)
+    def update_stocks(self, changes, user=None):
+        """
+        Applies {blood_type: qty_change} for several types at once: either
+        every change is made, in one commit, or none is. Inside an outer
+        batch() a failed update leaves the outer batch's other changes as
+        they were.
+        """
+        unknown = [t for t in changes if t not in self.types]
+        if unknown:
+            return False, f"Error: Unknown blood type {unknown[0]}"
 
+        try:
+            with self._store.batch():
+                current = self.quantities
+                for blood_type, qty_change in changes.items():
+                    current_qty = current[self.types.index(blood_type)]
+                    # Validation: Prevent negative stock
+                    if current_qty + qty_change < 0:
+                        return False, f"Error: Cannot remove {abs(qty_change)} units. Only {current_qty} available."
+
+                # Appends to the inventory log instead of rewriting the stock
+                for blood_type, qty_change in changes.items():
+                    if qty_change > 0:
+                        self._store.receive(blood_type, qty_change, user=user)
+                    elif qty_change < 0:
+                        # Removals issue the bags closest to expiry first
+                        self._store.issue(blood_type, -qty_change, user=user)
+        except ValueError as e:
+            return False, f"Error: {e}"
+
+        counts = self.quantities
+        for blood_type in changes:
+            self._check_threshold(blood_type, int(counts[self.types.index(blood_type)]))
+        summary = ", ".join(f"{t} {q:+d}" for t, q in changes.items())
+        return True, f"Updated stock: {summary}."
+
+    def sweep_expired(self, user=None):
+        """Marks expired bags as such and returns the number removed per type."""
+        swept = self._store.sweep(user=user)
+        if swept.any():
+            counts = self.quantities
+            for i in np.flatnonzero(swept):
+                self._check_threshold(self.types[i], int(counts[i]))
+        return {t: int(n) for t, n in zip(self.types, swept) if n}
+
+    def _check_threshold(self, blood_type, units):
+        # Only the changed type is compared, so detection is O(1) per update
+        with BloodInventory._flag_lock:
+            flagged = BloodInventory._flagged
+            if units < self.limit and blood_type not in flagged:
+                flagged.add(blood_type)
+                event = LOW_STOCK_EVENT
+            elif units >= self.limit + self.restock_margin and blood_type in flagged:
+                flagged.discard(blood_type)
+                event = RESTOCKED_EVENT
+            else:
+                return
+        get_event_bus().publish(event, blood_group=blood_type, units=units, limit=self.limit)
+
+    def _save(self):
+        # Snapshot the ledger; this also writes the counts to inventory.json in the structured format
+        self._store.snapshot()
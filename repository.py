@@ -0,0 +1,393 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from data_manager import (load_json, save_json, transaction, allocate_ids, file_revision,
+                          StaleRecordError, VERSION_FIELD)
+from storage import (PATIENT_FILE, STAFF_FILE, INVENTORY_FILE, APPOINTMENT_FILE, OUTBOX_FILE, HISTORY_FILE,
+                     SEQUENCE_FILE, SQLITE_FILE, STORAGE_BACKEND, JOURNAL_ENABLED, ALWAYS_JOURNALED,
+                     ensure_data_dir)
+
+# Collection layout: data file -> (table name, key field, secondary index fields, first id)
+COLLECTIONS = {
+    PATIENT_FILE: ("patients", "pid", ("current_status",), 101),
+    STAFF_FILE: ("staff", "pid", ("email", "role"), 201),
+    APPOINTMENT_FILE: ("appointments", "appointment_id", ("doctor_id", "status", "patient_id"), 1001),
+    INVENTORY_FILE: ("inventory", "blood_group", (), None),
+    OUTBOX_FILE: ("outbox", "key", ("status", "broadcast_id"), None),
+    HISTORY_FILE: ("history", "entry_id", ("pid",), 1),
+}
+
+
+class Repository:
+    """
+    Record store for a single collection (patients, staff, ...).
+    Records are plain dicts identified by the value of their key field.
+    """
+    def __init__(self, key_field, id_start=1):
+        self.key_field = key_field
+        self.id_start = id_start
+
+    def all(self):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def find(self, **criteria):
+        """Returns all records whose fields equal the given values."""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def insert(self, record):
+        raise NotImplementedError
+
+    def insert_many(self, records, skip_existing=False):
+        """
+        Inserts many records in one write and returns how many were added.
+        A duplicate key raises ValueError and nothing is written, unless
+        skip_existing is set, in which case records with known keys are ignored.
+        """
+        raise NotImplementedError
+
+    def update(self, key, changes, expected_version=None):
+        """
+        Merges `changes` into the record with this key. Returns False if it does not exist.
+        Raises StaleRecordError if `expected_version` is given and no longer current.
+        """
+        raise NotImplementedError
+
+    def delete(self, key, expected_version=None):
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """Deletes many records in one write. Returns how many existed."""
+        raise NotImplementedError
+
+    def update_many(self, changes_by_key):
+        """
+        Applies {key: changes} to many records in one write. Returns the number
+        of records updated; keys that do not exist are skipped.
+        """
+        raise NotImplementedError
+
+    def replace_all(self, records):
+        raise NotImplementedError
+
+    def revision(self):
+        """Returns a token that changes whenever the collection is written (by any process)."""
+        raise NotImplementedError
+
+    def allocate_ids(self, count=1):
+        """
+        Reserves `count` new keys in one call and returns them as a range.
+        Keys come from a persisted sequence, so no records need to be read.
+        """
+        raise NotImplementedError
+
+    def next_id(self):
+        return self.allocate_ids(1)[0]
+
+    def modify(self, key, compute_changes, retries=3):
+        """
+        Optimistic read-modify-write: `compute_changes(record)` returns the changes
+        to apply. If another writer updates the record in between, the record is
+        re-read and the changes recomputed, up to `retries` times.
+        """
+        for attempt in range(retries):
+            record = self.get(key)
+            if record is None:
+                return False
+            try:
+                return self.update(key, compute_changes(record),
+                                   expected_version=record.get(VERSION_FIELD, 0))
+            except StaleRecordError:
+                if attempt == retries - 1:
+                    raise
+
+
+class JSONRepository(Repository):
+    """
+    Backend over one of the flat JSON files in the data directory.
+    Reads come from the shared record cache; writes run as a locked
+    transaction that rewrites the file atomically, or in journaled mode
+    appends just the mutation to the file's write-ahead log.
+    """
+    def __init__(self, filepath, key_field, journaled=False, id_start=1):
+        super().__init__(key_field, id_start)
+        self.filepath = filepath
+        self.journaled = journaled
+        # Sequences live next to the data file they number
+        self.sequence = os.path.splitext(os.path.basename(filepath))[0]
+        self.sequence_file = os.path.join(os.path.dirname(filepath), os.path.basename(SEQUENCE_FILE))
+
+    def transaction(self):
+        return transaction(self.filepath, self.key_field, self.journaled)
+
+    def all(self):
+        return load_json(self.filepath)
+
+    def get(self, key):
+        return next((r for r in self.all() if r.get(self.key_field) == key), None)
+
+    def find(self, **criteria):
+        return [r for r in self.all()
+                if all(r.get(field) == value for field, value in criteria.items())]
+
+    def count(self):
+        return len(self.all())
+
+    def insert(self, record):
+        with self.transaction() as tx:
+            tx.insert(record)
+        return True
+
+    def insert_many(self, records, skip_existing=False):
+        inserted = 0
+        with self.transaction() as tx:
+            for record in records:
+                if skip_existing and tx.get(record[self.key_field]) is not None:
+                    continue
+                tx.insert(record)
+                inserted += 1
+        return inserted
+
+    def update(self, key, changes, expected_version=None):
+        with self.transaction() as tx:
+            return tx.update(key, changes, expected_version) is not None
+
+    def delete(self, key, expected_version=None):
+        with self.transaction() as tx:
+            return tx.delete(key, expected_version)
+
+    def delete_many(self, keys):
+        with self.transaction() as tx:
+            return sum(tx.delete(key) for key in keys)
+
+    def update_many(self, changes_by_key):
+        with self.transaction() as tx:
+            return sum(tx.update(key, changes) is not None for key, changes in changes_by_key.items())
+
+    def replace_all(self, records):
+        return save_json(self.filepath, list(records))
+
+    def revision(self):
+        return file_revision(self.filepath)
+
+    def allocate_ids(self, count=1):
+        return allocate_ids(self.sequence, count, start=self._first_free_id, sequence_file=self.sequence_file)
+
+    def _first_free_id(self):
+        # Only scanned once, when the sequence is created for existing data
+        keys = [r.get(self.key_field) for r in self.all() if isinstance(r, dict)]
+        return max([k + 1 for k in keys if isinstance(k, int)] + [self.id_start])
+
+
+class SQLiteRepository(Repository):
+    """
+    Backend storing each record as a JSON document in an SQLite table.
+    The key field is the primary key and every field in `indexes` gets an
+    expression index, so get/find/update touch only the matching rows.
+    Each table has its own revision counter in `_meta`, bumped in the same
+    transaction as every write to it, so writes to other collections in the
+    same database don't invalidate this one's derived indexes.
+    """
+    def __init__(self, db_path, table, key_field, indexes=(), seed_file=None, id_start=1):
+        super().__init__(key_field, id_start)
+        self.table = table
+        self.indexes = tuple(indexes)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+        with self._lock:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key PRIMARY KEY, doc TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sequences (name PRIMARY KEY, next_id INTEGER NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _meta (collection PRIMARY KEY, rev INTEGER NOT NULL)")
+            self._conn.execute("INSERT OR IGNORE INTO _meta (collection, rev) VALUES (?, 0)", (table,))
+            for field in self.indexes:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{field} "
+                                   f"ON {table} ({self._column(field)})")
+            empty = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+
+        # First use: import the existing JSON file so switching backends keeps the data
+        if empty and seed_file:
+            self.replace_all(r for r in load_json(seed_file) if isinstance(r, dict))
+
+    def _column(self, field):
+        if field == self.key_field:
+            return "key"
+        if not field.isidentifier():
+            raise ValueError(f"Invalid field name: {field}")
+        return f"json_extract(doc, '$.{field}')"
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _write(self):
+        # One IMMEDIATE transaction; the body calls _bump() if it changed the table
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _bump(self):
+        self._conn.execute("UPDATE _meta SET rev = rev + 1 WHERE collection = ?", (self.table,))
+
+    def all(self):
+        return [json.loads(doc) for (doc,) in self._query(f"SELECT doc FROM {self.table} ORDER BY rowid")]
+
+    def get(self, key):
+        rows = self._query(f"SELECT doc FROM {self.table} WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def find(self, **criteria):
+        if not criteria:
+            return self.all()
+        where = " AND ".join(f"{self._column(field)} = ?" for field in criteria)
+        rows = self._query(f"SELECT doc FROM {self.table} WHERE {where} ORDER BY rowid",
+                           tuple(criteria.values()))
+        return [json.loads(doc) for (doc,) in rows]
+
+    def count(self):
+        return self._query(f"SELECT COUNT(*) FROM {self.table}")[0][0]
+
+    def insert(self, record):
+        key = record[self.key_field]
+        record = {**record, VERSION_FIELD: 1}
+        try:
+            with self._write():
+                self._conn.execute(f"INSERT INTO {self.table} (key, doc) VALUES (?, ?)", (key, json.dumps(record)))
+                self._bump()
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Duplicate {self.key_field}: {key}")
+        return True
+
+    def insert_many(self, records, skip_existing=False):
+        verb = "INSERT OR IGNORE" if skip_existing else "INSERT"
+        rows = [(r[self.key_field], json.dumps({**r, VERSION_FIELD: 1})) for r in records]
+        try:
+            with self._write():
+                before = self._conn.total_changes
+                self._conn.executemany(f"{verb} INTO {self.table} (key, doc) VALUES (?, ?)", rows)
+                inserted = self._conn.total_changes - before
+                if inserted:
+                    self._bump()
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"Duplicate {self.key_field}: {e}")
+        return inserted
+
+    def _locked_read(self, key, expected_version):
+        # Inside BEGIN IMMEDIATE: returns the current record after checking its version
+        row = self._conn.execute(f"SELECT doc FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        if expected_version is not None and record.get(VERSION_FIELD, 0) != expected_version:
+            raise StaleRecordError(f"{self.key_field} {key} was modified by another user")
+        return record
+
+    def update(self, key, changes, expected_version=None):
+        with self._write():
+            record = self._locked_read(key, expected_version)
+            if record is not None:
+                record.update(changes)
+                record[VERSION_FIELD] = record.get(VERSION_FIELD, 0) + 1
+                self._conn.execute(f"UPDATE {self.table} SET doc = ? WHERE key = ?",
+                                   (json.dumps(record), key))
+                self._bump()
+        return record is not None
+
+    def delete(self, key, expected_version=None):
+        with self._write():
+            record = self._locked_read(key, expected_version)
+            if record is not None:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._bump()
+        return record is not None
+
+    def delete_many(self, keys):
+        with self._write():
+            before = self._conn.total_changes
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys])
+            deleted = self._conn.total_changes - before
+            if deleted:
+                self._bump()
+        return deleted
+
+    def update_many(self, changes_by_key):
+        updated = 0
+        with self._write():
+            for key, changes in changes_by_key.items():
+                record = self._locked_read(key, None)
+                if record is None:
+                    continue
+                record.update(changes)
+                record[VERSION_FIELD] = record.get(VERSION_FIELD, 0) + 1
+                self._conn.execute(f"UPDATE {self.table} SET doc = ? WHERE key = ?",
+                                   (json.dumps(record), key))
+                updated += 1
+            if updated:
+                self._bump()
+        return updated
+
+    def revision(self):
+        # The table's own counter: other collections' writes leave it alone
+        return self._query("SELECT rev FROM _meta WHERE collection = ?", (self.table,))[0][0]
+
+    def allocate_ids(self, count=1):
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        with self._write():
+            row = self._conn.execute("SELECT next_id FROM sequences WHERE name = ?", (self.table,)).fetchone()
+            if row is None:
+                # First allocation for existing data: continue after the largest key
+                max_key = self._conn.execute(
+                    f"SELECT MAX(key) FROM {self.table} WHERE typeof(key) = 'integer'").fetchone()[0]
+                first = max(self.id_start, (max_key or 0) + 1)
+            else:
+                first = row[0]
+            self._conn.execute("INSERT OR REPLACE INTO sequences (name, next_id) VALUES (?, ?)",
+                               (self.table, first + count))
+        return range(first, first + count)
+
+    def replace_all(self, records):
+        rows = [(r[self.key_field], json.dumps(r)) for r in records]
+        with self._write():
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.executemany(f"INSERT INTO {self.table} (key, doc) VALUES (?, ?)", rows)
+            self._bump()
+        return True
+
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+def get_repository(filepath):
+    """
+    Returns the shared repository for one of the data files in storage.py,
+    using the backend selected by STORAGE_BACKEND.
+    """
+    with _repositories_lock:
+        if filepath not in _repositories:
+            table, key_field, indexes, id_start = COLLECTIONS[filepath]
+            if STORAGE_BACKEND == "json":
+                repo = JSONRepository(filepath, key_field, id_start=id_start,
+                                      journaled=JOURNAL_ENABLED or filepath in ALWAYS_JOURNALED)
+            elif STORAGE_BACKEND == "sqlite":
+                ensure_data_dir()
+                repo = SQLiteRepository(SQLITE_FILE, table, key_field, indexes,
+                                        seed_file=filepath, id_start=id_start)
+            else:
+                raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}")
+            _repositories[filepath] = repo
+        return _repositories[filepath]
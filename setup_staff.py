@@ -1,5 +1,5 @@
 from models import Doctor
-from data_manager import save_json
+from repository import get_repository
 from storage import STAFF_FILE
 
 def setup_dummy_staff():
@@ -17,7 +17,7 @@ def setup_dummy_staff():
     )
     # Role is auto-set to "Doctor"
     
-    save_json(STAFF_FILE, [doc.to_dict()])
+    get_repository(STAFF_FILE).replace_all([doc.to_dict()])
     print("Dummy doctor added to staff.json with credentials")
 
 if __name__ == "__main__":
@@ -6,6 +6,27 @@ PATIENT_FILE = os.path.join(DATA_DIR, "patients.json")
 STAFF_FILE = os.path.join(DATA_DIR, "staff.json")
 INVENTORY_FILE = os.path.join(DATA_DIR, "inventory.json")
 APPOINTMENT_FILE = os.path.join(DATA_DIR, "appointments.json")
+SEQUENCE_FILE = os.path.join(DATA_DIR, "sequences.json")
+AI_CACHE_FILE = os.path.join(DATA_DIR, "ai_cache.json")
+AI_REPLAY_FILE = os.path.join(DATA_DIR, "ai_replay.json")
+OUTBOX_FILE = os.path.join(DATA_DIR, "outbox.json")
+BAG_LEDGER_FILE = os.path.join(DATA_DIR, "blood_bags.npz")
+INVENTORY_LOG_FILE = os.path.join(DATA_DIR, "inventory_log.jsonl")
+HISTORY_FILE = os.path.join(DATA_DIR, "history.json")
+
+# Storage backend used by repository.get_repository():
+#   "json"   - the flat files above (default)
+#   "sqlite" - a single indexed database file, seeded from the JSON files on first use
+STORAGE_BACKEND = os.getenv("HOSPITAL_STORAGE_BACKEND", "json").lower()
+SQLITE_FILE = os.path.join(DATA_DIR, "hospital.db")
+
+# Journaled mode for the JSON backend: record mutations are appended to
+# "<file>.wal" and folded back into the snapshot once the log passes the threshold
+JOURNAL_ENABLED = os.getenv("HOSPITAL_JOURNAL", "0") == "1"
+JOURNAL_COMPACT_BYTES = int(os.getenv("HOSPITAL_JOURNAL_COMPACT_BYTES", 1024 * 1024))
+# High-churn collections that are journaled even when HOSPITAL_JOURNAL is off:
+# each outbox message changes status several times on its way out
+ALWAYS_JOURNALED = (OUTBOX_FILE,)
 
 def ensure_data_dir():
     # Check if DATA_DIR exists
@@ -0,0 +1,114 @@
+from logic.ai_cache import ResponseCache
+from logic.ai_engine import MedicalAI, ModelBackend, RecordingBackend, ReplayBackend
+import logic.ai_engine as ai_engine
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+ANSWER = '{"risk_level": "Low", "diagnosis": "Cold", "treatment_plan": "Rest", "suggested_rx": [], "resources": []}'
+
+class FlakyBackend(ModelBackend):
+    """Streams the scripted prefixes and drops the connection after each, then streams ANSWER."""
+    name = "flaky"
+
+    def __init__(self, *broken):
+        self.broken = list(broken)
+
+    def stream(self, prompt, timeout):
+        if self.broken:
+            yield self.broken.pop(0)
+            raise ConnectionError("connection reset")
+        yield from (ANSWER[i:i + 7] for i in range(0, len(ANSWER), 7))
+
+class TestReplayBackend(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.replay_file = os.path.join(self.tmp.name, "ai_replay.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_ai(self, backend):
+        ai = MedicalAI(max_retries=0, backoff=0, backend=backend)
+        ai.cache = ResponseCache(os.path.join(self.tmp.name, "ai_cache.json"), save_seconds=0)
+        return ai
+
+    def test_synthetic_answers_are_deterministic(self):
+        ai = self.make_ai(ReplayBackend(self.replay_file))
+        first = ai.predict_treatment("fever", [], use_cache=False)
+        second = ai.predict_treatment("fever", [], use_cache=False)
+        self.assertEqual(first, second)
+        self.assertIn(first["risk_level"], ("Low", "Medium", "High"))
+        self.assertEqual(ai.health["backend"], "replay")
+
+    def test_stream_and_batch_use_same_backend(self):
+        ai = self.make_ai(ReplayBackend(self.replay_file, chunk_size=5))
+        fields = dict(ai.predict_treatment_stream("cough", [], use_cache=False))
+        self.assertIn("diagnosis", fields)
+
+        answers = ai.predict_treatment_batch([(101, "cough", []), (102, "rash", [])])
+        self.assertEqual(set(answers), {101, 102})
+
+    def test_injected_failures_fall_back(self):
+        ai = self.make_ai(ReplayBackend(self.replay_file, failure_rate=1.0))
+        result = ai.predict_treatment("fever", [], use_cache=False)
+        self.assertEqual(result["diagnosis"], "Service Unavailable")
+        self.assertEqual(ai.health["status"], "degraded")
+
+    def test_retry_after_dropped_stream_starts_a_fresh_parse(self):
+        ai = self.make_ai(FlakyBackend('{"risk_le'))
+        ai.max_retries = 1
+        fields = dict(ai.predict_treatment_stream("cough", [], use_cache=False))
+        self.assertEqual(fields["diagnosis"], "Cold")
+        self.assertNotIn("error", fields)
+
+    def test_failure_after_partial_output_keeps_the_fields(self):
+        ai = self.make_ai(FlakyBackend('{"risk_level": "High", "diagno'))
+        ai.max_retries = 1
+        fields = list(ai.predict_treatment_stream("cough", [], use_cache=False))
+        self.assertEqual(fields[0], ("risk_level", "High"))
+        self.assertEqual([f for f, _ in fields], ["risk_level", "error"])
+
+    def test_recorded_answers_are_replayed(self):
+        recorder = RecordingBackend(ReplayBackend(self.replay_file), self.replay_file)
+        recorded = self.make_ai(recorder).predict_treatment("fever", [], use_cache=False)
+
+        replay = ReplayBackend(self.replay_file)
+        replayed = self.make_ai(replay).predict_treatment("fever", [], use_cache=False)
+        self.assertEqual(recorded, replayed)
+        self.assertEqual(replay.stats()["replayed"], 1)
+
+class TestSharedClient(unittest.TestCase):
+    def setUp(self):
+        self.saved = (ai_engine.MedicalAI, ai_engine._client, ai_engine._warm_up_started)
+        ai_engine._client, ai_engine._warm_up_started = None, False
+        self.release = threading.Event()
+        self.built = []
+
+        def slow_client():
+            self.built.append(1)
+            self.release.wait(5)  # a slow connect
+            return MedicalAI(max_retries=0, backoff=0, backend=ModelBackend())
+        ai_engine.MedicalAI = slow_client
+
+    def tearDown(self):
+        self.release.set()
+        ai_engine.MedicalAI, ai_engine._client, ai_engine._warm_up_started = self.saved
+
+    def test_health_does_not_wait_for_connect_and_warm_up_starts_once(self):
+        for _ in range(3):
+            ai_engine.start_warm_up()
+        time.sleep(0.05)
+        started = time.perf_counter()
+        self.assertEqual(ai_engine.ai_health(), {"status": "not started"})
+        self.assertLess(time.perf_counter() - started, 0.05)
+
+        self.release.set()
+        client = ai_engine.get_medical_ai()
+        self.assertEqual(self.built, [1])
+        self.assertIs(ai_engine.get_medical_ai(), client)
+
+if __name__ == "__main__":
+    unittest.main()
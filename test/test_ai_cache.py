@@ -0,0 +1,52 @@
+from logic.ai_cache import ResponseCache, make_key, normalize_symptoms
+import os
+import tempfile
+import time
+import unittest
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "ai_cache.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_near_identical_symptoms_share_key(self):
+        history = [{"date": "2025-12-07", "diagnosis": "ILI"}]
+        self.assertEqual(normalize_symptoms("Fever,  Cough."), "cough, fever")
+        self.assertEqual(make_key("Fever, cough.", history), make_key("cough,fever", history))
+        self.assertNotEqual(make_key("fever", history), make_key("fever", []))
+
+    def test_lru_eviction_and_persistence(self):
+        cache = ResponseCache(self.path, max_entries=2)
+        cache.put("a", {"diagnosis": "A"})
+        cache.put("b", {"diagnosis": "B"})
+        cache.get("a")  # "b" is now least recently used
+        cache.put("c", {"diagnosis": "C"})
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a")["diagnosis"], "A")
+        self.assertEqual(cache.stats()["hits"], 2)
+
+        cache.flush()
+        reloaded = ResponseCache(self.path, max_entries=2)
+        self.assertEqual(reloaded.get("c")["diagnosis"], "C")
+
+    def test_expired_entries_miss(self):
+        cache = ResponseCache(self.path, ttl_seconds=0.05, save_seconds=0)
+        cache.put("a", {"diagnosis": "A"})
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_puts_are_saved_together(self):
+        cache = ResponseCache(self.path, save_seconds=0.05)
+        cache.put_many({f"k{i}": {"diagnosis": str(i)} for i in range(100)})
+        cache.put("k100", {"diagnosis": "100"})
+        self.assertFalse(os.path.exists(self.path))  # not written yet
+
+        time.sleep(0.2)
+        self.assertEqual(ResponseCache(self.path).stats()["entries"], 101)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+from logic.ai_jobs import AIJobQueue
+import threading
+import time
+import unittest
+
+class TestAIJobQueue(unittest.TestCase):
+    def test_submit_returns_immediately_and_completes(self):
+        queue = AIJobQueue(max_workers=2)
+        release = threading.Event()
+
+        def slow_consult(symptoms, on_partial=None):
+            on_partial({"diagnosis": f"Flu ({symptoms})"})
+            release.wait(5)
+            return {"diagnosis": f"Flu ({symptoms})", "risk_level": "Low"}
+
+        job_id = queue.submit(slow_consult, "fever")
+        time.sleep(0.1)
+        job = queue.status(job_id)
+        self.assertEqual(job["status"], "running")
+        self.assertEqual(job["partial"], {"diagnosis": "Flu (fever)"})
+
+        release.set()
+        job = queue.result(job_id, timeout=5)
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["result"]["risk_level"], "Low")
+
+    def test_concurrency_is_bounded(self):
+        queue = AIJobQueue(max_workers=2)
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def consult(on_partial=None):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return {}
+
+        jobs = [queue.submit(consult) for _ in range(6)]
+        for job_id in jobs:
+            queue.result(job_id, timeout=5)
+        self.assertEqual(peak[0], 2)
+
+    def test_failures_are_reported(self):
+        queue = AIJobQueue(max_workers=1)
+        def broken(on_partial=None):
+            raise RuntimeError("quota exceeded")
+        job = queue.result(queue.submit(broken), timeout=5)
+        self.assertEqual((job["status"], job["error"]), ("failed", "quota exceeded"))
+
+    def test_stream_ends_with_finished_job(self):
+        queue = AIJobQueue(max_workers=1)
+        def consult(on_partial=None):
+            on_partial({"diagnosis": "Cold"})
+            return {"diagnosis": "Cold", "risk_level": "Low"}
+        snapshots = list(queue.stream(queue.submit(consult), poll_seconds=0.05))
+        self.assertEqual(snapshots[-1]["status"], "done")
+
+if __name__ == "__main__":
+    unittest.main()
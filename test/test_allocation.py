@@ -0,0 +1,90 @@
+from logic.allocation import COMPATIBLE, allocate, compatible_donors, fulfil_requests
+from logic.bag_ledger import BLOOD_GROUPS
+from logic.inventory_store import InventoryStore
+from models import BloodInventory
+import numpy as np
+import os
+import tempfile
+import time
+import unittest
+
+def stock(**units):
+    return [units.get(g.replace("+", "_pos").replace("-", "_neg"), 0) for g in BLOOD_GROUPS]
+
+class TestAllocation(unittest.TestCase):
+    def test_compatibility_matrix(self):
+        donors = lambda r: {BLOOD_GROUPS[d] for d in np.flatnonzero(COMPATIBLE[BLOOD_GROUPS.index(r)])}
+        self.assertEqual(donors("O-"), {"O-"})
+        self.assertEqual(donors("AB+"), set(BLOOD_GROUPS))
+        self.assertEqual(donors("AB-"), {"A-", "B-", "O-", "AB-"})
+        self.assertEqual(donors("B+"), {"B+", "B-", "O+", "O-"})
+        self.assertEqual(compatible_donors("A+")[0], "A+")
+        self.assertEqual(compatible_donors("AB-")[-1], "O-")
+
+    def test_o_negative_used_last(self):
+        plan = allocate(stock(AB_neg=1, A_neg=2, O_neg=5), [("r1", "AB-", 4)])
+        self.assertEqual(plan["allocations"]["r1"], {"AB-": 1, "A-": 2, "O-": 1})
+        self.assertEqual(plan["issue"], {"A-": 2, "O-": 1, "AB-": 1})
+
+    def test_constrained_requests_served_first(self):
+        # The AB+ patient could take the O-, but the O- patient has no alternative
+        plan = allocate(stock(O_neg=2, A_pos=3), [("ab", "AB+", 4), ("o", "O-", 2)])
+        self.assertEqual(plan["allocations"]["o"], {"O-": 2})
+        self.assertEqual(plan["shortfall"], {"ab": 1})
+        self.assertNotIn("ab", plan["allocations"])
+
+        partial = allocate(stock(O_neg=2, A_pos=3), [("ab", "AB+", 4), ("o", "O-", 2)], allow_partial=True)
+        self.assertEqual(partial["allocations"]["ab"], {"A+": 3})
+
+    def test_mass_casualty_batch_is_fast(self):
+        rng = np.random.default_rng(0)
+        requests = [(i, BLOOD_GROUPS[g], int(n)) for i, (g, n) in
+                    enumerate(zip(rng.integers(0, 8, 5000), rng.integers(1, 4, 5000)))]
+        started = time.perf_counter()
+        plan = allocate([2000] * 8, requests)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertLessEqual(sum(plan["issue"].values()), 16000)
+
+class TestFulfilRequests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = InventoryStore(os.path.join(self.tmp.name, "blood_bags.npz"),
+                                    os.path.join(self.tmp.name, "inventory_log.jsonl"))
+        self.store.receive("A-", 2)
+        self.store.receive("O-", 3)
+        self.inventory = BloodInventory(store=self.store)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_issues_all_groups_in_one_commit(self):
+        success, _, plan = fulfil_requests(self.inventory, [("r1", "A+", 3)], user="doc@hospital.com")
+        self.assertTrue(success)
+        self.assertEqual(plan["issue"], {"A-": 2, "O-": 1})
+        counts = dict(zip(BLOOD_GROUPS, self.inventory.quantities))
+        self.assertEqual((counts["A-"], counts["O-"]), (0, 2))
+
+    def test_failed_multi_type_update_changes_nothing(self):
+        success, _ = self.inventory.update_stocks({"A-": -1, "O-": -9})
+        self.assertFalse(success)
+        counts = dict(zip(BLOOD_GROUPS, self.inventory.quantities))
+        self.assertEqual((counts["A-"], counts["O-"]), (2, 3))
+
+    def test_failed_update_inside_outer_batch_is_not_committed(self):
+        issue = self.store.issue
+        def short_of_o_neg(blood_group, units, **kwargs):
+            if blood_group == "O-":
+                raise ValueError("Only 0 O- units available")  # e.g. bags expired since the check
+            return issue(blood_group, units, **kwargs)
+        self.store.issue = short_of_o_neg
+
+        with self.inventory.batch():
+            self.inventory.update_stocks({"A-": 1})
+            success, _ = self.inventory.update_stocks({"A-": -2, "O-": -1})
+        self.assertFalse(success)
+        counts = dict(zip(BLOOD_GROUPS, BloodInventory(store=InventoryStore(
+            self.store.ledger_file, self.store.log_file)).quantities))
+        self.assertEqual((counts["A-"], counts["O-"]), (3, 3))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+from logic.bag_ledger import BagLedger, BLOOD_GROUPS, ISSUED, EXPIRED
+import numpy as np
+import os
+import tempfile
+import time
+import unittest
+
+DAY = 86400
+
+class TestBagLedger(unittest.TestCase):
+    def setUp(self):
+        self.ledger = BagLedger()
+        self.now = 1_000 * DAY
+        # O+ bags expiring in 1, 3 and 10 days; one A- bag that has already expired
+        for days in (10, 1, 3):
+            self.ledger.add_bags("O+", 2, collected_at=self.now - DAY, expires_at=self.now + days * DAY)
+        self.ledger.add_bags("A-", 1, collected_at=self.now - 40 * DAY, expires_at=self.now - DAY)
+
+    def test_counts_exclude_expired(self):
+        counts = self.ledger.counts(now=self.now)
+        self.assertEqual(counts[BLOOD_GROUPS.index("O+")], 6)
+        self.assertEqual(counts[BLOOD_GROUPS.index("A-")], 0)
+        self.assertEqual(self.ledger.expiring_within(72, now=self.now)[BLOOD_GROUPS.index("O+")], 4)
+
+    def test_issue_is_first_expiry_first_out(self):
+        issued = self.ledger.issue("O+", 3, now=self.now)
+        expires = self.ledger.column("expires")[issued]
+        self.assertEqual(sorted(expires), [self.now + DAY, self.now + DAY, self.now + 3 * DAY])
+        self.assertTrue((self.ledger.column("status")[issued] == ISSUED).all())
+        self.assertEqual(self.ledger.counts(now=self.now)[BLOOD_GROUPS.index("O+")], 3)
+
+        with self.assertRaises(ValueError):
+            self.ledger.issue("O+", 4, now=self.now)
+        with self.assertRaises(ValueError):
+            self.ledger.issue("A-", 1, now=self.now)
+
+    def test_sweep_marks_expired_bags(self):
+        swept = self.ledger.sweep_expired(now=self.now + 2 * DAY)
+        self.assertEqual(swept[BLOOD_GROUPS.index("O+")], 2)
+        self.assertEqual(swept[BLOOD_GROUPS.index("A-")], 1)
+        self.assertEqual(int((self.ledger.column("status") == EXPIRED).sum()), 3)
+        self.assertFalse(self.ledger.sweep_expired(now=self.now + 2 * DAY).any())
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "blood_bags.npz")
+            self.ledger.issue("O+", 1, now=self.now)
+            self.ledger.save(path)
+            loaded = BagLedger.load(path)
+            self.assertEqual(len(loaded), len(self.ledger))
+            np.testing.assert_array_equal(loaded.counts(now=self.now), self.ledger.counts(now=self.now))
+
+    def test_queries_stay_fast_at_scale(self):
+        ledger = BagLedger()
+        rng = np.random.default_rng(0)
+        for code, group in enumerate(BLOOD_GROUPS):
+            for offset in rng.integers(0, 42 * DAY, 40):
+                ledger.add_bags(group, 1000, collected_at=self.now, expires_at=self.now + int(offset))
+        ledger.counts(now=self.now)  # builds the index
+
+        started = time.perf_counter()
+        for _ in range(100):
+            ledger.counts(now=self.now)
+            ledger.expiring_within(72, now=self.now)
+        self.assertLess((time.perf_counter() - started) / 100, 0.005)
+
+if __name__ == "__main__":
+    unittest.main()
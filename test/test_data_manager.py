@@ -0,0 +1,130 @@
+from data_manager import (load_json, save_json, append_mutation, compact_journal, journal_path, cache_stats,
+                          replay_mutations)
+from repository import JSONRepository
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+def _increment_visits(path, times):
+    repo = JSONRepository(path, "pid")
+    for _ in range(times):
+        repo.modify(101, lambda r: {"visits": r.get("visits", 0) + 1}, retries=100)
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "patients.json")
+        save_json(self.path, [{"pid": 101, "name": "Ann", "current_status": "PENDING"}])
+        self.repo = JSONRepository(self.path, "pid", journaled=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_mutations_replay_over_snapshot(self):
+        self.repo.insert({"pid": 102, "name": "Bob", "current_status": "PENDING"})
+        self.repo.update(101, {"current_status": "ADMITTED"})
+        self.repo.delete(102)
+
+        # The snapshot itself is untouched, the log carries the changes
+        with open(self.path) as f:
+            self.assertIn("PENDING", f.read())
+        self.assertEqual([(r["pid"], r["current_status"]) for r in load_json(self.path)], [(101, "ADMITTED")])
+
+    def test_torn_entry_is_skipped(self):
+        self.repo.update(101, {"current_status": "ADMITTED"})
+        with open(journal_path(self.path), 'a') as f:
+            f.write('{"op": "update", "key_fi')  # crash mid-append
+        append_mutation(self.path, {"op": "update", "key_field": "pid", "key": 101, "changes": {"age": 40}})
+
+        record = load_json(self.path)[0]
+        self.assertEqual(record["current_status"], "ADMITTED")
+        self.assertEqual(record["age"], 40)
+
+    def test_compaction_folds_log_into_snapshot(self):
+        self.repo.insert({"pid": 102, "name": "Bob"})
+        compact_journal(self.path)
+        self.assertFalse(os.path.exists(journal_path(self.path)))
+        self.assertEqual([r["pid"] for r in load_json(self.path)], [101, 102])
+
+    def test_replay_is_one_pass(self):
+        records = [{"pid": i} for i in range(20000)]
+        mutations = [{"op": "update", "key_field": "pid", "key": i, "changes": {"seen": True}}
+                     for i in range(0, 20000, 2)]
+        mutations += [{"op": "delete", "key_field": "pid", "key": 1},
+                      {"op": "update", "key_field": "pid", "key": 1, "changes": {"seen": True}},
+                      {"op": "insert", "key_field": "pid", "key": 1, "record": {"pid": 1, "back": True}},
+                      {"op": "delete", "key_field": "pid", "key": 3}]
+        started = time.perf_counter()
+        replay_mutations(records, mutations)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(len(records), 19999)
+        self.assertEqual(records[-1], {"pid": 1, "back": True})
+        self.assertEqual(sum(r.get("seen", False) for r in records), 10000)
+        self.assertNotIn(3, [r["pid"] for r in records])
+
+    def test_journaled_writes_do_not_copy_the_file(self):
+        save_json(self.path, [{"pid": i, "name": f"P{i}"} for i in range(50000)])
+        self.repo.update(0, {"visits": 1})  # first write after the snapshot builds the key map
+
+        started = time.perf_counter()
+        for i in range(1, 201):
+            self.repo.update(i, {"visits": 1})
+        self.repo.delete(50)
+        self.repo.insert({"pid": 50000, "name": "New"})
+        self.assertLess((time.perf_counter() - started) / 202, 0.005)
+
+        records = load_json(self.path)
+        self.assertEqual(len(records), 50000)
+        self.assertEqual(sum("visits" in r for r in records), 200)
+        self.assertEqual(self.repo.get(50000)["name"], "New")
+
+class TestRecordCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "staff.json")
+        save_json(self.path, [{"pid": 201, "name": "Dr. Smith"}])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_repeated_loads_hit(self):
+        before = cache_stats()
+        load_json(self.path)
+        load_json(self.path)
+        after = cache_stats()
+        self.assertEqual(after["hits"] - before["hits"], 2)
+        self.assertEqual(after["misses"], before["misses"])
+
+    def test_external_write_invalidates(self):
+        load_json(self.path)
+        # Another process rewrites the file behind our back
+        with open(self.path, 'w') as f:
+            f.write('[{"pid": 202, "name": "Dr. Jones", "role": "Doctor"}]')
+        self.assertEqual(load_json(self.path)[0]["pid"], 202)
+
+    def test_callers_cannot_alias_cache(self):
+        data = load_json(self.path)
+        data.append({"pid": 999})
+        self.assertEqual(len(load_json(self.path)), 1)
+
+class TestConcurrentWrites(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "patients.json")
+        save_json(self.path, [{"pid": 101, "name": "Ann"}])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_no_lost_updates_across_processes(self):
+        workers = [multiprocessing.Process(target=_increment_visits, args=(self.path, 20)) for _ in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        self.assertEqual(load_json(self.path)[0]["visits"], 80)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+from logic.history import HistoryCompactor, estimate_tokens
+import unittest
+
+def make_history(count):
+    return [{"date": f"2025-01-{i % 28 + 1:02d}",
+             "diagnosis": f"Condition {i}. Follow-up advised.",
+             "details": "Long clinical note. " * 200,
+             "treatment": "Rest and fluids. " * 100} for i in range(count)]
+
+class TestHistoryCompactor(unittest.TestCase):
+    def test_prompt_stays_within_budget(self):
+        compactor = HistoryCompactor(token_budget=400, recent_entries=2)
+        for count in (3, 30, 300):
+            text = compactor.compact(make_history(count), patient_id=count)
+            self.assertLessEqual(estimate_tokens(text), 400 * 1.1)
+            self.assertIn("Condition", text)
+
+    def test_recent_entries_verbatim_older_summarized(self):
+        compactor = HistoryCompactor(token_budget=800, recent_entries=1)
+        history = [{"date": "2025-01-01", "diagnosis": "Flu. Mild."},
+                   {"date": "2025-02-01", "diagnosis": "Sprain", "details": "Left ankle"}]
+        text = compactor.compact(history, patient_id=101)
+        self.assertIn("- 2025-01-01: Flu", text)
+        self.assertIn('"details": "Left ankle"', text)
+
+    def test_summary_extended_incrementally(self):
+        compactor = HistoryCompactor(token_budget=800, recent_entries=2)
+        history = make_history(10)
+        compactor.compact(history, patient_id=101)
+        self.assertEqual(compactor.entries_summarized, 8)
+
+        # One appended visit only pushes one entry into the summary
+        history.append(make_history(1)[0])
+        compactor.compact(history, patient_id=101)
+        self.assertEqual(compactor.entries_summarized, 9)
+        self.assertEqual(compactor.summaries_reused, 1)
+
+        # A rewritten history is summarized from scratch
+        compactor.compact(make_history(5)[::-1], patient_id=101)
+        self.assertEqual(compactor.entries_summarized, 12)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+from logic.history_store import HistoryStore
+from logic.triage import run_morning_triage
+from repository import JSONRepository
+from models import Patient
+import json
+import os
+import tempfile
+import unittest
+
+class FakeAI:
+    available = True
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.cases = []
+
+    def predict_treatment_batch(self, cases):
+        self.cases.extend(cases)
+        return {case_id: {"risk_level": "Low", "diagnosis": symptoms} for case_id, symptoms, _ in cases}
+
+class NoCache:
+    def get(self, key):
+        return None
+
+    def put(self, key, value):
+        pass
+
+    def put_many(self, responses):
+        pass
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patient_file = os.path.join(self.tmp.name, "patients.json")
+        with open(patient_file, 'w') as f:
+            json.dump([
+                {"pid": 101, "name": "Ann", "current_status": "PENDING",
+                 "medical_history": [{"date": f"2025-01-0{i}", "disease": f"Flu {i}", "details": "Rest"}
+                                     for i in range(1, 8)]},
+                {"pid": 102, "name": "Bob", "current_status": "ADMITTED", "medical_history": []},
+            ], f)
+        self.patients = JSONRepository(patient_file, "pid", id_start=101)
+        self.history = JSONRepository(os.path.join(self.tmp.name, "history.json"), "entry_id")
+        self.store = HistoryStore(self.history, self.patients)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_migration_moves_history_out_of_patient_records(self):
+        self.assertEqual(self.store.migrate(), 7)
+        self.assertTrue(all("medical_history" not in p for p in self.patients.all()))
+        self.assertEqual([e["disease"] for e in self.store.entries(101)], [f"Flu {i}" for i in range(1, 8)])
+        self.assertEqual(self.store.entries(101)[0], {"date": "2025-01-01", "disease": "Flu 1", "details": "Rest"})
+        # Nothing left to move, and an interrupted run doesn't duplicate entries
+        self.assertEqual(self.store.migrate(), 0)
+        self.patients.update(101, {"medical_history": [{"disease": "Flu 1"}]})
+        self.assertEqual(self.store.migrate(), 0)
+        self.assertEqual(self.history.count(), 7)
+
+    def test_pages_are_newest_first(self):
+        self.store.migrate()
+        self.store.append(101, {"date": "2025-02-01", "diagnosis": "Checkup", "doctor_id": 201})
+
+        first, more = self.store.page(101, 0, page_size=5)
+        self.assertEqual([e.get("diagnosis", e.get("disease")) for e in first],
+                         ["Checkup", "Flu 7", "Flu 6", "Flu 5", "Flu 4"])
+        self.assertTrue(more)
+        last, more = self.store.page(101, 1, page_size=5)
+        self.assertEqual([e["disease"] for e in last], ["Flu 3", "Flu 2", "Flu 1"])
+        self.assertFalse(more)
+        self.assertEqual(self.store.page(102), ([], False))
+
+    def test_pages_come_from_the_index(self):
+        self.history.insert_many([{"entry_id": i, "pid": 200 + i % 50, "disease": f"D{i}"} for i in range(1, 5001)])
+        self.assertEqual(self.store.page(201, 0, page_size=2)[0][0]["disease"], "D4951")
+
+        scans = []
+        all_records = self.history.all
+        self.history.all = lambda: scans.append(1) or all_records()
+        # next_id() also creates the id sequence, which scans the ids once
+        self.history.insert({"entry_id": self.history.next_id(), "pid": 201, "disease": "Other writer"})
+        self.store.append(201, {"disease": "Own"})
+        for page in range(100):
+            self.store.page(201, page)
+        # The sequence scan plus one reload of patient 201 after the other writer's
+        # entry; our own append and the pages need none
+        self.assertEqual(len(scans), 2)
+        self.assertEqual([e["disease"] for e in self.store.page(201, 0, page_size=3)[0]],
+                         ["Own", "Other writer", "D4951"])
+
+    def test_cache_keeps_recent_patients(self):
+        self.history.insert_many([{"entry_id": i, "pid": 200 + i % 5, "disease": f"D{i}"} for i in range(1, 51)])
+        store = HistoryStore(self.history, self.patients, cache_size=2)
+        finds = []
+        find = self.history.find
+        self.history.find = lambda **criteria: finds.append(criteria["pid"]) or find(**criteria)
+        for pid in (201, 202, 201, 203, 201, 202):
+            self.assertEqual(len(store.entries(pid)), 10)
+        self.assertEqual(finds, [201, 202, 203, 202])
+        self.assertEqual(list(store._by_pid), [201, 202])
+
+    def test_new_patients_are_saved_without_history(self):
+        self.assertNotIn("medical_history", Patient(103, "Cy", 30, "5550199123", "O+").to_dict())
+
+    def test_triage_reads_history_from_the_store(self):
+        self.store.migrate()
+        ai = FakeAI(NoCache())
+        run_morning_triage(self.patients, ai, history_store=self.store, requests_per_minute=0)
+        cases = {case_id: (symptoms, history) for case_id, symptoms, history in ai.cases}
+        self.assertEqual(cases[101][0], "Flu 7")
+        self.assertEqual(len(cases[101][1]), 7)
+        self.assertEqual(cases[102], ("Routine review", []))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+from logic.bag_ledger import BLOOD_GROUPS
+from logic.inventory_store import InventoryStore
+from data_manager import read_log
+from repository import JSONRepository
+import os
+import tempfile
+import unittest
+
+O_POS = BLOOD_GROUPS.index("O+")
+
+class TestInventoryStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger_file = os.path.join(self.tmp.name, "blood_bags.npz")
+        self.log_file = os.path.join(self.tmp.name, "inventory_log.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_store(self, **options):
+        return InventoryStore(self.ledger_file, self.log_file, **options)
+
+    def test_changes_are_logged_and_replayed(self):
+        store = self.make_store()
+        store.receive("O+", 5, user="nurse@hospital.com")
+        store.issue("O+", 2, user="doctor@hospital.com")
+
+        self.assertFalse(os.path.exists(self.ledger_file))  # no snapshot yet, only the log
+        entries = read_log(self.log_file)
+        self.assertEqual([(e["op"], e["qty"], e["user"]) for e in entries],
+                         [("receive", 5, "nurse@hospital.com"), ("issue", -2, "doctor@hospital.com")])
+
+        # Another process sees the same stock by replaying the log
+        self.assertEqual(self.make_store().counts()[O_POS], 3)
+        self.assertEqual(store.history(limit=1)[0]["op"], "issue")
+
+    def test_periodic_snapshot_bounds_replay(self):
+        counts_repo = JSONRepository(os.path.join(self.tmp.name, "inventory.json"), "blood_group")
+        store = self.make_store(snapshot_every=3, counts_repo=counts_repo)
+        for _ in range(4):
+            store.receive("O+", 1)
+
+        other = self.make_store()
+        self.assertEqual(other.counts()[O_POS], 4)
+        self.assertEqual(other._unsnapshotted, 1)  # only the delta after the snapshot was replayed
+        self.assertEqual(counts_repo.get("O+")["units"], 3)
+        self.assertEqual(len(read_log(self.log_file)), 4)  # the audit trail is kept
+
+    def test_batch_commits_once_or_not_at_all(self):
+        store = self.make_store()
+        with store.batch():
+            store.receive("A+", 2)
+            store.receive("B+", 3)
+        self.assertEqual(len(read_log(self.log_file)), 2)
+
+        with self.assertRaises(ValueError):
+            with store.batch():
+                store.receive("A+", 10)
+                store.issue("B+", 99)
+        self.assertEqual(len(read_log(self.log_file)), 2)
+        self.assertEqual(store.counts()[BLOOD_GROUPS.index("A+")], 2)
+
+    def test_failed_nested_batch_only_undoes_its_own_changes(self):
+        store = self.make_store()
+        store.receive("B+", 3)
+        with store.batch():
+            store.receive("A+", 2)
+            with self.assertRaises(ValueError):
+                with store.batch():
+                    store.receive("O+", 5)
+                    store.issue("B+", 99)
+            store.issue("B+", 1)
+
+        self.assertEqual([(e["op"], e["blood_group"]) for e in read_log(self.log_file)],
+                         [("receive", "B+"), ("receive", "A+"), ("issue", "B+")])
+        counts = self.make_store().counts()
+        self.assertEqual([counts[BLOOD_GROUPS.index(g)] for g in ("A+", "B+", "O+")], [2, 2, 0])
+        self.assertEqual(store.counts().tolist(), counts.tolist())
+
+if __name__ == "__main__":
+    unittest.main()
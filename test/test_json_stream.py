@@ -0,0 +1,41 @@
+from logic.json_stream import JSONObjectStream
+import json
+import unittest
+
+RESPONSE = '''```json
+{
+  "risk_level": "Medium",
+  "diagnosis": "Influenza-like illness, \\"ILI\\" {viral}",
+  "treatment_plan": "Rest, fluids.",
+  "suggested_rx": ["Paracetamol 500mg", "Saline spray, as needed"],
+  "resources": [],
+  "severity_score": 4
+}
+```'''
+
+class TestJSONObjectStream(unittest.TestCase):
+    def test_fields_complete_in_order(self):
+        parser = JSONObjectStream()
+        seen = []
+        for i in range(0, len(RESPONSE), 7):
+            seen.extend(parser.feed(RESPONSE[i:i + 7]).keys())
+
+        self.assertTrue(parser.done)
+        self.assertEqual(seen, ["risk_level", "diagnosis", "treatment_plan",
+                                "suggested_rx", "resources", "severity_score"])
+        expected = json.loads(RESPONSE.replace("```json", "").replace("```", ""))
+        self.assertEqual(parser.fields, expected)
+
+    def test_field_is_emitted_only_once_complete(self):
+        parser = JSONObjectStream()
+        self.assertEqual(parser.feed('{"risk_level": "Hi'), {})
+        self.assertEqual(parser.feed('gh", "diagnosis": "Pneu'), {"risk_level": "High"})
+        self.assertEqual(parser.feed('monia"}'), {"diagnosis": "Pneumonia"})
+
+    def test_number_waits_for_delimiter(self):
+        parser = JSONObjectStream()
+        self.assertEqual(parser.feed('{"score": 12'), {})
+        self.assertEqual(parser.feed('3}'), {"score": 123})
+
+if __name__ == "__main__":
+    unittest.main()
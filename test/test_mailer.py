@@ -0,0 +1,94 @@
+from utils.email_service import Mailer, SMTPPool, build_alert, build_donation_request
+import smtplib
+import threading
+import unittest
+
+class FakeSession:
+    """Records sent messages; drops the connection after `drop_after` sends."""
+    def __init__(self, server, drop_after=None):
+        self.server = server
+        self.drop_after = drop_after
+        self.sent = 0
+
+    def send_message(self, msg):
+        if self.drop_after is not None and self.sent >= self.drop_after:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        if msg['To'] in self.server.rejected:
+            raise smtplib.SMTPRecipientsRefused({msg['To']: (550, b"No such user")})
+        self.sent += 1
+        with self.server.lock:
+            self.server.delivered.append(msg['To'])
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        pass
+
+class FakeServer:
+    def __init__(self, drop_after=None, rejected=()):
+        self.drop_after = drop_after
+        self.rejected = set(rejected)
+        self.delivered = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        return FakeSession(self, self.drop_after)
+
+class TestMailer(unittest.TestCase):
+    def test_send_many_reuses_sessions(self):
+        server = FakeServer()
+        pool = SMTPPool(size=3, connect=server.connect)
+        mailer = Mailer(pool, batch_size=50)
+        messages = [build_donation_request(f"p{i}@example.com", f"Patient {i}", "O-") for i in range(1000)]
+
+        seen = []
+        report = mailer.send_many(messages, progress=lambda done, total: seen.append(done))
+
+        self.assertEqual(report["sent"], 1000)
+        self.assertEqual(report["failed"], 0)
+        self.assertEqual(len(server.delivered), 1000)
+        self.assertLessEqual(pool.connections_opened, 3)
+        self.assertEqual(seen[-1], 1000)
+        self.assertGreater(report["messages_per_second"], 0)
+
+    def test_reconnects_after_dropped_session(self):
+        server = FakeServer(drop_after=10)
+        mailer = Mailer(SMTPPool(size=1, connect=server.connect), batch_size=25)
+        report = mailer.send_many([build_alert("O-", 2, f"a{i}@example.com") for i in range(25)])
+
+        self.assertEqual(report["sent"], 25)
+        self.assertEqual(mailer.pool.connections_opened, 3)
+
+    def test_rejected_recipients_are_reported(self):
+        server = FakeServer(rejected={"bad@example.com"})
+        mailer = Mailer(SMTPPool(size=2, connect=server.connect))
+        messages = [build_alert("A+", 3, "ok@example.com"), build_alert("A+", 3, "bad@example.com")]
+        report = mailer.send_many(messages)
+
+        self.assertEqual(report["sent"], 1)
+        self.assertEqual(report["failed_recipients"], ["bad@example.com"])
+        self.assertEqual(report["failed_indices"], [1])
+        self.assertFalse(mailer.send(messages[1]))
+
+    def test_rejected_recipient_does_not_fail_the_rest_of_the_batch(self):
+        server = FakeServer(rejected={"bad@example.com"})
+        mailer = Mailer(SMTPPool(size=1, connect=server.connect), batch_size=10)
+        messages = [build_alert("A+", 3, "bad@example.com")] + \
+            [build_alert("A+", 3, f"ok{i}@example.com") for i in range(5)]
+        report = mailer.send_many(messages)
+
+        self.assertEqual(report["sent"], 5)
+        self.assertEqual(report["failed_indices"], [0])
+        self.assertEqual(len(server.delivered), 5)
+        self.assertEqual(mailer.pool.connections_opened, 1)  # no reconnect for a refusal
+
+    def test_unreachable_server_fails_without_raising(self):
+        def refuse():
+            raise ConnectionRefusedError("Connection refused")
+        mailer = Mailer(SMTPPool(size=2, connect=refuse))
+        report = mailer.send_many([build_alert("B-", 1, "x@example.com")] * 5)
+        self.assertEqual(report["failed"], 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+from models import Patient, Appointment, Doctor
+import time
+import tracemalloc
+import unittest
+
+PATIENT = {"pid": 101, "name": "dt", "age": 10, "contact": "555-0199", "blood_group": "AB+",
+           "current_status": "ADMITTED", "assigned_doctor_id": None,
+           "triage": {"risk_level": "Low"}, "_version": 4}
+
+class TestRecords(unittest.TestCase):
+    def test_round_trip_keeps_unknown_fields(self):
+        patient = Patient.from_dict(PATIENT)
+        self.assertEqual(patient.to_dict(), PATIENT)
+        self.assertFalse(hasattr(patient, "__dict__"))
+
+    def test_to_dict_returns_a_copy(self):
+        patient = Patient(102, "Bob", 40, "1234567890", "O+")
+        data = patient.to_dict()
+        data["current_status"] = "ADMITTED"
+        self.assertEqual(patient.current_status, "PENDING")
+        self.assertNotIn("medical_history", data)
+
+    def test_trusted_load_skips_validation(self):
+        # Legacy contact formats already in the data files still load
+        self.assertEqual(Patient.from_dict(PATIENT).contact, "555-0199")
+        with self.assertRaises(ValueError):
+            Patient.from_dict(PATIENT, trusted=False)
+        with self.assertRaises(ValueError):
+            Doctor.from_dict({"pid": 1, "contact": "1234567890", "email": "nope"}, trusted=False)
+
+    def test_defaults_and_legacy_fields(self):
+        patient = Patient.from_dict({"pid": 1, "name": "A", "age": 3, "contact": "1234567890",
+                                     "medical_history": [{"disease": "Flu"}]})
+        self.assertEqual((patient.blood_group, patient.current_status), ("Unknown", "PENDING"))
+        self.assertEqual(patient.medical_history, [{"disease": "Flu"}])
+        self.assertNotIn("medical_history", patient.to_dict())
+
+        appointment = Appointment.from_dict({"appointment_id": 1001, "patient_id": 101, "doctor_id": 201,
+                                             "date_time": "2025-12-07 17:03:00", "status": "Completed"})
+        self.assertEqual((appointment.time_slot, appointment.patient_name), ("2025-12-07 17:03:00", "Unknown"))
+
+    def test_loading_100k_patients(self):
+        records = [dict(PATIENT, pid=i, name=f"Patient {i}") for i in range(100_000)]
+        started = time.perf_counter()
+        patients = [Patient.from_dict(r) for r in records]
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+        tracemalloc.start()
+        patients = [Patient.from_dict(r) for r in records]
+        per_object = tracemalloc.get_traced_memory()[0] / len(patients)
+        tracemalloc.stop()
+        # Values are shared with the parsed records: each object adds ~100 bytes
+        # of slots plus the dict of fields it doesn't know ("triage", "_version")
+        self.assertLess(per_object, 512)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+from logic.outbox import Outbox, outbox_message
+from data_manager import compact_journal
+from repository import JSONRepository
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+class FakeMailer:
+    """Fails every message to a recipient in `failing`."""
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.delivered = []
+
+    def send_many(self, messages):
+        failed = []
+        for i, msg in enumerate(messages):
+            if msg['To'] in self.failing:
+                failed.append(i)
+            else:
+                self.delivered.append(msg['To'])
+        return {"sent": len(self.delivered), "failed": len(failed), "failed_indices": failed,
+                "errors": ["550 rejected"] * len(failed)}
+
+def donation(pid, blood_type="O-", broadcast_id="b1"):
+    return outbox_message(f"donation:{pid}:{blood_type}", "donation_request", broadcast_id,
+                          recipient_email=f"p{pid}@example.com", patient_name=f"P{pid}",
+                          missing_blood_type=blood_type)
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = JSONRepository(os.path.join(self.tmp.name, "outbox.json"), "key")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_enqueue_deduplicates(self):
+        outbox = Outbox(self.repo, FakeMailer())
+        self.assertEqual(outbox.enqueue([donation(1), donation(2)]), 2)
+        self.assertEqual(outbox.enqueue([donation(2), donation(3)]), 1)
+        self.assertEqual(outbox.status("b1")["pending"], 3)
+
+    def test_drain_sends_and_retries_with_backoff(self):
+        mailer = FakeMailer(failing={"p2@example.com"})
+        outbox = Outbox(self.repo, mailer, max_attempts=2, backoff=0.05)
+        outbox.enqueue([donation(1), donation(2)])
+
+        self.assertEqual(outbox.drain_once(), 2)
+        status = outbox.status("b1")
+        self.assertEqual((status["sent"], status["pending"]), (1, 1))
+        self.assertEqual(self.repo.get("donation:2:O-")["last_error"], "550 rejected")
+
+        # Not due again until the backoff has passed
+        self.assertEqual(outbox.drain_once(), 0)
+        time.sleep(0.06)
+        self.assertEqual(outbox.drain_once(), 1)
+        status = outbox.status("b1")
+        self.assertEqual((status["sent"], status["failed"], status["done"]), (1, 1, True))
+
+    def test_background_sender_resumes_claimed_messages(self):
+        outbox = Outbox(self.repo, FakeMailer(), poll_seconds=0.01)
+        outbox.enqueue([donation(pid) for pid in range(50)])
+        # As if a previous process claimed some messages and died
+        self.repo.update_many({"donation:1:O-": {"status": "sending"}})
+
+        outbox.start()
+        deadline = time.time() + 5
+        while not outbox.status("b1")["done"] and time.time() < deadline:
+            time.sleep(0.01)
+        outbox.stop(timeout=1)
+        self.assertEqual(outbox.status("b1")["sent"], 50)
+
+    def test_concurrent_senders_claim_each_message_once(self):
+        mailer = FakeMailer()
+        file = os.path.join(self.tmp.name, "outbox.json")
+        senders = [Outbox(JSONRepository(file, "key"), mailer, claim_size=7) for _ in range(4)]
+        senders[0].enqueue([donation(pid) for pid in range(60)])
+
+        def drain(outbox):
+            while outbox.drain_once():
+                pass
+        threads = [threading.Thread(target=drain, args=(outbox,)) for outbox in senders]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(mailer.delivered), sorted(f"p{pid}@example.com" for pid in range(60)))
+        self.assertEqual(senders[0].status("b1")["sent"], 60)
+
+    def test_live_claims_are_left_alone(self):
+        outbox = Outbox(self.repo, FakeMailer())
+        outbox.enqueue([donation(1), donation(2)])
+        other = Outbox(self.repo, FakeMailer())
+        self.repo.update_many({"donation:1:O-": {"status": "sending", "claimed_by": other.claimer_id,
+                                                 "lease_expires_at": time.time() + 60},
+                               "donation:2:O-": {"status": "sending", "claimed_by": other.claimer_id,
+                                                 "lease_expires_at": time.time() - 1}})
+        # Only the expired claim is taken over
+        self.assertEqual(outbox.drain_once(), 1)
+        self.assertEqual(self.repo.get("donation:1:O-")["claimed_by"], other.claimer_id)
+        self.assertEqual(self.repo.get("donation:2:O-")["status"], "sent")
+
+    def test_drained_messages_are_journaled_and_pruned(self):
+        file = os.path.join(self.tmp.name, "journaled.json")
+        repo = JSONRepository(file, "key", journaled=True)
+        mailer = FakeMailer()
+        outbox = Outbox(repo, mailer, claim_size=20, retention_seconds=0)
+
+        sizes = []
+        for round in range(5):
+            outbox.enqueue([donation(pid) for pid in range(round * 100, round * 100 + 100)])
+            compact_journal(file)
+            snapshot = os.stat(file).st_mtime_ns
+            while outbox.drain_once():
+                pass
+            # Claims, outcomes and deletes were appended to the journal, not rewritten into the file
+            self.assertEqual(os.stat(file).st_mtime_ns, snapshot)
+            self.assertEqual(repo.count(), 0)
+            compact_journal(file)
+            sizes.append(os.path.getsize(file))
+        self.assertEqual(len(mailer.delivered), 500)
+        self.assertEqual(len(set(sizes)), 1)
+        self.assertEqual(outbox.status()["total"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+from utils import hash_password, verify_password, is_hashed, needs_rehash
+from models import Staff
+import unittest
+
+class TestPasswordHashing(unittest.TestCase):
+    def test_hash_round_trip(self):
+        stored = hash_password("s3cret", iterations=1000)
+        self.assertTrue(is_hashed(stored))
+        self.assertNotIn("s3cret", stored)
+        self.assertTrue(verify_password("s3cret", stored))
+        self.assertFalse(verify_password("wrong", stored))
+
+    def test_salts_differ(self):
+        self.assertNotEqual(hash_password("same", iterations=1000), hash_password("same", iterations=1000))
+
+    def test_legacy_plaintext(self):
+        self.assertTrue(verify_password("admin123", "admin123"))
+        self.assertFalse(verify_password("admin", "admin123"))
+        self.assertTrue(needs_rehash("admin123"))
+
+    def test_cost_change_requires_rehash(self):
+        self.assertTrue(needs_rehash(hash_password("pw", iterations=1000)))
+
+    def test_staff_stores_hash(self):
+        s = Staff(1, "Test", 30, "1234567890", "Nurse", "Day", "test@hospital.com", "pass")
+        self.assertTrue(is_hashed(s.password))
+        self.assertTrue(s.verify_password("pass"))
+        self.assertFalse(s.verify_password("nope"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+from logic.patient_table import PatientTable
+from repository import JSONRepository
+from data_manager import StaleRecordError
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+class TestPatientTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patient_file = os.path.join(self.tmp.name, "patients.json")
+        with open(patient_file, 'w') as f:
+            json.dump([
+                {"pid": 101, "name": "Ann", "age": 30, "contact": "555-0199", "blood_group": "AB+",
+                 "current_status": "PENDING"},
+                {"pid": 102, "name": "Bob", "age": 40, "contact": "1234567890", "blood_group": "O-",
+                 "current_status": "ADMITTED"},
+                {"pid": 103, "name": "Cy", "age": 50, "contact": "1234567890"},
+            ], f)
+        self.repo = JSONRepository(patient_file, "pid", id_start=101)
+        self.table = PatientTable(self.repo)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_frame_uses_compact_dtypes(self):
+        frame = self.table.frame()
+        self.assertEqual(str(frame["pid"].dtype), "int64")
+        self.assertEqual(str(frame["blood_group"].dtype), "category")
+        self.assertEqual(str(frame["current_status"].dtype), "category")
+        self.assertEqual(frame["blood_group"].tolist(), ["AB+", "O-", "Unknown"])
+
+    def test_filters_and_counts(self):
+        self.assertEqual(self.table.filter(status="PENDING")["pid"].tolist(), [101, 103])
+        self.assertEqual(self.table.filter(blood_group="O-")["name"].tolist(), ["Bob"])
+        self.assertEqual(self.table.filter(status="DISCHARGED").shape[0], 0)
+        self.assertEqual(self.table.status_counts().to_dict(), {"PENDING": 2, "ADMITTED": 1, "DISCHARGED": 0})
+        self.assertEqual(self.table.blood_group_counts(status="PENDING")["AB+"], 1)
+
+    def test_own_writes_update_rows_in_place(self):
+        self.table.frame()
+        rebuilds = []
+        refresh = self.table._reset
+        self.table._reset = lambda capacity: (rebuilds.append(capacity), refresh(capacity))
+
+        self.table.insert({"pid": 104, "name": "Di", "age": 20, "contact": "1234567890",
+                           "blood_group": "B+", "current_status": "PENDING"})
+        self.assertTrue(self.table.update(101, {"current_status": "ADMITTED"}, expected_version=0))
+        self.assertEqual(self.table.get(101)["current_status"], "ADMITTED")
+        self.assertEqual(self.table.status_counts()["ADMITTED"], 2)
+        self.assertEqual(self.table.frame()["pid"].tolist(), [101, 102, 103, 104])
+        self.assertEqual(rebuilds, [])
+
+        # The row version follows the record's, so stale updates are still caught
+        self.assertEqual(self.table.get(101)["_version"], self.repo.get(101)["_version"])
+        with self.assertRaises(StaleRecordError):
+            self.table.update(101, {"current_status": "DISCHARGED"}, expected_version=0)
+
+    def test_updating_a_missing_patient_changes_nothing(self):
+        frame = self.table.frame()
+        revision = self.table._revision
+        self.assertFalse(self.table.update(999, {"current_status": "ADMITTED"}))
+        self.assertEqual(self.table._revision, revision)
+        self.assertIs(self.table.frame(), frame)
+
+    def test_other_writers_trigger_a_rebuild(self):
+        self.table.frame()
+        self.repo.update(102, {"current_status": "DISCHARGED"})
+        self.assertEqual(self.table.get(102)["current_status"], "DISCHARGED")
+
+    def test_write_racing_another_writer_is_not_missed(self):
+        self.table.frame()
+        other = JSONRepository(self.repo.filepath, "pid")
+        racer = threading.Thread(target=other.update, args=(102, {"current_status": "DISCHARGED"}))
+        write = self.repo.update
+
+        def slow_update(*args, **kwargs):
+            # The other writer tries to land its change while ours is in flight
+            racer.start()
+            time.sleep(0.05)
+            return write(*args, **kwargs)
+        self.repo.update = slow_update
+        self.assertTrue(self.table.update(101, {"current_status": "ADMITTED"}))
+        racer.join()
+        self.assertEqual(self.table.get(102)["current_status"], "DISCHARGED")
+        self.assertEqual(self.table.get(101)["current_status"], "ADMITTED")
+
+    def test_large_table_queries(self):
+        groups = ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"]
+        statuses = ["PENDING", "ADMITTED", "DISCHARGED"]
+        self.repo.replace_all([{"pid": i, "name": f"P{i}", "age": 30, "contact": "1234567890",
+                                "blood_group": groups[i % 8], "current_status": statuses[i % 3]}
+                               for i in range(100_000)])
+        self.table.frame()
+        started = time.perf_counter()
+        for _ in range(20):
+            self.table.status_counts()
+            self.table.blood_group_counts(status="ADMITTED")
+        self.assertLess((time.perf_counter() - started) / 20, 0.01)
+        self.assertEqual(self.table.status_counts()["PENDING"], 33_334)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+from repository import JSONRepository, SQLiteRepository
+from data_manager import StaleRecordError
+import json
+import os
+import tempfile
+import unittest
+
+class RepositoryContract:
+    """Checks shared by every storage backend."""
+
+    def make_repo(self, seed):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.seed_file = os.path.join(self.tmp.name, "patients.json")
+        with open(self.seed_file, 'w') as f:
+            json.dump([
+                {"pid": 101, "name": "Ann", "current_status": "PENDING"},
+                {"pid": 102, "name": "Bob", "current_status": "ADMITTED"},
+            ], f)
+        self.repo = self.make_repo(self.seed_file)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_and_find(self):
+        self.assertEqual(self.repo.get(102)["name"], "Bob")
+        self.assertIsNone(self.repo.get(999))
+        self.assertEqual([r["pid"] for r in self.repo.find(current_status="PENDING")], [101])
+        self.assertEqual(self.repo.count(), 2)
+
+    def test_insert_update_delete(self):
+        self.repo.insert({"pid": 103, "name": "Cy", "current_status": "PENDING"})
+        with self.assertRaises(ValueError):
+            self.repo.insert({"pid": 103, "name": "Dup"})
+
+        self.assertTrue(self.repo.update(103, {"current_status": "ADMITTED"}))
+        self.assertFalse(self.repo.update(999, {"current_status": "ADMITTED"}))
+        self.assertEqual([r["pid"] for r in self.repo.find(current_status="ADMITTED")], [102, 103])
+
+        self.assertTrue(self.repo.delete(101))
+        self.assertFalse(self.repo.delete(101))
+        self.assertEqual([r["pid"] for r in self.repo.all()], [102, 103])
+
+    def test_delete_many(self):
+        self.assertEqual(self.repo.delete_many([101, 999]), 1)
+        self.assertEqual([r["pid"] for r in self.repo.all()], [102])
+
+    def test_update_many(self):
+        updated = self.repo.update_many({101: {"triage": "Low"}, 102: {"triage": "High"}, 999: {"triage": "?"}})
+        self.assertEqual(updated, 2)
+        self.assertEqual([r.get("triage") for r in self.repo.all()], ["Low", "High"])
+
+    def test_insert_many(self):
+        with self.assertRaises(ValueError):
+            self.repo.insert_many([{"pid": 103, "name": "Cy"}, {"pid": 101, "name": "Dup"}])
+        self.assertEqual(self.repo.count(), 2)
+
+        added = self.repo.insert_many([{"pid": 103, "name": "Cy"}, {"pid": 101, "name": "Dup"}],
+                                      skip_existing=True)
+        self.assertEqual(added, 1)
+        self.assertEqual(self.repo.get(101)["name"], "Ann")
+        self.assertEqual(self.repo.get(103)["_version"], 1)
+
+    def test_stale_update_is_rejected(self):
+        seen = self.repo.get(101).get("_version", 0)
+        self.repo.update(101, {"current_status": "ADMITTED"})
+        with self.assertRaises(StaleRecordError):
+            self.repo.update(101, {"current_status": "DISCHARGED"}, expected_version=seen)
+        self.assertEqual(self.repo.get(101)["current_status"], "ADMITTED")
+
+    def test_modify_retries_on_conflict(self):
+        calls = []
+        def add_visit(record):
+            calls.append(record.get("_version", 0))
+            if len(calls) == 1:
+                # Someone else saves while we are computing our change
+                self.repo.update(101, {"visits": 5})
+            return {"visits": record.get("visits", 0) + 1}
+
+        self.assertTrue(self.repo.modify(101, add_visit))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.repo.get(101)["visits"], 6)
+
+    def test_ids_continue_after_existing_keys(self):
+        self.assertEqual(self.repo.next_id(), 103)
+        block = self.repo.allocate_ids(1000)
+        self.assertEqual((block[0], len(block)), (104, 1000))
+
+        # Deleting records never makes an id reusable
+        self.repo.delete(102)
+        self.assertEqual(self.repo.next_id(), 1104)
+
+class TestJSONRepository(RepositoryContract, unittest.TestCase):
+    def make_repo(self, seed):
+        return JSONRepository(seed, "pid")
+
+class TestSQLiteRepository(RepositoryContract, unittest.TestCase):
+    def make_repo(self, seed):
+        db_path = os.path.join(self.tmp.name, "hospital.db")
+        return SQLiteRepository(db_path, "patients", "pid", ("current_status",), seed_file=seed)
+
+    def test_index_is_used(self):
+        plan = self.repo._query("EXPLAIN QUERY PLAN SELECT doc FROM patients "
+                                "WHERE json_extract(doc, '$.current_status') = ?", ("PENDING",))
+        self.assertIn("idx_patients_current_status", str(plan))
+
+    def test_revision_is_per_collection(self):
+        db_path = os.path.join(self.tmp.name, "hospital.db")
+        appointments = SQLiteRepository(db_path, "appointments", "appointment_id")
+        revision = self.repo.revision()
+        appointments.insert({"appointment_id": 1001, "patient_id": 101})
+        self.repo.allocate_ids(3)
+        self.assertEqual(self.repo.revision(), revision)
+
+        # Writes through another connection to this table are seen
+        SQLiteRepository(db_path, "patients", "pid").update(101, {"current_status": "ADMITTED"})
+        self.assertNotEqual(self.repo.revision(), revision)
+        revision = self.repo.revision()
+        self.assertFalse(self.repo.update(999, {"name": "Nobody"}))
+        self.assertEqual(self.repo.revision(), revision)
+
+if __name__ == "__main__":
+    unittest.main()
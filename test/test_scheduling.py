@@ -0,0 +1,169 @@
+from logic.scheduling import DoctorCalendar, Scheduler, SlotUnavailableError, daily_slots
+from repository import JSONRepository
+from datetime import datetime, timedelta
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+DOCTORS = [
+    {"pid": 201, "name": "Dr. Smith", "role": "Doctor", "specialization": "General Physician",
+     "shift_timing": "09:00-17:00", "available_slots": ["09:00", "10:00"]},
+    {"pid": 202, "name": "Dr. Rao", "role": "Doctor", "specialization": "General Physician",
+     "shift_timing": "09:00-11:00"},
+    {"pid": 100, "name": "System Admin", "role": "Admin", "shift_timing": "N/A"},
+]
+PATIENT = {"pid": 101, "name": "Ann"}
+DAY = datetime(2026, 3, 2)
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        staff_file = os.path.join(self.tmp.name, "staff.json")
+        self.appointment_file = os.path.join(self.tmp.name, "appointments.json")
+        with open(staff_file, 'w') as f:
+            json.dump(DOCTORS, f)
+        with open(self.appointment_file, 'w') as f:
+            json.dump([
+                {"appointment_id": 1001, "patient_id": 101, "doctor_id": 201,
+                 "date_time": "2026-03-02 09:00:00", "status": "Completed"},
+                {"appointment_id": 1002, "patient_id": 102, "doctor_id": 201,
+                 "time_slot": "2026-03-02 10:00:00", "status": "Cancelled"},
+            ], f)
+        self.appointments = JSONRepository(self.appointment_file, "appointment_id", id_start=1001)
+        self.scheduler = Scheduler(self.appointments, JSONRepository(staff_file, "pid"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_daily_slots(self):
+        self.assertEqual(daily_slots(DOCTORS[0]), [timedelta(hours=9), timedelta(hours=10)])
+        self.assertEqual(daily_slots(DOCTORS[1]), [timedelta(hours=9, minutes=30 * i) for i in range(4)])
+
+    def test_calendar_remove_finds_entries_sharing_a_start(self):
+        calendar = DoctorCalendar()
+        for aid, hour in ((3, 9), (1, 10), (2, 10), (4, 10), (5, 11)):
+            calendar.add(DAY.replace(hour=hour), {"appointment_id": aid,
+                                                  "time_slot": f"2026-03-02 {hour:02d}:00:00"})
+        self.assertEqual(calendar.remove(2)["appointment_id"], 2)
+        self.assertIsNone(calendar.remove(2))
+        self.assertEqual(calendar.ids, [3, 1, 4, 5])
+        self.assertEqual([s.hour for s in calendar.starts], [9, 10, 10, 11])
+
+    def test_next_free_slots_skip_booked_and_past(self):
+        # 09:00 is taken by an old record, the cancelled 10:00 is free again
+        self.assertEqual(self.scheduler.next_free_slots(201, n=3, after=DAY),
+                         [DAY.replace(hour=10), DAY + timedelta(days=1, hours=9), DAY + timedelta(days=1, hours=10)])
+        self.assertEqual(self.scheduler.next_free_slots(202, n=1, after=DAY.replace(hour=10, minute=15)),
+                         [DAY.replace(hour=10, minute=30)])
+
+    def test_book_and_conflicts(self):
+        start = DAY.replace(hour=10)
+        appt = self.scheduler.book(PATIENT, 201, start)
+        self.assertEqual(appt["time_slot"], "2026-03-02 10:00:00")
+        self.assertEqual(self.appointments.get(appt["appointment_id"])["doctor_name"], "Dr. Smith")
+
+        with self.assertRaises(SlotUnavailableError):
+            self.scheduler.book(PATIENT, 201, start)
+        with self.assertRaises(SlotUnavailableError):
+            self.scheduler.book(PATIENT, 201, DAY.replace(hour=11))  # not one of the doctor's slots
+        self.assertFalse(self.scheduler.is_free(201, DAY.replace(hour=9, minute=45)))
+        self.assertTrue(self.scheduler.is_free(202, start))
+
+        self.assertTrue(self.scheduler.set_status(appt["appointment_id"], 201, "Cancelled"))
+        self.assertTrue(self.scheduler.is_free(201, start))
+
+    def test_cancelled_appointment_taken_back(self):
+        start = DAY.replace(hour=10)
+        appt = self.scheduler.book(PATIENT, 201, start)
+        self.scheduler.set_status(appt["appointment_id"], 201, "Cancelled")
+        self.assertTrue(self.scheduler.set_status(appt["appointment_id"], 201, "Scheduled"))
+        self.assertFalse(self.scheduler.is_free(201, start))
+        self.assertEqual([a["status"] for a in self.scheduler.appointments(201, start=start)], ["Scheduled"])
+
+        # Once someone else has the slot, the cancelled one can't come back
+        self.scheduler.set_status(appt["appointment_id"], 201, "Cancelled")
+        self.scheduler.book({"pid": 102, "name": "Bob"}, 201, start)
+        with self.assertRaises(SlotUnavailableError):
+            self.scheduler.set_status(appt["appointment_id"], 201, "Scheduled")
+        self.assertEqual(self.appointments.get(appt["appointment_id"])["status"], "Cancelled")
+
+    def test_free_slots_by_specialization(self):
+        self.scheduler.book(PATIENT, 202, DAY.replace(hour=9))
+        options = self.scheduler.next_free_slots_by_specialization("General Physician", n=3, after=DAY)
+        self.assertEqual([(start.strftime("%H:%M"), doctor["pid"]) for start, doctor in options],
+                         [("09:30", 202), ("10:00", 201), ("10:00", 202)])
+
+    def test_concurrent_bookings_take_a_slot_once(self):
+        outcomes = []
+        def book():
+            try:
+                outcomes.append(self.scheduler.book(PATIENT, 202, DAY.replace(hour=9)))
+            except SlotUnavailableError:
+                outcomes.append(None)
+        threads = [threading.Thread(target=book) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sum(o is not None for o in outcomes), 1)
+
+    def test_index_sees_other_writers_and_scales(self):
+        # Years of history for one doctor, written directly to the file
+        records = [{"appointment_id": 2000 + i, "patient_id": 101, "doctor_id": 202, "status": "Completed",
+                    "time_slot": (datetime(2020, 1, 1, 9) + timedelta(days=i // 4, minutes=30 * (i % 4)))
+                    .strftime("%Y-%m-%d %H:%M:%S")} for i in range(8000)]
+        self.appointments.replace_all(records)
+        self.assertEqual(len(self.scheduler.appointments(202)), 8000)
+        self.assertFalse(self.scheduler.is_free(202, datetime(2021, 6, 1, 10)))
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            self.scheduler.is_free(202, datetime(2021, 6, 1, 10))
+        self.assertLess((time.perf_counter() - started) / 1000, 0.001)
+
+    def test_auto_schedule_balances_load_in_one_write(self):
+        patients = [{"pid": pid, "name": f"P{pid}"} for pid in range(300, 306)]
+        patients[0]["specialization"] = "Cardiology"  # no such doctor
+        self.scheduler.book({"pid": 301, "name": "P301"}, 202, DAY.replace(hour=9))
+
+        booked, unscheduled = self.scheduler.auto_schedule(patients, after=DAY)
+        self.assertEqual(unscheduled, [300])
+        self.assertEqual(sorted(a["patient_id"] for a in booked), [302, 303, 304, 305])
+        # 202 already had one booking, so 201 gets the first two patients
+        self.assertEqual([(a["doctor_id"], a["time_slot"][11:16]) for a in booked],
+                         [(201, "10:00"), (202, "09:30"), (201, "09:00"), (202, "10:00")])
+        self.assertEqual(booked[2]["time_slot"][:10], "2026-03-03")
+        self.assertEqual(len({a["appointment_id"] for a in booked}), 4)
+        self.assertEqual(len(self.appointments.all()), 2 + 1 + 4)
+
+        # Patients who are already booked are skipped on the next run
+        self.assertEqual(self.scheduler.auto_schedule(patients, after=DAY)[0], [])
+
+    def test_auto_schedule_follows_the_previous_doctor_or_the_given_specialization(self):
+        self.scheduler.staff_repo.replace_all(DOCTORS + [
+            {"pid": 203, "name": "Dr. Heart", "role": "Doctor", "specialization": "Cardiology",
+             "shift_timing": "09:00-10:00"}])
+        self.scheduler.book({"pid": 301, "name": "P301"}, 203, DAY - timedelta(days=7, hours=-9))
+        self.appointments.update_many({a["appointment_id"]: {"status": "Completed"}
+                                       for a in self.appointments.find(patient_id=301)})
+
+        patients = [{"pid": pid, "name": f"P{pid}"} for pid in (301, 302, 303)]
+        booked, _ = self.scheduler.auto_schedule(patients, after=DAY, specializations={303: "Cardiology"})
+        self.assertEqual({a["patient_id"]: a["doctor_id"] for a in booked}, {301: 203, 302: 202, 303: 203})
+
+    def test_auto_schedule_thousands_of_patients(self):
+        patients = [{"pid": pid, "name": f"P{pid}"} for pid in range(5000)]
+        started = time.perf_counter()
+        booked, unscheduled = self.scheduler.auto_schedule(patients, after=DAY)
+        self.assertLess(time.perf_counter() - started, 5.0)
+        # 30 days of 2 + 4 daily slots, minus the existing 09:00 booking
+        self.assertEqual(len(booked), 30 * 6 - 1)
+        self.assertEqual(len(unscheduled), 5000 - len(booked))
+        starts = [(a["doctor_id"], a["time_slot"]) for a in booked]
+        self.assertEqual(len(set(starts)), len(starts))
+
+if __name__ == "__main__":
+    unittest.main()
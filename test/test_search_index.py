@@ -0,0 +1,97 @@
+from logic.history_store import HistoryStore
+from logic.patient_table import PatientTable
+from logic.search_index import SearchIndex
+from repository import JSONRepository
+from datetime import date
+import json
+import os
+import tempfile
+import time
+import unittest
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patient_file = os.path.join(self.tmp.name, "patients.json")
+        with open(patient_file, 'w') as f:
+            json.dump([
+                {"pid": 101, "name": "Ann Smith", "contact": "555-0199"},
+                {"pid": 102, "name": "Andrew Smythe", "contact": "1234567890"},
+                {"pid": 103, "name": "Bob Anders", "contact": "9876543210"},
+            ], f)
+        self.patients = JSONRepository(patient_file, "pid", id_start=101)
+        self.history = JSONRepository(os.path.join(self.tmp.name, "history.json"), "entry_id")
+        self.store = HistoryStore(self.history, self.patients)
+        self.store.append(101, {"date": "2025-12-07 17:12", "disease": "Influenza-Like Illness (ILI)",
+                                "details": "Rest and fluids"})
+        self.store.append(102, {"date": "2025-12-20", "diagnosis": "ILI", "treatment": "Paracetamol"})
+        self.store.append(103, {"date": "2025-12-21", "diagnosis": "Sprained ankle", "treatment": "Rest"})
+        self.index = SearchIndex(self.patients, self.history)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_patient_typeahead(self):
+        self.assertEqual(self.index.search_patients("an"), [103, 102, 101])  # anders, andrew, ann
+        self.assertEqual(self.index.search_patients("sm an"), [102, 101])
+        self.assertEqual(self.index.search_patients("smy"), [102])
+        self.assertEqual(self.index.search_patients("5550199"), [101])
+        self.assertEqual(self.index.search_patients("0199"), [101])
+        self.assertEqual(self.index.search_patients("103"), [103])
+        self.assertEqual(self.index.search_patients("zed"), [])
+        self.assertEqual(self.index.search_patients("  "), [])
+
+    def test_history_terms_and_dates(self):
+        self.assertEqual([e["pid"] for e in self.index.search_history("ili")], [102, 101])
+        self.assertEqual([e["pid"] for e in self.index.search_history("ILI", since=date(2025, 12, 14))], [102])
+        self.assertEqual([e["pid"] for e in self.index.search_history("rest")], [103, 101])
+        self.assertEqual([e["pid"] for e in self.index.search_history("rest fluids")], [101])
+        self.assertEqual([e["pid"] for e in self.index.search_history("", until=date(2025, 12, 7))], [101])
+        self.assertEqual(self.index.search_history("ili", pid=103), [])
+
+    def test_updates_are_incremental(self):
+        self.index.search_history("ili")
+        tokenized = []
+        add = self.index.history.add
+        self.index.history.add = lambda *args: (tokenized.append(args[0]), add(*args))
+
+        entry = self.store.append(103, {"date": "2025-12-22", "diagnosis": "ILI", "treatment": "Rest"})
+        self.assertEqual([e["pid"] for e in self.index.search_history("ili", since=date(2025, 12, 22))], [103])
+        self.assertEqual(tokenized, [entry["entry_id"]])
+
+        self.patients.update(103, {"name": "Robert Anders"})
+        self.assertEqual(self.index.search_patients("rob"), [103])
+        self.assertEqual(self.index.search_patients("bob"), [])
+
+    def test_pushed_writes_need_no_resync(self):
+        table = PatientTable(self.patients)
+        self.store.listeners.append(self.index.history_added)
+        table.listeners.append(self.index.patient_saved)
+        self.index.search_history("ili")
+        self.index.search_patients("an")
+        len(table)
+        scans = []
+        for repo in (self.history, self.patients):
+            repo.all = lambda all=repo.all: (scans.append(1), all())[1]
+
+        self.store.append(103, {"date": "2025-12-22", "diagnosis": "ILI", "treatment": "Rest"})
+        self.assertEqual([e["pid"] for e in self.index.search_history("ili")], [103, 102, 101])
+        table.update(103, {"name": "Robert Anders"})
+        self.assertEqual(self.index.search_patients("rob"), [103])
+        self.assertEqual(self.index.search_patients("bob"), [])
+        self.assertEqual(scans, [])
+
+    def test_lookups_at_100k_patients(self):
+        first = ["ann", "bob", "cy", "dana", "eli", "faye", "gus", "hana", "ivan", "jo"]
+        self.patients.replace_all([{"pid": i, "name": f"{first[i % 10]} Family{i // 10}",
+                                    "contact": f"{5550000000 + i}"} for i in range(100_000)])
+        self.index.search_patients("x")  # builds the index
+
+        started = time.perf_counter()
+        for query in ("family123", "ann family4", "5550012345", "fay", "555", "fam"):
+            self.index.search_patients(query)
+        self.assertLess((time.perf_counter() - started) / 6, 0.01)
+        self.assertEqual(self.index.search_patients("ann family4", limit=3), [40, 400, 4000])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+from logic.events import get_event_bus
+from logic.inventory_store import InventoryStore
+from logic.stock_alerts import LowStockAlerter
+from models import BloodInventory, LOW_STOCK_EVENT, RESTOCKED_EVENT
+import os
+import tempfile
+import unittest
+
+class FakeOutbox:
+    def __init__(self):
+        self.messages = []
+
+    def enqueue(self, messages):
+        self.messages.extend(messages)
+        return len(messages)
+
+class TestLowStockEvents(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = InventoryStore(os.path.join(self.tmp.name, "blood_bags.npz"),
+                                    os.path.join(self.tmp.name, "inventory_log.jsonl"))
+        BloodInventory._flagged = None
+        self.events = []
+        self.collect = lambda event: self.events.append((event["topic"], event["units"]))
+        get_event_bus().subscribe(LOW_STOCK_EVENT, self.collect)
+        get_event_bus().subscribe(RESTOCKED_EVENT, self.collect)
+
+    def tearDown(self):
+        get_event_bus().unsubscribe(LOW_STOCK_EVENT, self.collect)
+        get_event_bus().unsubscribe(RESTOCKED_EVENT, self.collect)
+        BloodInventory._flagged = None
+        self.tmp.cleanup()
+
+    def test_crossings_with_hysteresis(self):
+        inventory = BloodInventory(limit=5, restock_margin=2, store=self.store)
+        inventory.update_stock("A+", 6 - int(inventory.quantities[0]))
+        for change in (-2, +1, -1, +1, +2, -3):  # 4, 5, 4, 5, 7, 4
+            inventory.update_stock("A+", change)
+        get_event_bus().flush()
+
+        self.assertEqual(self.events, [(LOW_STOCK_EVENT, 4), (RESTOCKED_EVENT, 7), (LOW_STOCK_EVENT, 4)])
+
+    def test_alerter_debounces_per_blood_type(self):
+        outbox = FakeOutbox()
+        alerter = LowStockAlerter(outbox, recipients=lambda: ["admin@hospital.com", "lab@hospital.com"],
+                                  cooldown=60)
+        alerter({"blood_group": "O-", "units": 3})
+        alerter({"blood_group": "O-", "units": 2})
+        alerter({"blood_group": "B+", "units": 4})
+
+        self.assertEqual(len(outbox.messages), 4)
+        self.assertEqual({m["params"]["blood_group"] for m in outbox.messages}, {"O-", "B+"})
+        self.assertEqual(outbox.messages[0]["kind"], "alert")
+
+if __name__ == "__main__":
+    unittest.main()
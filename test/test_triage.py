@@ -0,0 +1,77 @@
+from logic.ai_jobs import AIJobQueue
+from logic.triage import triage_cases, RateLimiter
+from logic.ai_cache import ResponseCache
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+class FakeAI:
+    """Answers batches like the model would, except for ids listed in `skip`."""
+    available = True
+
+    def __init__(self, cache, skip=()):
+        self.cache = cache
+        self.skip = set(skip)
+        self.batch_sizes = []
+        self.running = self.most_running = 0
+        self._lock = threading.Lock()
+
+    def predict_treatment_batch(self, cases):
+        with self._lock:
+            self.batch_sizes.append(len(cases))
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.01)
+        with self._lock:
+            self.running -= 1
+        return {case_id: {"risk_level": "High" if "chest" in symptoms else "Low", "diagnosis": symptoms}
+                for case_id, symptoms, _ in cases if case_id not in self.skip}
+
+    def _fallback_response(self):
+        return {"diagnosis": "Service Unavailable", "risk_level": "Unknown"}
+
+class TestBatchTriage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.tmp.name, "ai_cache.json"), save_seconds=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cases_are_packed_and_fall_back_per_item(self):
+        ai = FakeAI(self.cache, skip={103})
+        cases = [(100 + i, "chest pain" if i % 2 else "cough", []) for i in range(10)]
+        results, report = triage_cases(ai, cases, batch_size=4, requests_per_minute=0)
+
+        self.assertEqual(sorted(ai.batch_sizes), [2, 4, 4])
+        self.assertEqual(results[101]["risk_level"], "High")
+        self.assertEqual(results[103]["risk_level"], "Unknown")
+        self.assertEqual((report["requests"], report["fallbacks"]), (3, 1))
+        self.assertGreater(report["patients_per_minute"], 0)
+
+    def test_cached_cases_skip_the_model(self):
+        ai = FakeAI(self.cache)
+        cases = [(1, "cough", []), (2, "fever", [])]
+        triage_cases(ai, cases, requests_per_minute=0)
+        _, report = triage_cases(ai, cases, requests_per_minute=0)
+        self.assertEqual((report["cache_hits"], report["requests"]), (2, 0))
+
+    def test_batches_share_the_ai_call_limit(self):
+        ai = FakeAI(self.cache)
+        cases = [(i, f"case {i}", []) for i in range(12)]
+        results, report = triage_cases(ai, cases, batch_size=2, requests_per_minute=0,
+                                       queue=AIJobQueue(max_workers=2))
+        self.assertEqual((len(results), report["requests"]), (12, 6))
+        self.assertEqual(ai.most_running, 2)
+
+    def test_rate_limiter_spaces_requests(self):
+        limiter = RateLimiter(requests_per_minute=1200)  # one every 50 ms
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.14)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1 +1,2 @@
 from .validators import validate_contact, validate_email
+from .passwords import hash_password, verify_password, is_hashed, needs_rehash
@@ -1,39 +1,49 @@
+import os
+import queue
 import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
 
 # Configuration
 SMTP_SERVER = "localhost"
 SMTP_PORT = 1025
 SENDER_EMAIL = "system@hospital.com"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 10))
+# Open SMTP sessions kept for reuse; also the number of parallel senders in send_many
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+# Messages a sender pushes through one session before taking the next batch
+SMTP_BATCH_SIZE = int(os.getenv("SMTP_BATCH_SIZE", 100))
+# Sessions idle longer than this are checked with NOOP before reuse
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", 30))
 
-def send_alert(blood_group, quantity, recipient_email):
+def is_connection_error(error):
     """
-    Sends a low stock alert email.
+    True if `error` means the session is gone, as opposed to a rejected
+    message. SMTPException subclasses
+    OSError, so a refusal of one message (SMTPRecipientsRefused,
+    SMTPDataError, ...) is told apart from a dropped connection here.
     """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+def build_alert(blood_group, quantity, recipient_email):
     msg = EmailMessage()
     msg.set_content(f"Warning! The stock for {blood_group} has dropped to {quantity} units. Please contact donors immediately.")
     msg['Subject'] = f"URGENT: Low Stock Alert - {blood_group}"
     msg['From'] = SENDER_EMAIL
     msg['To'] = recipient_email
+    return msg
 
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
-
-def send_donation_request(recipient_email, patient_name, missing_blood_type):
-    """
-    Sends a broadcast email requesting blood donation.
-    """
+def build_donation_request(recipient_email, patient_name, missing_blood_type):
     msg = EmailMessage()
     body = f"""Dear {patient_name},
 
 We hope you are in good health.
 
-This is an urgent appeal from City Hospital. We are currently facing a critical shortage of **{missing_blood_type}** blood in our inventory. 
+This is an urgent appeal from City Hospital. We are currently facing a critical shortage of **{missing_blood_type}** blood in our inventory.
 
 As a registered member of our hospital network, we are reaching out to ask for your support. If you or anyone you know is eligible to donate, please visit our blood bank at your earliest convenience. Your donation could save a life today.
 
@@ -44,16 +54,185 @@ Thank you for your kindness and support.
 
 Sincerely,
 Hospital Administration"""
-    
+
     msg.set_content(body)
     msg['Subject'] = f"Urgent Appeal: {missing_blood_type} Blood Needed - Save a Life Today"
     msg['From'] = SENDER_EMAIL
     msg['To'] = recipient_email
+    return msg
 
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"Error sending broadcast: {e}")
-        return False
+def _connect():
+    return smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+
+class SMTPPool:
+    """
+    Keeps up to `size` SMTP sessions open for reuse. Sessions are opened on
+    demand, checked with NOOP after sitting idle, and discarded when they fail.
+    """
+    def __init__(self, size=SMTP_POOL_SIZE, connect=_connect, idle_check=SMTP_IDLE_CHECK_SECONDS):
+        self.size = size
+        self.idle_check = idle_check
+        self._connect = connect
+        self._idle = queue.LifoQueue()  # (session, last used)
+        self._slots = threading.BoundedSemaphore(size)
+        self.connections_opened = 0
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    session, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    self.connections_opened += 1
+                    return self._connect()
+                if time.time() - last_used < self.idle_check:
+                    return session
+                try:
+                    session.noop()
+                    return session
+                except Exception:
+                    self._close(session)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, session, broken=False):
+        if broken:
+            self._close(session)
+        else:
+            self._idle.put((session, time.time()))
+        self._slots.release()
+
+    def reconnect(self, session):
+        """Replaces a failed session with a new one, keeping the caller's slot."""
+        self._close(session)
+        self.connections_opened += 1
+        return self._connect()
+
+    def close(self):
+        while True:
+            try:
+                session, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(session)
+
+    def _close(self, session):
+        try:
+            session.quit()
+        except Exception:
+            pass
+
+class Mailer:
+    """
+    Sends mail over pooled SMTP sessions. A message whose session drops is
+    retried once on a fresh connection; rejected messages are reported, not
+    retried.
+    """
+    def __init__(self, pool=None, batch_size=SMTP_BATCH_SIZE):
+        self.pool = pool or SMTPPool()
+        self.batch_size = batch_size
+
+    def send(self, msg):
+        sent, failures = self._send_batch([msg])
+        if failures:
+            print(f"Error sending email: {failures[0][2]}")
+        return sent == 1
+
+    def _send_batch(self, batch):
+        sent, failures = 0, []
+        try:
+            session = self.pool.acquire()
+        except Exception as e:
+            return 0, [(i, msg['To'], str(e)) for i, msg in enumerate(batch)]
+
+        broken = False
+        try:
+            for i, msg in enumerate(batch):
+                try:
+                    session.send_message(msg)
+                    sent += 1
+                    continue
+                except Exception as e:
+                    if not is_connection_error(e):
+                        # Rejected by the server: only this message fails
+                        failures.append((i, msg['To'], str(e)))
+                        continue
+                try:
+                    session = self.pool.reconnect(session)
+                    session.send_message(msg)
+                    sent += 1
+                except Exception as e:
+                    failures.append((i, msg['To'], str(e)))
+                    broken = is_connection_error(e)
+                    if broken:
+                        # Server unreachable: fail the rest of the batch instead of timing out on each
+                        failures.extend((j, batch[j]['To'], str(e)) for j in range(i + 1, len(batch)))
+                        break
+        finally:
+            self.pool.release(session, broken=broken)
+        return sent, failures
+
+    def send_many(self, messages, progress=None):
+        """
+        Sends all messages, `batch_size` per session with up to the pool's
+        size of sessions in parallel. progress(done, total) is called from the
+        calling thread after each batch.
+
+        Returns a report with sent/failed counts, the failed messages (as
+        positions in `messages`), their recipients and errors, elapsed seconds
+        and messages per second.
+        """
+        started = time.time()
+        messages = list(messages)
+        batches = [messages[i:i + self.batch_size] for i in range(0, len(messages), self.batch_size)]
+        sent, errors, done = 0, [], 0
+
+        with ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix="smtp") as executor:
+            for batch, (batch_sent, batch_failures) in zip(batches, executor.map(self._send_batch, batches)):
+                sent += batch_sent
+                errors.extend((done + i, recipient, error) for i, recipient, error in batch_failures)
+                done += len(batch)
+                if progress:
+                    progress(done, len(messages))
+
+        elapsed = time.time() - started
+        return {
+            "sent": sent,
+            "failed": len(errors),
+            "failed_indices": [i for i, _, _ in errors],
+            "failed_recipients": [recipient for _, recipient, _ in errors],
+            "errors": [error for _, _, error in errors],
+            "seconds": round(elapsed, 2),
+            "messages_per_second": round(sent / elapsed, 1) if elapsed > 0 else float(sent),
+        }
+
+_shared_mailer = None
+_shared_lock = threading.Lock()
+
+def get_mailer():
+    """Returns the process-wide mailer, so every sender shares one SMTP pool."""
+    global _shared_mailer
+    with _shared_lock:
+        if _shared_mailer is None:
+            _shared_mailer = Mailer()
+        return _shared_mailer
+
+def send_alert(blood_group, quantity, recipient_email):
+    """
+    Sends a low stock alert email.
+    """
+    return get_mailer().send(build_alert(blood_group, quantity, recipient_email))
+
+def send_donation_request(recipient_email, patient_name, missing_blood_type):
+    """
+    Sends a broadcast email requesting blood donation.
+    """
+    return get_mailer().send(build_donation_request(recipient_email, patient_name, missing_blood_type))
+
+def send_many(messages, progress=None):
+    """
+    Sends many prepared messages over the shared pool; see Mailer.send_many.
+    """
+    return get_mailer().send_many(messages, progress)
@@ -0,0 +1,50 @@
+import hashlib
+import hmac
+import os
+import secrets
+
+# PBKDF2 work factor; raise it as hardware gets faster. Existing hashes are
+# upgraded to the current cost on the user's next successful login.
+PASSWORD_ITERATIONS = int(os.getenv("HOSPITAL_PASSWORD_ITERATIONS", 200_000))
+
+_SCHEME = "pbkdf2_sha256"
+
+def hash_password(password, iterations=None):
+    """
+    Returns a salted PBKDF2 hash of the form "pbkdf2_sha256$iterations$salt$hash".
+    """
+    iterations = iterations or PASSWORD_ITERATIONS
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), iterations)
+    return f"{_SCHEME}${iterations}${salt}${digest.hex()}"
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(_SCHEME + "$")
+
+def verify_password(password, stored):
+    """
+    Checks a password against a stored hash. Legacy plaintext entries are
+    still accepted so accounts keep working until they are migrated.
+    """
+    if not isinstance(password, str) or not isinstance(stored, str):
+        return False
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(digest.hex(), expected)
+
+def needs_rehash(stored):
+    """
+    True for plaintext entries and hashes made with a different work factor.
+    """
+    if not is_hashed(stored):
+        return True
+    try:
+        return int(stored.split("$")[1]) != PASSWORD_ITERATIONS
+    except (IndexError, ValueError):
+        return True